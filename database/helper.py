@@ -1,29 +1,98 @@
+import asyncio
+import functools
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+from typing import Callable, Optional, TypeVar
 
 import database.models
 import logger
+from database.maintenance import run_maintenance
+from database.migrations import (
+    m0001_generated_image_log_unique_month,
+    m0002_daily_message_count_upsert_index,
+    m0003_activity_indexes,
+    m0004_gifty_santa_assignment_pending_reveals,
+    m0005_user_reaction_indexes,
+    m0006_message_count_rollups,
+    m0007_message_metrics,
+    m0008_reaction_counts,
+    m0009_reaction_days,
+)
+from database.migrations.runner import run_migrations
 
 if logger.is_dev:
     pewee_logger = logging.getLogger('peewee')
     pewee_logger.addHandler(logging.StreamHandler())
     pewee_logger.setLevel(logging.DEBUG)
 
+T = TypeVar('T')
+
 
 class BaseDatabaseHelper:
-    def __init__(self, db_conn, models):
+    """
+    Owns a single worker thread per database file, the connection is opened on that thread and every query for the
+    database is run there so peewee never blocks the event loop.
+    Use `await helper.run(fn, ...)` for reads and single statements and `await helper.atomic(fn, ...)` when several
+    statements need to commit together, `fn` is a plain function that does the peewee work.
+    """
+
+    def __init__(self, db_conn, models, migrations: Optional[list[ModuleType]] = None):
         self.db_conn = db_conn
-        self.db_conn.connect()
+        self.models = models
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'db-{db_conn.database}')
+        self.executor.submit(self._connect, models, migrations or []).result()
+
+    def _connect(self, models, migrations: list[ModuleType]):
+        self.db_conn.connect(reuse_if_open=True)
         self.db_conn.create_tables(models)
-        self.db_conn.commit()
-        self.db_conn.close()
+        run_migrations(self.db_conn, migrations)
 
-    def replenish_db(self):
-        if not self.db_conn.is_connection_usable():
+    def _ensure_connected(self):
+        if self.db_conn.is_closed():
             self.db_conn.connect()
 
-    def release_db(self):
-        self.db_conn.commit()
-        self.db_conn.close()
+    def _run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        self._ensure_connected()
+        return fn(*args, **kwargs)
+
+    def _run_atomic(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        self._ensure_connected()
+        with self.db_conn.atomic():
+            return fn(*args, **kwargs)
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(self._run, fn, *args, **kwargs))
+
+    async def atomic(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(self._run_atomic, fn, *args, **kwargs))
+
+    def submit(self, fn: Callable[..., T], *args, **kwargs) -> asyncio.Future:
+        """
+        Queues `fn` on the database thread without waiting for it, for writes whose result nobody needs.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, functools.partial(self._run, fn, *args, **kwargs))
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.logger.error('Background database write failed, ' + str(future.exception()))
+
+    async def run_maintenance(self) -> list[tuple[str, float]]:
+        return await self.run(run_maintenance, self.db_conn)
+
+    def close(self):
+        def close_connection():
+            if not self.db_conn.is_closed():
+                self.db_conn.close()
+
+        self.executor.submit(close_connection).result()
+        self.executor.shutdown()
 
 
 gfd_database_helper = BaseDatabaseHelper(database.models.db, [
@@ -37,6 +106,10 @@ gfd_database_helper = BaseDatabaseHelper(database.models.db, [
     database.models.ActivityGamePlatform,
     database.models.Activity,
     database.models.GeneratedImageLog,
+], [
+    m0001_generated_image_log_unique_month,
+    m0003_activity_indexes,
+    m0004_gifty_santa_assignment_pending_reveals,
 ])
 
 gfd_links_database_helper = BaseDatabaseHelper(database.models.db_links_v2, [
@@ -45,8 +118,34 @@ gfd_links_database_helper = BaseDatabaseHelper(database.models.db_links_v2, [
 
 gfd_emojis_database_helper = BaseDatabaseHelper(database.models.db_emojis, [
     database.models.UserReaction,
+    database.models.EmojiReactionCount,
+    database.models.TargetEmojiReactionCount,
+    database.models.SourceEmojiReactionCount,
+    database.models.SourceTargetReactionCount,
+    database.models.DailyEmojiReactionCount,
+    database.models.MessageReactionCount,
+], [
+    m0005_user_reaction_indexes,
+    m0008_reaction_counts,
+    m0009_reaction_days,
 ])
 
 gfd_message_stats_database_helper = BaseDatabaseHelper(database.models.db_message_stats, [
     database.models.DailyMessageCount,
+    database.models.UserMessageCountRollup,
+    database.models.ChannelMessageCountRollup,
+    database.models.UserChannelMessageCountRollup,
+    database.models.UserMessageHeatmap,
+    database.models.ChannelMessageHeatmap,
+], [
+    m0002_daily_message_count_upsert_index,
+    m0006_message_count_rollups,
+    m0007_message_metrics,
 ])
+
+database_helpers = [
+    gfd_database_helper,
+    gfd_links_database_helper,
+    gfd_emojis_database_helper,
+    gfd_message_stats_database_helper,
+]
@@ -0,0 +1,60 @@
+import asyncio
+import os
+import traceback
+
+from peewee import SqliteDatabase
+
+from logger import logger
+
+database_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def _is_on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def _get_call_site() -> str:
+    frames = traceback.extract_stack()[:-2]
+    for frame in reversed(frames):
+        if frame.filename.endswith('peewee.py') or os.path.dirname(os.path.abspath(frame.filename)) == database_dir:
+            continue
+        return f'{frame.filename}:{frame.lineno} ({frame.name})'
+    frame = frames[-1]
+    return f'{frame.filename}:{frame.lineno} ({frame.name})'
+
+
+class LoopCheckedSqliteDatabase(SqliteDatabase):
+    """
+    Flags queries that run on the event loop thread, those block every other handler and the gateway heartbeat until
+    sqlite returns. Each call site is logged once and counted in `loop_call_sites`, the fix is to move the call into
+    the database helper's `run`/`atomic`.
+    Also counts statements that can write in `write_generation`, cached query results are dropped when it changes.
+    """
+
+    loop_call_sites: dict[str, int] = {}
+    # Reads, and transaction control which wraps writes without changing anything itself
+    non_write_statement_prefixes = (
+        'SELECT', 'PRAGMA', 'WITH', 'BEGIN', 'SAVEPOINT', 'RELEASE', 'COMMIT', 'ROLLBACK', 'END'
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.write_generation = 0
+
+    def bump_write_generation(self):
+        self.write_generation += 1
+
+    def execute_sql(self, sql, *args, **kwargs):
+        if not sql.lstrip()[:9].upper().startswith(self.non_write_statement_prefixes):
+            self.bump_write_generation()
+        if _is_on_event_loop():
+            call_site = _get_call_site()
+            if call_site not in self.loop_call_sites:
+                logger.warning(f'Sync DB call on the event loop from {call_site}: {sql[:120]}')
+                self.loop_call_sites[call_site] = 0
+            self.loop_call_sites[call_site] += 1
+        return super().execute_sql(sql, *args, **kwargs)
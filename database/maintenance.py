@@ -0,0 +1,26 @@
+import time
+
+from peewee import SqliteDatabase
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def run_maintenance(db_conn: SqliteDatabase) -> list[tuple[str, float]]:
+    """
+    Runs on the database thread, returns how long each statement took in milliseconds. Files created before
+    auto_vacuum was part of the pragmas get a one off VACUUM so incremental vacuum can work on them afterwards.
+    """
+    timings = []
+
+    def timed(sql: str):
+        start = time.perf_counter()
+        db_conn.execute_sql(sql).fetchall()
+        timings.append((sql, (time.perf_counter() - start) * 1000))
+
+    if db_conn.execute_sql('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        timed('PRAGMA auto_vacuum = INCREMENTAL')
+        timed('VACUUM')
+    timed('PRAGMA optimize')
+    timed('ANALYZE')
+    timed('PRAGMA incremental_vacuum')
+    return timings
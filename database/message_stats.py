@@ -0,0 +1,98 @@
+import datetime
+from typing import Optional
+
+from peewee import fn, Tuple
+
+from database.models import DailyMessageCount, MessageCountRollup
+
+
+class RangePlan:
+    """
+    A date range split into the coarsest pieces the rollups can answer: whole years, whole months and runs of days at
+    the edges that have to be summed from DailyMessageCount.
+    """
+
+    def __init__(self):
+        self.periods: list[tuple[int, int]] = []
+        self.days: list[tuple[datetime.date, datetime.date]] = []
+
+    def add_days(self, start: datetime.date, end: datetime.date):
+        if self.days and self.days[-1][1] + datetime.timedelta(days=1) == start:
+            self.days[-1] = (self.days[-1][0], end)
+            return
+        self.days.append((start, end))
+
+
+def get_last_day_of_month(date: datetime.date) -> datetime.date:
+    next_month = date.replace(day=28) + datetime.timedelta(days=4)
+    return next_month - datetime.timedelta(days=next_month.day)
+
+
+def plan_date_range(start: Optional[datetime.date], end: Optional[datetime.date]) -> RangePlan:
+    """
+    Both dates are inclusive, no start means all time and no end means up to today.
+    """
+    plan = RangePlan()
+    if start is None:
+        plan.periods.append((0, 0))
+        return plan
+    if end is None:
+        # Nothing is counted after today, running an open range to the end of the year lets `.messages-year` and
+        # `.messages-month` read a single rollup row
+        end = datetime.date(datetime.datetime.now(datetime.timezone.utc).year, 12, 31)
+    cursor = start
+    while cursor <= end:
+        if cursor.month == 1 and cursor.day == 1 and datetime.date(cursor.year, 12, 31) <= end:
+            plan.periods.append((cursor.year, 0))
+            cursor = datetime.date(cursor.year + 1, 1, 1)
+            continue
+        last_day_of_month = get_last_day_of_month(cursor)
+        if cursor.day == 1 and last_day_of_month <= end:
+            plan.periods.append((cursor.year, cursor.month))
+        else:
+            plan.add_days(cursor, min(last_day_of_month, end))
+        cursor = min(last_day_of_month, end) + datetime.timedelta(days=1)
+    return plan
+
+
+def get_message_totals(rollup_model: type[MessageCountRollup], start: Optional[datetime.date],
+                       end: Optional[datetime.date], user_ids: Optional[list[int]] = None,
+                       metric: str = 'message_count') -> dict[tuple, int]:
+    """
+    Totals of one of the `message_metric_fields` for a date range keyed by the rollup's key fields, e.g. (user_id,)
+    for UserMessageCountRollup.
+    """
+    plan = plan_date_range(start, end)
+    totals: dict[tuple, int] = {}
+    key_columns = [getattr(rollup_model, field) for field in rollup_model.key_fields]
+    daily_columns = {
+        'user_id': DailyMessageCount.user_id,
+        'channel_id': fn.COALESCE(DailyMessageCount.thread_id, DailyMessageCount.channel_id),
+    }
+    daily_key_columns = [daily_columns[field] for field in rollup_model.key_fields]
+    queries = []
+    if plan.periods:
+        query = (
+            rollup_model
+            .select(*key_columns, fn.SUM(getattr(rollup_model, metric)))
+            .where(Tuple(rollup_model.year, rollup_model.month).in_(plan.periods))
+            .group_by(*key_columns)
+        )
+        if user_ids is not None:
+            query = query.where(rollup_model.user_id.in_(user_ids))
+        queries.append(query)
+    for day_start, day_end in plan.days:
+        query = (
+            DailyMessageCount
+            .select(*daily_key_columns, fn.SUM(getattr(DailyMessageCount, metric)))
+            .where(DailyMessageCount.date.between(day_start, day_end))
+            .group_by(*daily_key_columns)
+        )
+        if user_ids is not None:
+            query = query.where(DailyMessageCount.user_id.in_(user_ids))
+        queries.append(query)
+    for query in queries:
+        for row in query.tuples():
+            totals[row[:-1]] = totals.get(row[:-1], 0) + row[-1]
+    # Days recorded before a metric existed sum to 0 for it
+    return {key: total for key, total in totals.items() if total}
@@ -0,0 +1,18 @@
+"""
+Unique (month, year) index so GeneratedImageLog.increment_count can upsert.
+"""
+from database.models import GeneratedImageLog, create_counter_index
+
+benchmark_queries = [
+    ('image count for month', 'SELECT count FROM generatedimagelog WHERE month = ? AND year = ?', (1, 2000)),
+]
+
+
+def apply(db_conn):
+    create_counter_index(
+        GeneratedImageLog,
+        'generatedimagelog_month_year_unique',
+        ['month', 'year'],
+        ['month', 'year'],
+        'count',
+    )
@@ -0,0 +1,24 @@
+"""
+channel_id or thread_id is always NULL and NULLs never collide in a plain unique index, the expression index is what
+DailyMessageCount.increment_message_counts upserts against.
+"""
+from database.models import DailyMessageCount, create_counter_index
+
+benchmark_queries = [
+    (
+        'count for user/channel/day',
+        'SELECT message_count FROM dailymessagecount '
+        'WHERE user_id = ? AND COALESCE(channel_id, 0) = ? AND COALESCE(thread_id, 0) = 0 AND date = ?',
+        (0, 0, '2000-01-01'),
+    ),
+]
+
+
+def apply(db_conn):
+    create_counter_index(
+        DailyMessageCount,
+        'dailymessagecount_upsert_unique',
+        ['user_id', 'COALESCE(channel_id, 0)', 'COALESCE(thread_id, 0)', 'date'],
+        ['user_id', 'channel_id', 'thread_id', 'date'],
+        'message_count',
+    )
@@ -0,0 +1,17 @@
+"""
+.reveal-gift picks from assignments that have a gift but haven't been revealed yet.
+"""
+benchmark_queries = [
+    (
+        'pending reveals',
+        'SELECT * FROM giftysantaassignment WHERE is_revealed = 0 AND gift_name IS NOT NULL',
+        (),
+    ),
+]
+
+
+def apply(db_conn):
+    db_conn.execute_sql(
+        'CREATE INDEX IF NOT EXISTS giftysantaassignment_pending_reveal '
+        'ON giftysantaassignment (is_revealed, gift_name)'
+    )
@@ -0,0 +1,43 @@
+"""
+Covering indexes for the .emojis leaderboards, per receiver, per giver and per emoji.
+"""
+benchmark_queries = [
+    (
+        'emojis received by user',
+        'SELECT emoji_id, emoji_str, SUM(CASE WHEN is_add THEN 1 ELSE -1 END) FROM userreaction '
+        'WHERE target_user_id = ? GROUP BY COALESCE(emoji_id, emoji_str)',
+        (0,),
+    ),
+    (
+        'emojis given by user',
+        'SELECT emoji_id, emoji_str, SUM(CASE WHEN is_add THEN 1 ELSE -1 END) FROM userreaction '
+        'WHERE source_user_id = ? GROUP BY COALESCE(emoji_id, emoji_str)',
+        (0,),
+    ),
+    (
+        'receivers',
+        'SELECT target_user_id, SUM(CASE WHEN is_add THEN 1 ELSE -1 END) FROM userreaction GROUP BY target_user_id',
+        (),
+    ),
+    (
+        'top emojis',
+        'SELECT emoji_id, emoji_str, SUM(CASE WHEN is_add THEN 1 ELSE -1 END) FROM userreaction '
+        'GROUP BY COALESCE(emoji_id, emoji_str)',
+        (),
+    ),
+]
+
+
+def apply(db_conn):
+    db_conn.execute_sql(
+        'CREATE INDEX IF NOT EXISTS userreaction_target_emoji '
+        'ON userreaction (target_user_id, emoji_id, emoji_str, is_add)'
+    )
+    db_conn.execute_sql(
+        'CREATE INDEX IF NOT EXISTS userreaction_source_emoji '
+        'ON userreaction (source_user_id, emoji_id, emoji_str, is_add)'
+    )
+    db_conn.execute_sql(
+        'CREATE INDEX IF NOT EXISTS userreaction_emoji '
+        'ON userreaction (COALESCE(emoji_id, emoji_str), emoji_id, emoji_str, is_add)'
+    )
@@ -0,0 +1,44 @@
+"""
+Fills the month, year and all-time rollups from the daily counts recorded before they existed, from then on
+DailyMessageCount.increment_message_counts keeps them up to date in the same transaction.
+"""
+
+benchmark_queries = [
+    (
+        'yearly leaderboard from daily rows',
+        'SELECT user_id, SUM(message_count) FROM dailymessagecount '
+        'WHERE date >= ? AND date <= ? GROUP BY user_id ORDER BY 2 DESC',
+        ('2000-01-01', '2000-12-31'),
+    ),
+    (
+        'yearly leaderboard from rollup',
+        'SELECT user_id, message_count FROM usermessagecountrollup WHERE year = ? AND month = 0',
+        (2000,),
+    ),
+]
+
+
+def backfill(db_conn, table: str, key_select: list[str], key_columns: list[str]):
+    keys = ', '.join(key_columns)
+    db_conn.execute_sql(f'DELETE FROM {table}')
+    db_conn.execute_sql(
+        f'INSERT INTO {table} ({keys}, year, month, message_count) '
+        f'SELECT {", ".join(key_select)}, CAST(strftime(\'%Y\', date) AS INTEGER), '
+        f'CAST(strftime(\'%m\', date) AS INTEGER), SUM(message_count) '
+        f'FROM dailymessagecount GROUP BY {", ".join(key_select)}, strftime(\'%Y-%m\', date)'
+    )
+    db_conn.execute_sql(
+        f'INSERT INTO {table} ({keys}, year, month, message_count) '
+        f'SELECT {keys}, year, 0, SUM(message_count) FROM {table} WHERE month > 0 GROUP BY {keys}, year'
+    )
+    db_conn.execute_sql(
+        f'INSERT INTO {table} ({keys}, year, month, message_count) '
+        f'SELECT {keys}, 0, 0, SUM(message_count) FROM {table} WHERE year > 0 AND month = 0 GROUP BY {keys}'
+    )
+
+
+def apply(db_conn):
+    channel = 'COALESCE(thread_id, channel_id)'
+    backfill(db_conn, 'usermessagecountrollup', ['user_id'], ['user_id'])
+    backfill(db_conn, 'channelmessagecountrollup', [channel], ['channel_id'])
+    backfill(db_conn, 'userchannelmessagecountrollup', ['user_id', channel], ['user_id', 'channel_id'])
@@ -0,0 +1,20 @@
+"""
+Adds the per-message metrics next to message_count, days and rollups from before this start at 0 for them.
+Fresh databases already get the columns from create_tables.
+"""
+from database.models import message_metric_fields
+
+tables = [
+    'dailymessagecount',
+    'usermessagecountrollup',
+    'channelmessagecountrollup',
+    'userchannelmessagecountrollup',
+]
+
+
+def apply(db_conn):
+    for table in tables:
+        existing_columns = {column.name for column in db_conn.get_columns(table)}
+        for field in message_metric_fields:
+            if field not in existing_columns:
+                db_conn.execute_sql(f'ALTER TABLE {table} ADD COLUMN {field} INTEGER NOT NULL DEFAULT 0')
@@ -0,0 +1,39 @@
+"""
+Fills the reaction aggregate tables from the reactions recorded before they existed, from then on
+ReactionCount.increment_counts keeps them up to date in the same flush as the raw rows.
+"""
+
+benchmark_queries = [
+    (
+        'top emojis from raw reactions',
+        'SELECT emoji_id, emoji_str, SUM(CASE WHEN is_add THEN 1 ELSE -1 END) AS count FROM userreaction '
+        'GROUP BY COALESCE(emoji_id, emoji_str) ORDER BY count DESC LIMIT 10',
+        (),
+    ),
+    (
+        'top emojis from aggregate',
+        'SELECT emoji_id, emoji_str, count FROM emojireactioncount ORDER BY count DESC LIMIT 10',
+        (),
+    ),
+]
+
+emoji_key = 'COALESCE(CAST(emoji_id AS TEXT), emoji_str)'
+net_count = 'SUM(CASE WHEN is_add THEN 1 ELSE -1 END)'
+
+
+def backfill(db_conn, table: str, key_columns: list[str], group_by: list[str]):
+    db_conn.execute_sql(f'DELETE FROM {table}')
+    select_columns = [emoji_key if column == 'emoji_key' else column for column in key_columns]
+    db_conn.execute_sql(
+        f'INSERT INTO {table} ({", ".join(key_columns)}, count) '
+        f'SELECT {", ".join(select_columns)}, {net_count} FROM userreaction GROUP BY {", ".join(group_by)}'
+    )
+
+
+def apply(db_conn):
+    emoji_columns = ['emoji_key', 'emoji_id', 'emoji_str']
+    backfill(db_conn, 'emojireactioncount', emoji_columns, [emoji_key])
+    backfill(db_conn, 'targetemojireactioncount', ['target_user_id'] + emoji_columns, ['target_user_id', emoji_key])
+    backfill(db_conn, 'sourceemojireactioncount', ['source_user_id'] + emoji_columns, ['source_user_id', emoji_key])
+    backfill(db_conn, 'sourcetargetreactioncount', ['source_user_id', 'target_user_id'],
+             ['source_user_id', 'target_user_id'])
@@ -0,0 +1,20 @@
+"""
+Adds the time and UTC day to reactions and puts every reaction recorded before that into the unknown day 0 of
+DailyEmojiReactionCount, so the per emoji daily counts still add up to the all-time counts.
+"""
+
+emoji_key = 'COALESCE(CAST(emoji_id AS TEXT), emoji_str)'
+
+
+def apply(db_conn):
+    existing_columns = {column.name for column in db_conn.get_columns('userreaction')}
+    if 'created_at' not in existing_columns:
+        db_conn.execute_sql('ALTER TABLE userreaction ADD COLUMN created_at INTEGER NULL')
+    if 'day' not in existing_columns:
+        db_conn.execute_sql('ALTER TABLE userreaction ADD COLUMN day INTEGER NOT NULL DEFAULT 0')
+    db_conn.execute_sql('DELETE FROM dailyemojireactioncount WHERE day = 0')
+    db_conn.execute_sql(
+        f'INSERT INTO dailyemojireactioncount (day, emoji_key, emoji_id, emoji_str, count) '
+        f'SELECT 0, {emoji_key}, emoji_id, emoji_str, SUM(CASE WHEN is_add THEN 1 ELSE -1 END) '
+        f'FROM userreaction WHERE day = 0 GROUP BY {emoji_key}'
+    )
@@ -0,0 +1,72 @@
+import json
+import time
+from types import ModuleType
+
+from peewee import SqliteDatabase
+
+from logger import logger
+
+BENCHMARK_RUNS = 3
+
+
+def ensure_migration_table(db_conn: SqliteDatabase):
+    db_conn.execute_sql(
+        'CREATE TABLE IF NOT EXISTS schema_migration ('
+        'name TEXT NOT NULL PRIMARY KEY, '
+        'applied_at INTEGER NOT NULL, '
+        'duration_ms REAL NOT NULL, '
+        'query_timings TEXT NULL'
+        ')'
+    )
+
+
+def get_applied_migrations(db_conn: SqliteDatabase) -> set[str]:
+    return set(row[0] for row in db_conn.execute_sql('SELECT name FROM schema_migration').fetchall())
+
+
+def get_migration_name(migration: ModuleType) -> str:
+    return migration.__name__.rsplit('.', 1)[-1]
+
+
+def time_queries(db_conn: SqliteDatabase, migration: ModuleType) -> dict[str, float]:
+    timings = {}
+    for query_name, sql, params in getattr(migration, 'benchmark_queries', []):
+        best_ms = None
+        for _ in range(BENCHMARK_RUNS):
+            start = time.perf_counter()
+            db_conn.execute_sql(sql, params).fetchall()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            best_ms = elapsed_ms if best_ms is None else min(best_ms, elapsed_ms)
+        timings[query_name] = best_ms
+    return timings
+
+
+def run_migrations(db_conn: SqliteDatabase, migrations: list[ModuleType]):
+    """
+    Applies the migrations that haven't run against this database yet, in list order and each in its own transaction.
+    The queries a migration lists in `benchmark_queries` are timed before and after it is applied, the timings are
+    logged and stored next to the migration name in schema_migration.
+    """
+    ensure_migration_table(db_conn)
+    applied = get_applied_migrations(db_conn)
+    for migration in migrations:
+        name = get_migration_name(migration)
+        if name in applied:
+            continue
+        before = time_queries(db_conn, migration)
+        start = time.perf_counter()
+        with db_conn.atomic():
+            migration.apply(db_conn)
+            duration_ms = (time.perf_counter() - start) * 1000
+            after = time_queries(db_conn, migration)
+            query_timings = {
+                query_name: {'before_ms': round(before[query_name], 3), 'after_ms': round(after[query_name], 3)}
+                for query_name in before
+            }
+            db_conn.execute_sql(
+                'INSERT INTO schema_migration (name, applied_at, duration_ms, query_timings) VALUES (?, ?, ?, ?)',
+                (name, int(time.time()), duration_ms, json.dumps(query_timings)),
+            )
+        logger.info(f'Applied migration {name} to {db_conn.database} in {duration_ms:.0f}ms')
+        for query_name, timings in query_timings.items():
+            logger.info(f'  {query_name}: {timings["before_ms"]:.2f}ms -> {timings["after_ms"]:.2f}ms')
@@ -1,13 +1,18 @@
 import datetime
+import struct
+from typing import Optional
 from urllib.parse import urlparse
 
 from peewee import *
 
-db = SqliteDatabase('gfd.db')
-db_links = SqliteDatabase('gfd_links.db')
-db_links_v2 = SqliteDatabase('gfd_links_v2.db')
-db_emojis = SqliteDatabase('gfd_emojis.db')
-db_message_stats = SqliteDatabase('gfd_message_stats.db')
+from database.loop_check import LoopCheckedSqliteDatabase
+from database.pragmas import get_pragmas
+
+db = LoopCheckedSqliteDatabase('gfd.db', pragmas=get_pragmas('gfd.db'))
+db_links = LoopCheckedSqliteDatabase('gfd_links.db', pragmas=get_pragmas('gfd_links.db'))
+db_links_v2 = LoopCheckedSqliteDatabase('gfd_links_v2.db', pragmas=get_pragmas('gfd_links_v2.db'))
+db_emojis = LoopCheckedSqliteDatabase('gfd_emojis.db', pragmas=get_pragmas('gfd_emojis.db'))
+db_message_stats = LoopCheckedSqliteDatabase('gfd_message_stats.db', pragmas=get_pragmas('gfd_message_stats.db'))
 
 
 class BaseModel(Model):
@@ -15,6 +20,34 @@ class BaseModel(Model):
         database = db
 
 
+def merge_duplicate_counter_rows(model, key_columns: list[str], count_column: str):
+    """
+    Folds rows that share the same key into the row with the lowest id, needed once before a unique index can be
+    created on a table that was previously filled with get_or_create.
+    """
+    table = model._meta.table_name
+    keys = ', '.join(key_columns)
+    key_matches = ' AND '.join(f'd.{column} IS {table}.{column}' for column in key_columns)
+    model._meta.database.execute_sql(
+        f'UPDATE {table} SET {count_column} = (SELECT SUM(d.{count_column}) FROM {table} d WHERE {key_matches}) '
+        f'WHERE id IN (SELECT MIN(id) FROM {table} GROUP BY {keys} HAVING COUNT(*) > 1)'
+    )
+    model._meta.database.execute_sql(
+        f'DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {keys})'
+    )
+
+
+def create_counter_index(model, index_name: str, key_expressions: list[str], key_columns: list[str],
+                         count_column: str):
+    database = model._meta.database
+    table = model._meta.table_name
+    if index_name in [index.name for index in database.get_indexes(table)]:
+        return
+    with database.atomic():
+        merge_duplicate_counter_rows(model, key_columns, count_column)
+        database.execute_sql(f'CREATE UNIQUE INDEX {index_name} ON {table} ({", ".join(key_expressions)})')
+
+
 class AnnouncedYoutubeVideo(BaseModel):
     video_id = CharField(null=False, unique=True, primary_key=True)
 
@@ -56,17 +89,36 @@ class User(BaseModel):
     def has_repented_for_shooting_ducks(self):
         return self.ducks_killed <= self.ducks_befriended
 
+    @staticmethod
+    def increment_counters(field: Field, increments: dict[int, int]):
+        """
+        Adds to a counter column for many users in one upsert, users that don't have a row yet get one with an empty
+        username which get_by_author fills in the next time they show up.
+        """
+        if not increments:
+            return
+        rows = [{User.user_id: user_id, User.username: '', field: count} for user_id, count in increments.items()]
+        for batch in chunked(rows, 100):
+            User.insert_many(batch).on_conflict(
+                conflict_target=[User.user_id],
+                update={field: field + EXCLUDED[field.column_name]},
+            ).execute()
+
+    def increment_counter(self, field: Field, count=1):
+        User.increment_counters(field, {self.user_id: count})
+        setattr(self, field.name, getattr(self, field.name) + count)
+
     def add_duck_friend(self):
-        self.ducks_befriended += 1
-        self.save()
+        self.increment_counter(User.ducks_befriended)
 
     def add_duck_kill(self):
-        self.ducks_killed += 1
-        self.save()
+        self.increment_counter(User.ducks_killed)
 
     def add_duck_shoo(self):
-        self.ducks_shooed += 1
-        self.save()
+        self.increment_counter(User.ducks_shooed)
+
+    def add_monster_guessed(self):
+        self.increment_counter(User.monsters_guessed)
 
     def set_timezone(self, timezone):
         self.timezone = timezone
@@ -129,6 +181,23 @@ class PostedLinkV2(Model):
     def increment_hits(self):
         self.hits += 1
 
+    @staticmethod
+    def increment_hits_by_key(hits: dict[tuple[str, str], int]):
+        """
+        Adds hits to links already split by parse_link in a single upsert, creating the rows that don't exist yet.
+        """
+        if not hits:
+            return
+        rows = [
+            {PostedLinkV2.link_minus_qp: link_minus_qp, PostedLinkV2.qp: qp, PostedLinkV2.hits: count}
+            for (link_minus_qp, qp), count in hits.items()
+        ]
+        for batch in chunked(rows, 100):
+            PostedLinkV2.insert_many(batch).on_conflict(
+                conflict_target=[PostedLinkV2.link_minus_qp, PostedLinkV2.qp],
+                update={PostedLinkV2.hits: PostedLinkV2.hits + EXCLUDED.hits},
+            ).execute()
+
     @staticmethod
     def get_hits_times_text(hits):
         times = 'times' if hits > 1 else 'time'
@@ -189,6 +258,200 @@ class UserReaction(Model):
     emoji_id = BigIntegerField(null=True, default=None)
     emoji_str = TextField(null=True, default=None)
     is_add = BooleanField(default=True, null=False)
+    created_at = TimestampField(null=True, default=None)
+    # UTC day ordinal, 0 for reactions recorded before the day was tracked
+    day = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
+
+
+class ReactionCount(Model):
+    """
+    Net reaction counts (adds minus removes) kept in step with UserReaction in the same flush, so the .emojis
+    leaderboards read a few rows instead of summing every reaction ever recorded.
+    emoji_key is the custom emoji id as text or the unicode emoji, it identifies the emoji in the unique indexes
+    where the nullable emoji_id/emoji_str pair can't.
+    """
+    count = IntegerField(default=0)
+
+    class Meta:
+        database = db_emojis
+
+    key_fields: tuple = ()
+
+    @staticmethod
+    def get_emoji_key(emoji_id: Optional[int], emoji_str: Optional[str]) -> str:
+        return str(emoji_id) if emoji_id else emoji_str
+
+    @staticmethod
+    def increment_counts(reactions: list[tuple[int, int, int, Optional[int], Optional[str], int]]):
+        """
+        Takes (day ordinal, source user id, target user id, emoji id, emoji str, net count) tuples and upserts them
+        into every aggregate table.
+        """
+        totals = {model: {} for model in reaction_count_models}
+        for day, source_user_id, target_user_id, emoji_id, emoji_str, count in reactions:
+            fields = {
+                'day': day,
+                'source_user_id': source_user_id,
+                'target_user_id': target_user_id,
+                'emoji_key': ReactionCount.get_emoji_key(emoji_id, emoji_str),
+                'emoji_id': emoji_id,
+                'emoji_str': emoji_str,
+            }
+            for model, model_totals in totals.items():
+                key = tuple(fields[field] for field in model.key_fields)
+                model_totals[key] = model_totals.get(key, 0) + count
+        for model, model_totals in totals.items():
+            columns = list(model.key_fields) + ['count']
+            conflict_target = [field for field in model.key_fields if field not in ('emoji_id', 'emoji_str')]
+            db_emojis.cursor().executemany(
+                f'INSERT INTO {model._meta.table_name} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))}) '
+                f'ON CONFLICT ({", ".join(conflict_target)}) DO UPDATE SET count = count + excluded.count',
+                [key + (count,) for key, count in model_totals.items() if count]
+            )
+
+
+class EmojiReactionCount(ReactionCount):
+    emoji_key = TextField(null=False)
+    emoji_id = BigIntegerField(null=True, default=None)
+    emoji_str = TextField(null=True, default=None)
+
+    key_fields = ('emoji_key', 'emoji_id', 'emoji_str')
+
+    class Meta:
+        indexes = (
+            (('emoji_key',), True),
+        )
+
+
+class TargetEmojiReactionCount(ReactionCount):
+    target_user_id = BigIntegerField(null=False)
+    emoji_key = TextField(null=False)
+    emoji_id = BigIntegerField(null=True, default=None)
+    emoji_str = TextField(null=True, default=None)
+
+    key_fields = ('target_user_id', 'emoji_key', 'emoji_id', 'emoji_str')
+
+    class Meta:
+        indexes = (
+            (('target_user_id', 'emoji_key'), True),
+        )
+
+
+class SourceEmojiReactionCount(ReactionCount):
+    source_user_id = BigIntegerField(null=False)
+    emoji_key = TextField(null=False)
+    emoji_id = BigIntegerField(null=True, default=None)
+    emoji_str = TextField(null=True, default=None)
+
+    key_fields = ('source_user_id', 'emoji_key', 'emoji_id', 'emoji_str')
+
+    class Meta:
+        indexes = (
+            (('source_user_id', 'emoji_key'), True),
+        )
+
+
+class SourceTargetReactionCount(ReactionCount):
+    source_user_id = BigIntegerField(null=False)
+    target_user_id = BigIntegerField(null=False)
+
+    key_fields = ('source_user_id', 'target_user_id')
+
+    class Meta:
+        indexes = (
+            (('source_user_id', 'target_user_id'), True),
+        )
+
+
+class DailyEmojiReactionCount(ReactionCount):
+    """
+    Per emoji counts for each UTC day, reactions from before days were tracked are all in day 0.
+    """
+    day = IntegerField(null=False)
+    emoji_key = TextField(null=False)
+    emoji_id = BigIntegerField(null=True, default=None)
+    emoji_str = TextField(null=True, default=None)
+
+    key_fields = ('day', 'emoji_key', 'emoji_id', 'emoji_str')
+
+    class Meta:
+        indexes = (
+            (('day', 'emoji_key'), True),
+        )
+
+
+class MessageReactionCount(Model):
+    """
+    Net reactions per message, kept in the same flush as the raw reactions. day is the UTC day the message was posted,
+    read from its snowflake id.
+    """
+    message_id = BigIntegerField(primary_key=True)
+    channel_id = BigIntegerField(null=True, default=None)
+    target_user_id = BigIntegerField(null=False)
+    day = IntegerField(null=False)
+    count = IntegerField(default=0)
+
+    class Meta:
+        database = db_emojis
+        indexes = (
+            (('day', 'count'), False),
+        )
+
+    discord_epoch_ms = 1420070400000
+
+    @staticmethod
+    def get_posted_day(message_id: int) -> int:
+        posted_at = ((message_id >> 22) + MessageReactionCount.discord_epoch_ms) / 1000
+        return datetime.datetime.fromtimestamp(posted_at, datetime.timezone.utc).toordinal()
+
+    @staticmethod
+    def increment_counts(counts: dict[int, tuple[Optional[int], int, int]]) -> list[tuple]:
+        """
+        Takes (channel id, target user id, net count) keyed by message id and returns the updated (message id,
+        channel id, target user id, day, count) rows.
+        """
+        db_emojis.cursor().executemany(
+            'INSERT INTO messagereactioncount (message_id, channel_id, target_user_id, day, count) '
+            'VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (message_id) DO UPDATE SET count = count + excluded.count, '
+            'channel_id = COALESCE(channel_id, excluded.channel_id)',
+            [
+                (message_id, channel_id, target_user_id, MessageReactionCount.get_posted_day(message_id), count)
+                for message_id, (channel_id, target_user_id, count) in counts.items()
+            ]
+        )
+        rows = []
+        for message_ids in chunked(list(counts), 500):
+            rows.extend(MessageReactionCount.select(
+                MessageReactionCount.message_id,
+                MessageReactionCount.channel_id,
+                MessageReactionCount.target_user_id,
+                MessageReactionCount.day,
+                MessageReactionCount.count,
+            ).where(MessageReactionCount.message_id.in_(message_ids)).tuples())
+        return rows
+
+    @staticmethod
+    def get_top(start_day: int, limit: int) -> list[tuple]:
+        return list(
+            MessageReactionCount.select(
+                MessageReactionCount.message_id,
+                MessageReactionCount.channel_id,
+                MessageReactionCount.target_user_id,
+                MessageReactionCount.day,
+                MessageReactionCount.count,
+            )
+            .where((MessageReactionCount.day >= start_day) & (MessageReactionCount.count > 0))
+            .order_by(MessageReactionCount.count.desc())
+            .limit(limit)
+            .tuples()
+        )
+
+
+reaction_count_models = (
+    EmojiReactionCount, TargetEmojiReactionCount, SourceEmojiReactionCount, SourceTargetReactionCount,
+    DailyEmojiReactionCount,
+)
 
 
 class GiftySanta(Model):
@@ -237,6 +500,37 @@ class Activity(BaseModel):
     def get_latest_by_user_id(user_id):
         return Activity.select().where(Activity.user_id == user_id).order_by(Activity.id.desc()).first()
 
+    @staticmethod
+    def create_activity(user_id: int, game_name: str, platform: Optional[str], start_time: float,
+                        end_time: Optional[float] = None) -> 'Activity':
+        activity_game, created = ActivityGame.get_or_create(name=game_name)
+        activity_game_platform = None
+        if platform is not None:
+            activity_game_platform, created = ActivityGamePlatform.get_or_create(name=platform)
+        return Activity.create(
+            user_id=user_id,
+            activity_game_id=activity_game.id,
+            activity_game_platform_id=None if activity_game_platform is None else activity_game_platform.id,
+            start_time=start_time,
+            end_time=end_time,
+        )
+
+    @staticmethod
+    def close_latest(user_id: int, game_name: str, platform: Optional[str], start_time: float, end_time: float):
+        """
+        Ends the user's open activity for the game, without one a shadow activity from `start_time` is recorded.
+        """
+        latest_activity: Activity = Activity.get_latest_by_user_id(user_id)
+        if (
+                latest_activity is None
+                or latest_activity.activity_game.name != game_name
+                or latest_activity.end_time is not None
+        ):
+            Activity.create_activity(user_id, game_name, platform, start_time, end_time)
+            return
+        latest_activity.end_time = end_time
+        latest_activity.save()
+
 
 class GeneratedImageLog(BaseModel):
     id = BigAutoField(primary_key=True)
@@ -247,12 +541,10 @@ class GeneratedImageLog(BaseModel):
     @staticmethod
     def increment_count(count=1):
         current_date = datetime.date.today()
-        month = current_date.month
-        year = current_date.year
-
-        log, created = GeneratedImageLog.get_or_create(month=month, year=year, defaults={"count": 0})
-        log.count += count
-        log.save()
+        GeneratedImageLog.insert(month=current_date.month, year=current_date.year, count=count).on_conflict(
+            conflict_target=[GeneratedImageLog.month, GeneratedImageLog.year],
+            update={GeneratedImageLog.count: GeneratedImageLog.count + EXCLUDED.count},
+        ).execute()
 
     @staticmethod
     def get_count():
@@ -263,12 +555,41 @@ class GeneratedImageLog(BaseModel):
         return log.count
 
 
+# Collected for every message and written together, in this order wherever they are packed into a list
+message_metric_fields = (
+    'message_count', 'char_count', 'image_count', 'video_count', 'link_count', 'reply_count', 'mention_count',
+)
+
+
+def add_message_metrics(totals: dict, key, metrics):
+    current = totals.get(key)
+    if current is None:
+        totals[key] = list(metrics)
+        return
+    for index, value in enumerate(metrics):
+        current[index] += value
+
+
+def get_metrics_upsert_sql(table_name: str, key_columns: list[str], conflict_target: list[str]) -> str:
+    columns = ', '.join(key_columns + list(message_metric_fields))
+    placeholders = ', '.join('?' * (len(key_columns) + len(message_metric_fields)))
+    updates = ', '.join(f'{field} = {field} + excluded.{field}' for field in message_metric_fields)
+    return (f'INSERT INTO {table_name} ({columns}) VALUES ({placeholders}) '
+            f'ON CONFLICT ({", ".join(conflict_target)}) DO UPDATE SET {updates}')
+
+
 class DailyMessageCount(BaseModel):
     user_id = BigIntegerField(null=False, index=True)
     date = DateField(null=False)
     channel_id = BigIntegerField(null=True, default=None)
     thread_id = BigIntegerField(null=True, default=None)
     message_count = IntegerField(default=0)
+    char_count = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
+    image_count = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
+    video_count = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
+    link_count = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
+    reply_count = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
+    mention_count = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
 
     class Meta:
         database = db_message_stats
@@ -278,18 +599,46 @@ class DailyMessageCount(BaseModel):
 
     @staticmethod
     def increment_message_count(user_id, channel_id=None, thread_id=None, date=None, increment_count=1):
-        if not date:
-            date = datetime.date.today()
-        if channel_id is None and thread_id is None:
-            raise ValueError('Either channel_id or thread_id must be specified')
-        row, created = DailyMessageCount.get_or_create(
-            user_id=user_id,
-            date=date,
-            channel_id=channel_id,
-            thread_id=thread_id
-        )
-        row.message_count += increment_count
-        row.save()
+        DailyMessageCount.increment_message_counts([
+            (user_id, channel_id, thread_id, date, increment_count),
+        ])
+
+    @staticmethod
+    def increment_message_counts(increments: list[tuple]):
+        """
+        Takes (user_id, channel_id, thread_id, date, count) tuples and applies them all in one upsert.
+        """
+        counts = {}
+        for user_id, channel_id, thread_id, date, count in increments:
+            if channel_id is None and thread_id is None:
+                raise ValueError('Either channel_id or thread_id must be specified')
+            day = (date or datetime.date.today()).toordinal()
+            metrics = [count] + [0] * (len(message_metric_fields) - 1)
+            add_message_metrics(counts, (day, thread_id or channel_id, thread_id is not None, user_id), metrics)
+        DailyMessageCount.increment_packed_counts(counts)
+
+    @staticmethod
+    def increment_packed_counts(counts: dict[tuple[int, int, bool, int], list[int]]):
+        """
+        Takes metrics (in `message_metric_fields` order) keyed by (day ordinal, channel or thread id, is thread,
+        user id), the key the message statistics tracker buffers under, and upserts them with one executemany plus
+        one per rollup table.
+        """
+        rows = []
+        for (day, channel_id, is_thread, user_id), metrics in counts.items():
+            rows.append((
+                user_id,
+                None if is_thread else channel_id,
+                channel_id if is_thread else None,
+                datetime.date.fromordinal(day).isoformat(),
+                *metrics,
+            ))
+        db_message_stats.cursor().executemany(get_metrics_upsert_sql(
+            'dailymessagecount',
+            ['user_id', 'channel_id', 'thread_id', 'date'],
+            ['user_id', 'COALESCE(channel_id, 0)', 'COALESCE(thread_id, 0)', 'date'],
+        ), rows)
+        MessageCountRollup.increment_rollups(counts)
 
     @staticmethod
     def get_message_count(user_id, date=None, channel_id=None, thread_id=None):
@@ -311,3 +660,164 @@ class DailyMessageCount(BaseModel):
                  .order_by(SQL('total_messages').desc()))  # Order by total messages descending
 
         return list(query)
+
+
+class MessageCountRollup(BaseModel):
+    """
+    Message counts summed per calendar month (month 1-12), per year (month 0) and for all time (year 0, month 0), kept
+    in step with DailyMessageCount so long ranges read a handful of rows instead of every day in them. The period leads
+    each unique index so a leaderboard for one period is a single index range.
+    channel_id is the thread id for messages in threads, like `thread_id or channel_id` on the daily rows.
+    """
+    year = IntegerField(null=False)
+    month = IntegerField(null=False)
+    message_count = IntegerField(default=0)
+    char_count = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
+    image_count = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
+    video_count = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
+    link_count = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
+    reply_count = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
+    mention_count = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
+
+    class Meta:
+        database = db_message_stats
+
+    key_fields: tuple = ()
+
+    @staticmethod
+    def increment_rollups(counts: dict[tuple[int, int, bool, int], list[int]]):
+        """
+        Takes the packed (day ordinal, channel or thread id, is thread, user id) metrics from DailyMessageCount and
+        upserts them into every rollup table.
+        """
+        month_by_day = {day: datetime.date.fromordinal(day).timetuple()[:2] for day in {key[0] for key in counts}}
+        # Summed per user/channel first, the user and channel rollups are then derived from the far smaller result
+        user_channel_totals = {}
+        for (day, channel_id, is_thread, user_id), metrics in counts.items():
+            year, month = month_by_day[day]
+            add_message_metrics(user_channel_totals, (user_id, channel_id, year, month), metrics)
+            add_message_metrics(user_channel_totals, (user_id, channel_id, year, 0), metrics)
+            add_message_metrics(user_channel_totals, (user_id, channel_id, 0, 0), metrics)
+        user_totals = {}
+        channel_totals = {}
+        for (user_id, channel_id, year, month), metrics in user_channel_totals.items():
+            add_message_metrics(user_totals, (user_id, year, month), metrics)
+            add_message_metrics(channel_totals, (channel_id, year, month), metrics)
+        for model, totals in (
+                (UserMessageCountRollup, user_totals),
+                (ChannelMessageCountRollup, channel_totals),
+                (UserChannelMessageCountRollup, user_channel_totals),
+        ):
+            key_columns = list(model.key_fields) + ['year', 'month']
+            db_message_stats.cursor().executemany(
+                get_metrics_upsert_sql(model._meta.table_name, key_columns, key_columns),
+                [key + tuple(metrics) for key, metrics in totals.items()]
+            )
+
+
+class UserMessageCountRollup(MessageCountRollup):
+    user_id = BigIntegerField(null=False)
+
+    key_fields = ('user_id',)
+
+    class Meta:
+        indexes = (
+            (('year', 'month', 'user_id'), True),
+        )
+
+
+class ChannelMessageCountRollup(MessageCountRollup):
+    channel_id = BigIntegerField(null=False)
+
+    key_fields = ('channel_id',)
+
+    class Meta:
+        indexes = (
+            (('year', 'month', 'channel_id'), True),
+        )
+
+
+class UserChannelMessageCountRollup(MessageCountRollup):
+    user_id = BigIntegerField(null=False)
+    channel_id = BigIntegerField(null=False)
+
+    key_fields = ('user_id', 'channel_id')
+
+    class Meta:
+        indexes = (
+            (('year', 'month', 'user_id', 'channel_id'), True),
+        )
+
+
+class MessageHeatmap(BaseModel):
+    """
+    Message counts per hour of the week (UTC, Monday 00:00 first) packed into one BLOB of `heatmap_slots` unsigned
+    32-bit little-endian integers, so a key costs one row however long it has been tracked.
+    channel_id is the thread id for messages in threads, like on the rollups.
+    """
+    counts = BlobField(null=False)
+
+    class Meta:
+        database = db_message_stats
+
+    key_field: str = ''
+    heatmap_slots = 7 * 24
+    heatmap_struct = struct.Struct(f'<{heatmap_slots}I')
+
+    @staticmethod
+    def get_slot(created_at: datetime.datetime) -> int:
+        return created_at.weekday() * 24 + created_at.hour
+
+    @staticmethod
+    def increment_heatmaps(counts: dict[tuple[int, int, int], int]):
+        """
+        Takes counts keyed by (channel or thread id, user id, slot) and adds them to the user and channel heatmaps.
+        """
+        user_heatmaps = {}
+        channel_heatmaps = {}
+        for (channel_id, user_id, slot), count in counts.items():
+            user_heatmaps.setdefault(user_id, [0] * MessageHeatmap.heatmap_slots)[slot] += count
+            channel_heatmaps.setdefault(channel_id, [0] * MessageHeatmap.heatmap_slots)[slot] += count
+        UserMessageHeatmap.add_heatmaps(user_heatmaps)
+        ChannelMessageHeatmap.add_heatmaps(channel_heatmaps)
+
+    @classmethod
+    def add_heatmaps(cls, heatmaps: dict[int, list[int]]):
+        key_column = getattr(cls, cls.key_field)
+        for keys in chunked(list(heatmaps), 500):
+            for key, blob in cls.select(key_column, cls.counts).where(key_column.in_(keys)).tuples():
+                for slot, count in enumerate(cls.heatmap_struct.unpack(blob)):
+                    heatmaps[key][slot] += count
+        table_name = cls._meta.table_name
+        db_message_stats.cursor().executemany(
+            f'INSERT INTO {table_name} ({cls.key_field}, counts) VALUES (?, ?) '
+            f'ON CONFLICT ({cls.key_field}) DO UPDATE SET counts = excluded.counts',
+            [(key, cls.heatmap_struct.pack(*heatmap)) for key, heatmap in heatmaps.items()]
+        )
+
+    @classmethod
+    def get_heatmap(cls, key: Optional[int] = None) -> list[int]:
+        """
+        The heatmap for one key, or summed over every key when none is given.
+        """
+        key_column = getattr(cls, cls.key_field)
+        query = cls.select(cls.counts)
+        if key is not None:
+            query = query.where(key_column == key)
+        heatmap = [0] * cls.heatmap_slots
+        for blob, in query.tuples():
+            for slot, count in enumerate(cls.heatmap_struct.unpack(blob)):
+                heatmap[slot] += count
+        return heatmap
+
+
+class UserMessageHeatmap(MessageHeatmap):
+    user_id = BigIntegerField(primary_key=True)
+
+    key_field = 'user_id'
+
+
+class ChannelMessageHeatmap(MessageHeatmap):
+    channel_id = BigIntegerField(primary_key=True)
+
+    key_field = 'channel_id'
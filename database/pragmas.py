@@ -0,0 +1,62 @@
+import os
+
+from dotenv import dotenv_values
+
+config = dotenv_values('.env') if os.path.exists('.env') else {}
+
+# Applied in order every time a connection is opened, WAL lets readers carry on while a flush is writing and NORMAL
+# sync is safe with WAL (a power cut can lose the last commits but never corrupts the file). auto_vacuum has to come
+# before journal_mode or it is ignored for new files, existing files are converted by the maintenance job
+default_pragmas = {
+    'auto_vacuum': 'incremental',
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -16000,
+    'mmap_size': 64 * 1024 * 1024,
+    'temp_store': 'memory',
+}
+
+pragma_profiles = {
+    'default': default_pragmas,
+    'write_heavy': {
+        **default_pragmas,
+        'cache_size': -32000,
+        'mmap_size': 256 * 1024 * 1024,
+        'wal_autocheckpoint': 4000,
+    },
+}
+
+database_profiles = {
+    'gfd_emojis.db': 'write_heavy',
+    'gfd_message_stats.db': 'write_heavy',
+}
+
+
+def get_config_key(database_file: str) -> str:
+    return os.path.splitext(os.path.basename(database_file))[0].upper()
+
+
+def parse_pragmas(value: str) -> dict:
+    pragmas = {}
+    for pragma in value.split(','):
+        if not pragma.strip():
+            continue
+        name, pragma_value = pragma.split('=', 1)
+        pragma_value = pragma_value.strip()
+        pragmas[name.strip()] = int(pragma_value) if pragma_value.lstrip('-').isdigit() else pragma_value
+    return pragmas
+
+
+def get_pragmas(database_file: str) -> dict:
+    """
+    Picks the profile for a database file and layers config overrides on top, e.g. for gfd_emojis.db:
+    SQLITE_PROFILE_GFD_EMOJIS=default, SQLITE_PRAGMAS=cache_size=-8000 and SQLITE_PRAGMAS_GFD_EMOJIS=mmap_size=0
+    """
+    config_key = get_config_key(database_file)
+    profile_name = config.get(f'SQLITE_PROFILE_{config_key}') or database_profiles.get(database_file, 'default')
+    if profile_name not in pragma_profiles:
+        raise Exception(f'Unknown SQLite pragma profile {profile_name} for {database_file}')
+    pragmas = dict(pragma_profiles[profile_name])
+    pragmas.update(parse_pragmas(config.get('SQLITE_PRAGMAS') or ''))
+    pragmas.update(parse_pragmas(config.get(f'SQLITE_PRAGMAS_{config_key}') or ''))
+    return pragmas
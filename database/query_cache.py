@@ -0,0 +1,77 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from database.helper import BaseDatabaseHelper
+
+
+class QueryCacheEntry:
+    def __init__(self, value: Any, write_generation: int, expires_at: float):
+        self.value = value
+        self.write_generation = write_generation
+        self.expires_at = expires_at
+
+
+class QueryCache:
+    """
+    Keeps the results of leaderboard queries keyed on (query kind, normalized args). An entry is served until it
+    expires or anything writes to its database, the database's write generation is bumped by every write statement
+    and by every write-behind flush. Concurrent misses for the same key share one query.
+    Cached values are shared between callers and must not be modified.
+    """
+
+    def __init__(self, max_entries: int = 256, default_ttl: float = 300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.entries: OrderedDict[Hashable, QueryCacheEntry] = OrderedDict()
+        self.in_flight: dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def run(self, helper: BaseDatabaseHelper, key: Hashable, fn: Callable, *args, ttl: float = None) -> Any:
+        entry = self.entries.get(key)
+        if (
+                entry is not None
+                and entry.write_generation == helper.db_conn.write_generation
+                and entry.expires_at > time.monotonic()
+        ):
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            # Read before the query is queued, a write that lands while it runs leaves the entry already stale
+            write_generation = helper.db_conn.write_generation
+            task = asyncio.get_running_loop().create_task(self.load(helper, key, write_generation, fn, args, ttl))
+            self.in_flight[key] = task
+            # Retrieved here so a failure nobody waits for anymore isn't logged as unobserved
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        # Shielded so a caller that gets cancelled doesn't cancel the query for everyone else waiting on it
+        return await asyncio.shield(task)
+
+    async def load(self, helper: BaseDatabaseHelper, key: Hashable, write_generation: int, fn: Callable, args: tuple,
+                   ttl: float = None) -> Any:
+        try:
+            value = await helper.run(fn, *args)
+        finally:
+            del self.in_flight[key]
+        self.entries[key] = QueryCacheEntry(
+            value, write_generation, time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+        )
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return value
+
+    def get_summary_lines(self) -> list[str]:
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return []
+        return [f'Query cache: {self.hits:,}/{lookups:,} hits ({self.hits / lookups:.0%}), {len(self.entries)} entries']
+
+
+query_cache = QueryCache()
@@ -0,0 +1,361 @@
+import asyncio
+import itertools
+import os
+import time
+from typing import Hashable, Optional
+
+from peewee import OperationalError
+
+from database.write_journal import WriteJournal
+from helpers.plugin_metrics import plugin_metrics
+from logger import logger
+
+
+class WriteIntent:
+    """
+    A queued write for one database helper. Intents that return a key from `get_key` are merged into the pending
+    intent with the same type and key, `apply_many` runs on the database thread inside the flush transaction and gets
+    every pending intent of its type in the order they were first queued.
+    Subclasses are registered by class name so journaled intents can be rebuilt with `from_journal`.
+    """
+
+    journal_types: dict[str, type['WriteIntent']] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        WriteIntent.journal_types[cls.__name__] = cls
+
+    def __init__(self, helper):
+        self.helper = helper
+
+    def get_key(self) -> Optional[Hashable]:
+        return None
+
+    def merge(self, other: 'WriteIntent'):
+        raise NotImplementedError()
+
+    @classmethod
+    def apply_many(cls, intents: list['WriteIntent']):
+        raise NotImplementedError()
+
+    @classmethod
+    def on_applied(cls, intents: list['WriteIntent']):
+        """
+        Runs on the event loop once the flush that applied these intents has committed, for in-memory state that has
+        to follow the database.
+        """
+        pass
+
+    def to_journal(self) -> Optional[dict]:
+        """
+        JSON fields needed to rebuild the intent after a restart, None for intents that can't be journaled.
+        """
+        return None
+
+    @classmethod
+    def from_journal(cls, data: dict) -> 'WriteIntent':
+        raise NotImplementedError()
+
+
+def group_by_type(intents: list[WriteIntent]) -> dict[type, list[WriteIntent]]:
+    by_type: dict[type, list[WriteIntent]] = {}
+    for intent in intents:
+        by_type.setdefault(type(intent), []).append(intent)
+    return by_type
+
+
+def apply_intents(intents: list[WriteIntent]):
+    for intent_type, typed_intents in group_by_type(intents).items():
+        intent_type.apply_many(typed_intents)
+
+
+def is_transient_error(e: Exception) -> bool:
+    """
+    Errors that go away by themselves, i.e. another connection holding the database lock.
+    """
+    message = str(e).lower()
+    return isinstance(e, OperationalError) and ('locked' in message or 'busy' in message)
+
+
+def notify_applied(intents: list[WriteIntent]):
+    for intent_type, typed_intents in group_by_type(intents).items():
+        try:
+            intent_type.on_applied(typed_intents)
+        except Exception as e:
+            logger.error(f'{intent_type.__name__}.on_applied failed, ' + str(e))
+
+
+class WriteBehindQueue:
+    """
+    Collects write intents from all plugins and flushes them with one transaction per database, either every
+    `flush_interval` seconds or as soon as `max_pending` distinct intents are waiting. With a journal configured,
+    queued intents survive a restart, so the interval can be minutes rather than seconds. Each database gets its own
+    journal file, named after the configured path and the database, so its segment is gone once its transaction commits.
+    A transaction that fails on a locked database is retried after each of `retry_delays`, any other failure splits
+    the batch by intent type and then into single intents, so one bad write can't hold back the rest. Intents that
+    fail on their own are dropped into the journal's dead letter file.
+    """
+    retry_delays = (0.5, 2, 5)
+
+    def __init__(self, max_pending: int = 2000, flush_interval: float = 120):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.pending: dict[object, dict[tuple, WriteIntent]] = {}
+        self.in_flight: dict[object, dict[tuple, WriteIntent]] = {}
+        self.depth = 0
+        self.max_depth = 0
+        self.enqueued = 0
+        self.coalesced = 0
+        self.flush_lock = asyncio.Lock()
+        self.sequence = itertools.count()
+        self.run_task: Optional[asyncio.Task] = None
+        self.flush_tasks: set[asyncio.Task] = set()
+        # An early flush is waiting for the lock, more are pointless until it has taken the pending buffer
+        self.flush_queued = False
+        self.journal_path: Optional[str] = None
+        self.journals: dict[object, WriteJournal] = {}
+        self.replayed = 0
+
+    def configure(self, config: dict):
+        self.max_pending = int(config.get('WRITE_BEHIND_MAX_PENDING') or self.max_pending)
+        self.flush_interval = float(config.get('WRITE_BEHIND_FLUSH_SECONDS') or self.flush_interval)
+        self.journal_path = config.get('WRITE_BEHIND_JOURNAL', 'write_behind.journal') or None
+        if self.journal_path is not None:
+            self.replay_journal()
+
+    def get_journal(self, helper) -> Optional[WriteJournal]:
+        if self.journal_path is None:
+            return None
+        if helper not in self.journals:
+            root, extension = os.path.splitext(self.journal_path)
+            database_name = os.path.splitext(os.path.basename(helper.db_conn.database))[0]
+            self.journals[helper] = WriteJournal(f'{root}.{database_name}{extension}')
+        return self.journals[helper]
+
+    def replay_journal(self):
+        """
+        Queues the intents left in the journals by the previous run, they are written by the first flush.
+        """
+        # Registers the intent types
+        import database.write_intents  # noqa: F401
+        from database.helper import database_helpers
+        intents = []
+        for helper in database_helpers:
+            intents += self.get_journal(helper).load(WriteIntent.journal_types)
+        # Left by versions that kept a single journal for every database
+        shared_journal = WriteJournal(self.journal_path)
+        intents += shared_journal.load(WriteIntent.journal_types)
+        for intent in intents:
+            self.add_pending(intent)
+        for helper in database_helpers:
+            self.get_journal(helper).rewrite(list(self.pending.get(helper, {}).values()))
+        shared_journal.discard()
+        self.replayed = len(intents)
+        if intents:
+            logger.info(f'Replayed {len(intents)} journaled writes, {self.depth} after merging')
+
+    def start(self):
+        if self.run_task is None:
+            self.run_task = asyncio.get_event_loop().create_task(self.run())
+
+    def add_pending(self, intent: WriteIntent) -> bool:
+        """
+        Adds an intent to the pending buffer, returns False when it was merged into one that was already there.
+        """
+        key = intent.get_key()
+        pending_key = (type(intent), key if key is not None else next(self.sequence))
+        buffer = self.pending.setdefault(intent.helper, {})
+        if pending_key in buffer:
+            buffer[pending_key].merge(intent)
+            return False
+        buffer[pending_key] = intent
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        return True
+
+    def enqueue(self, intent: WriteIntent):
+        self.start()
+        journal = self.get_journal(intent.helper)
+        if journal is not None:
+            journal.append(intent)
+        self.enqueued += 1
+        if not self.add_pending(intent):
+            self.coalesced += 1
+            return
+        if self.depth >= self.max_pending and not self.flush_queued:
+            # Waits for the lock when a flush is already running, so the buffer is taken right after it
+            self.flush_queued = True
+            task = asyncio.get_event_loop().create_task(self.flush())
+            self.flush_tasks.add(task)
+            task.add_done_callback(self.flush_tasks.discard)
+
+    def get_pending(self, intent_type: type, key: Hashable) -> list[WriteIntent]:
+        """
+        Queued and currently flushing intents for a key, lets readers account for writes that haven't landed yet.
+        """
+        intents = []
+        for buffers in (self.in_flight, self.pending):
+            for buffer in buffers.values():
+                if (intent_type, key) in buffer:
+                    intents.append(buffer[(intent_type, key)])
+        return intents
+
+    def get_all_pending(self, intent_type: type) -> list[WriteIntent]:
+        """
+        Every queued and currently flushing intent of a type, for readers that match on more than the exact key.
+        """
+        return [
+            intent
+            for buffers in (self.in_flight, self.pending)
+            for buffer in buffers.values()
+            for (buffered_type, _), intent in buffer.items()
+            if buffered_type is intent_type
+        ]
+
+    async def apply(self, helper, intents: list[WriteIntent]):
+        for delay in self.retry_delays:
+            try:
+                return await helper.atomic(apply_intents, intents)
+            except Exception as e:
+                if not is_transient_error(e):
+                    raise
+                logger.warning(f'Retrying {len(intents)} writes to {helper.db_conn.database} in {delay}s, ' + str(e))
+                await asyncio.sleep(delay)
+        return await helper.atomic(apply_intents, intents)
+
+    async def apply_isolated(self, helper, intents: list[WriteIntent]) -> list[WriteIntent]:
+        """
+        Applies a batch, falling back to one transaction per intent type and then per intent when it fails. Returns
+        the intents that were written. Once the database stays locked, the intent that hit it and everything after it
+        are queued for the next flush, as later intents may depend on it.
+        """
+        try:
+            await self.apply(helper, intents)
+            return intents
+        except Exception as e:
+            if is_transient_error(e):
+                logger.error(f'Requeueing {len(intents)} writes to {helper.db_conn.database}, ' + str(e))
+                self.requeue(helper, intents)
+                return []
+            logger.error(f'Failed to flush {len(intents)} writes to {helper.db_conn.database}, ' + str(e))
+        applied = []
+        requeued = []
+        by_type = group_by_type(intents)
+        for intent_type, typed_intents in by_type.items():
+            if requeued:
+                requeued += typed_intents
+                continue
+            if len(by_type) > 1:
+                try:
+                    await self.apply(helper, typed_intents)
+                    applied += typed_intents
+                    continue
+                except Exception as e:
+                    if is_transient_error(e):
+                        requeued += typed_intents
+                        continue
+                    logger.error(f'Failed to flush {len(typed_intents)} {intent_type.__name__} writes, ' + str(e))
+            for index, intent in enumerate(typed_intents):
+                try:
+                    await self.apply(helper, [intent])
+                    applied.append(intent)
+                except Exception as e:
+                    if is_transient_error(e):
+                        requeued += typed_intents[index:]
+                        break
+                    logger.error(f'Dropping {intent_type.__name__} write to {helper.db_conn.database}, ' + str(e))
+                    journal = self.get_journal(helper)
+                    if journal is not None:
+                        journal.append_dead(intent)
+        if requeued:
+            logger.error(f'Requeueing {len(requeued)} writes to {helper.db_conn.database}, the database is locked')
+            self.requeue(helper, requeued)
+        return applied
+
+    def requeue(self, helper, intents: list[WriteIntent]):
+        """
+        Puts intents that weren't written back in front of those queued since, in their original order.
+        """
+        buffer: dict[tuple, WriteIntent] = {}
+        for intent in intents:
+            key = intent.get_key()
+            buffer[(type(intent), key if key is not None else next(self.sequence))] = intent
+        self.depth += len(buffer)
+        for pending_key, intent in self.pending.get(helper, {}).items():
+            if pending_key in buffer:
+                buffer[pending_key].merge(intent)
+                self.depth -= 1
+            else:
+                buffer[pending_key] = intent
+        self.pending[helper] = buffer
+        self.max_depth = max(self.max_depth, self.depth)
+        journal = self.get_journal(helper)
+        if journal is not None:
+            # Rewritten rather than appended to, so a replay sees the same order
+            journal.rewrite(list(buffer.values()))
+
+    async def flush(self):
+        async with self.flush_lock:
+            self.flush_queued = False
+            if self.depth == 0:
+                return
+            for journal in self.journals.values():
+                journal.rotate()
+            self.in_flight, self.pending, self.depth = self.pending, {}, 0
+            try:
+                for helper, buffer in list(self.in_flight.items()):
+                    start = time.perf_counter()
+                    intents = list(buffer.values())
+                    applied = []
+                    try:
+                        applied = await self.apply_isolated(helper, intents)
+                    finally:
+                        # Committed writes are in the database now, get_pending must not count them a second time
+                        del self.in_flight[helper]
+                        journal = self.get_journal(helper)
+                        if journal is not None:
+                            journal.discard_flushing()
+                        # Some intents write with executemany, which bypasses execute_sql
+                        helper.db_conn.bump_write_generation()
+                        elapsed_ms = (time.perf_counter() - start) * 1000
+                        plugin_metrics.record(
+                            self.__class__.__name__, f'flush {helper.db_conn.database}', elapsed_ms,
+                            len(applied) != len(intents)
+                        )
+                    notify_applied(applied)
+            finally:
+                # Databases the flush didn't get to, queued again before their journal segments go
+                for helper, buffer in self.in_flight.items():
+                    self.requeue(helper, list(buffer.values()))
+                self.in_flight = {}
+                for journal in self.journals.values():
+                    journal.discard_flushing()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                # Shielded so stopping the loop never abandons a flush halfway through its databases
+                await asyncio.shield(self.flush())
+            except Exception as e:
+                logger.error('Write-behind flush failed, ' + str(e))
+
+    async def close(self):
+        """
+        Stops the flush loop and writes everything that is still queued.
+        """
+        if self.run_task is not None:
+            self.run_task.cancel()
+        await asyncio.gather(*self.flush_tasks, return_exceptions=True)
+        await self.flush()
+        for journal in self.journals.values():
+            journal.close()
+
+    def get_summary_lines(self) -> list[str]:
+        return [
+            f'Write-behind queue: {self.depth} pending (max {self.max_depth}), {self.enqueued:,} queued, '
+            f'{self.coalesced:,} coalesced, {self.replayed:,} replayed from journal'
+        ]
+
+
+write_behind = WriteBehindQueue()
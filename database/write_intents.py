@@ -0,0 +1,327 @@
+import datetime
+import time
+from typing import Callable, Hashable, Optional
+
+from peewee import Field, Model, chunked
+
+from database.helper import (
+    gfd_database_helper,
+    gfd_emojis_database_helper,
+    gfd_links_database_helper,
+    gfd_message_stats_database_helper,
+    database_helpers,
+    BaseDatabaseHelper,
+)
+from database.models import (
+    Activity,
+    User,
+    PostedLinkV2,
+    DailyMessageCount,
+    MessageHeatmap,
+    MessageReactionCount,
+    ReactionCount,
+    UserReaction,
+)
+from database.write_behind import WriteIntent, write_behind
+
+
+class IncrementUserCounter(WriteIntent):
+    counter_fields = (User.ducks_befriended, User.ducks_killed, User.ducks_shooed, User.monsters_guessed)
+
+    def __init__(self, user_id: int, field: Field, count: int = 1):
+        super().__init__(gfd_database_helper)
+        self.user_id = user_id
+        self.field = field
+        self.count = count
+
+    def get_key(self) -> Optional[Hashable]:
+        return self.user_id, self.field.name
+
+    def merge(self, other: 'IncrementUserCounter'):
+        self.count += other.count
+
+    def to_journal(self) -> Optional[dict]:
+        return {'user_id': self.user_id, 'field': self.field.name, 'count': self.count}
+
+    @classmethod
+    def from_journal(cls, data: dict) -> 'IncrementUserCounter':
+        return cls(data['user_id'], getattr(User, data['field']), data['count'])
+
+    @classmethod
+    def apply_many(cls, intents: list['IncrementUserCounter']):
+        by_field: dict[Field, dict[int, int]] = {}
+        for intent in intents:
+            by_field.setdefault(intent.field, {})[intent.user_id] = intent.count
+        for field, increments in by_field.items():
+            User.increment_counters(field, increments)
+
+    @staticmethod
+    def get_pending_count(user_id: int, field: Field) -> int:
+        return sum(intent.count for intent in write_behind.get_pending(IncrementUserCounter, (user_id, field.name)))
+
+    @staticmethod
+    def add_pending(user: User):
+        """
+        Adds increments that are still queued to a user loaded from the database.
+        """
+        for field in IncrementUserCounter.counter_fields:
+            pending_count = IncrementUserCounter.get_pending_count(user.user_id, field)
+            if pending_count:
+                setattr(user, field.name, getattr(user, field.name) + pending_count)
+
+
+class IncrementLinkHits(WriteIntent):
+    def __init__(self, link: str, count: int = 1):
+        super().__init__(gfd_links_database_helper)
+        self.link = link
+        self.key = PostedLinkV2.parse_link(link)
+        self.count = count
+
+    def get_key(self) -> Optional[Hashable]:
+        return self.key
+
+    def merge(self, other: 'IncrementLinkHits'):
+        self.count += other.count
+
+    def to_journal(self) -> Optional[dict]:
+        return {'link': self.link, 'count': self.count}
+
+    @classmethod
+    def from_journal(cls, data: dict) -> 'IncrementLinkHits':
+        return cls(data['link'], data['count'])
+
+    @classmethod
+    def apply_many(cls, intents: list['IncrementLinkHits']):
+        PostedLinkV2.increment_hits_by_key({intent.key: intent.count for intent in intents})
+
+    @staticmethod
+    def get_pending_hits(link: str) -> int:
+        """
+        Queued hits for a link, without any for the exact link those queued with other query parameters are added up,
+        the same fallback as PostedLinkV2.get_hits_by_link.
+        """
+        link_minus_qp, qp = PostedLinkV2.parse_link(link)
+        pending = write_behind.get_pending(IncrementLinkHits, (link_minus_qp, qp))
+        if not pending:
+            pending = [
+                intent for intent in write_behind.get_all_pending(IncrementLinkHits) if intent.key[0] == link_minus_qp
+            ]
+        return sum(intent.count for intent in pending)
+
+
+class IncrementDailyMessageCount(WriteIntent):
+    """
+    Keyed by (day ordinal, channel or thread id, is thread, user id) so buffering a message is one tuple hash, the
+    metrics are in `message_metric_fields` order.
+    """
+
+    def __init__(self, day: int, channel_id: int, is_thread: bool, user_id: int, metrics: list[int]):
+        super().__init__(gfd_message_stats_database_helper)
+        self.key = (day, channel_id, is_thread, user_id)
+        self.metrics = metrics
+
+    def get_key(self) -> Optional[Hashable]:
+        return self.key
+
+    def merge(self, other: 'IncrementDailyMessageCount'):
+        for index, value in enumerate(other.metrics):
+            self.metrics[index] += value
+
+    def to_journal(self) -> Optional[dict]:
+        return {'key': self.key, 'metrics': self.metrics}
+
+    @classmethod
+    def from_journal(cls, data: dict) -> 'IncrementDailyMessageCount':
+        return cls(*data['key'], data['metrics'])
+
+    @classmethod
+    def apply_many(cls, intents: list['IncrementDailyMessageCount']):
+        DailyMessageCount.increment_packed_counts({intent.key: intent.metrics for intent in intents})
+
+
+class IncrementMessageHeatmap(WriteIntent):
+    """
+    Keyed by (channel or thread id, user id, hour of the week slot), the user and channel heatmaps are both derived
+    from these when the flush applies them.
+    """
+
+    def __init__(self, channel_id: int, user_id: int, slot: int, count: int = 1):
+        super().__init__(gfd_message_stats_database_helper)
+        self.key = (channel_id, user_id, slot)
+        self.count = count
+
+    def get_key(self) -> Optional[Hashable]:
+        return self.key
+
+    def merge(self, other: 'IncrementMessageHeatmap'):
+        self.count += other.count
+
+    def to_journal(self) -> Optional[dict]:
+        return {'key': self.key, 'count': self.count}
+
+    @classmethod
+    def from_journal(cls, data: dict) -> 'IncrementMessageHeatmap':
+        return cls(*data['key'], data['count'])
+
+    @classmethod
+    def apply_many(cls, intents: list['IncrementMessageHeatmap']):
+        MessageHeatmap.increment_heatmaps({intent.key: intent.count for intent in intents})
+
+
+class RecordReaction(WriteIntent):
+    """
+    A reaction added (+1) or removed (-1), keyed by (message id, reacting user, emoji) so a user toggling the same
+    reaction on a message nets out before anything is written. Adds and removes that cancel out write no rows.
+    Functions in `applied_listeners` get the updated per message counts after every flush.
+    """
+
+    applied_listeners: list[Callable[[list[tuple]], None]] = []
+
+    def __init__(self, message_id: int, source_user_id: int, target_user_id: int, emoji_id: Optional[int],
+                 emoji_str: Optional[str], count: int, created_at: Optional[float] = None,
+                 channel_id: Optional[int] = None):
+        super().__init__(gfd_emojis_database_helper)
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.source_user_id = source_user_id
+        self.target_user_id = target_user_id
+        self.emoji_id = emoji_id
+        self.emoji_str = emoji_str
+        self.count = count
+        # Merged events keep the time of the first one
+        self.created_at = created_at if created_at is not None else time.time()
+        self.day = datetime.datetime.fromtimestamp(self.created_at, datetime.timezone.utc).toordinal()
+        # Set by apply_many, the message's counter row after the flush
+        self.message_total: Optional[tuple] = None
+
+    def get_key(self) -> Optional[Hashable]:
+        return self.message_id, self.source_user_id, self.emoji_id, self.emoji_str
+
+    def merge(self, other: 'RecordReaction'):
+        self.count += other.count
+
+    def to_journal(self) -> Optional[dict]:
+        return {
+            'message_id': self.message_id,
+            'source_user_id': self.source_user_id,
+            'target_user_id': self.target_user_id,
+            'emoji_id': self.emoji_id,
+            'emoji_str': self.emoji_str,
+            'count': self.count,
+            'created_at': self.created_at,
+            'channel_id': self.channel_id,
+        }
+
+    @classmethod
+    def from_journal(cls, data: dict) -> 'RecordReaction':
+        return cls(**data)
+
+    @classmethod
+    def apply_many(cls, intents: list['RecordReaction']):
+        rows = []
+        for intent in intents:
+            row = dict(
+                source_user_id=intent.source_user_id,
+                target_user_id=intent.target_user_id,
+                emoji_id=intent.emoji_id,
+                emoji_str=intent.emoji_str,
+                is_add=intent.count > 0,
+                created_at=intent.created_at,
+                day=intent.day,
+            )
+            # Each row is one add or remove, a net of more than one either way is still stored as single events
+            rows.extend([row] * abs(intent.count))
+        for batch in chunked(rows, 100):
+            UserReaction.insert_many(batch).execute()
+        ReactionCount.increment_counts([
+            (intent.day, intent.source_user_id, intent.target_user_id, intent.emoji_id, intent.emoji_str, intent.count)
+            for intent in intents
+        ])
+        message_counts = {}
+        for intent in intents:
+            if intent.count == 0:
+                continue
+            channel_id, target_user_id, count = message_counts.get(
+                intent.message_id, (intent.channel_id, intent.target_user_id, 0)
+            )
+            message_counts[intent.message_id] = (channel_id or intent.channel_id, target_user_id, count + intent.count)
+        totals = {row[0]: row for row in MessageReactionCount.increment_counts(message_counts)}
+        for intent in intents:
+            intent.message_total = totals.get(intent.message_id)
+
+    @classmethod
+    def on_applied(cls, intents: list['RecordReaction']):
+        totals = list({intent.message_id: intent.message_total for intent in intents if intent.message_total}.values())
+        for listener in cls.applied_listeners:
+            listener(totals)
+
+
+class InsertRow(WriteIntent):
+    """
+    Appends a row, rows for the same model are written with multi-row inserts in the order they were queued.
+    """
+
+    def __init__(self, helper: BaseDatabaseHelper, model: type[Model], row: dict):
+        super().__init__(helper)
+        self.model = model
+        self.row = row
+
+    def to_journal(self) -> Optional[dict]:
+        return {'model': self.model.__name__, 'row': self.row}
+
+    @classmethod
+    def from_journal(cls, data: dict) -> 'InsertRow':
+        for helper in database_helpers:
+            for model in helper.models:
+                if model.__name__ == data['model']:
+                    return cls(helper, model, data['row'])
+        raise Exception(f'Unknown model {data["model"]} in write journal')
+
+    @classmethod
+    def apply_many(cls, intents: list['InsertRow']):
+        by_model: dict[type[Model], list[dict]] = {}
+        for intent in intents:
+            by_model.setdefault(intent.model, []).append(intent.row)
+        for model, rows in by_model.items():
+            for batch in chunked(rows, 100):
+                model.insert_many(batch).execute()
+
+
+class RecordActivity(WriteIntent):
+    """
+    A game activity starting, or ending when `end_time` is set. These are never merged and are applied in the order
+    they were queued, as an end is matched against the user's latest activity. The `start_time` of an end is only
+    used when its start was never recorded.
+    """
+
+    def __init__(self, user_id: int, game_name: str, platform: Optional[str], start_time: float,
+                 end_time: Optional[float] = None):
+        super().__init__(gfd_database_helper)
+        self.user_id = user_id
+        self.game_name = game_name
+        self.platform = platform
+        self.start_time = start_time
+        self.end_time = end_time
+
+    def to_journal(self) -> Optional[dict]:
+        return {
+            'user_id': self.user_id,
+            'game_name': self.game_name,
+            'platform': self.platform,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+        }
+
+    @classmethod
+    def from_journal(cls, data: dict) -> 'RecordActivity':
+        return cls(**data)
+
+    @classmethod
+    def apply_many(cls, intents: list['RecordActivity']):
+        for intent in intents:
+            if intent.end_time is None:
+                Activity.create_activity(intent.user_id, intent.game_name, intent.platform, intent.start_time)
+            else:
+                Activity.close_latest(
+                    intent.user_id, intent.game_name, intent.platform, intent.start_time, intent.end_time
+                )
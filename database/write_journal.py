@@ -0,0 +1,106 @@
+import json
+import os
+from typing import Optional
+
+from logger import logger
+
+
+class WriteJournal:
+    """
+    Append-only file with one JSON line per queued write intent, so a crash or restart doesn't lose writes that were
+    still buffered. The queue moves the file aside to `<path>.flushing` when a flush starts and deletes that segment
+    once the database's transaction commits, anything left on disk at startup never reached the database and is
+    replayed.
+    Lines are flushed to the OS on every append, which survives the process dying but not the machine losing power.
+    Intents the database refused are kept in `<path>.dead` in the same format, moving that file to `path` replays
+    them on the next start.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.flushing_path = path + '.flushing'
+        self.dead_path = path + '.dead'
+        self.file = None
+
+    def append(self, intent):
+        data = intent.to_journal()
+        if data is None:
+            return
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.write(self.encode(intent, data))
+        self.file.flush()
+
+    def append_dead(self, intent):
+        data = intent.to_journal()
+        if data is None:
+            return
+        with open(self.dead_path, 'a', encoding='utf-8') as file:
+            file.write(self.encode(intent, data))
+
+    @staticmethod
+    def encode(intent, data: dict) -> str:
+        return json.dumps([type(intent).__name__, data], separators=(',', ':'), default=str) + '\n'
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def rotate(self):
+        """
+        Moves the current journal aside before a flush, intents queued while the flush runs go to a new file.
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.replace(self.path, self.flushing_path)
+
+    def discard_flushing(self):
+        if os.path.exists(self.flushing_path):
+            os.remove(self.flushing_path)
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.discard_flushing()
+
+    def load(self, intent_types: dict[str, type]) -> list:
+        intents = []
+        for path in (self.flushing_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding='utf-8') as file:
+                for line_number, line in enumerate(file, 1):
+                    intent = self.decode(line, intent_types)
+                    if intent is None:
+                        logger.warning(f'Skipping unreadable write journal entry {path}:{line_number}')
+                        continue
+                    intents.append(intent)
+        return intents
+
+    @staticmethod
+    def decode(line: str, intent_types: dict[str, type]) -> Optional[object]:
+        try:
+            type_name, data = json.loads(line)
+            return intent_types[type_name].from_journal(data)
+        except Exception:
+            # A crash mid-append leaves a partial last line
+            return None
+
+    def rewrite(self, intents: list):
+        """
+        Replaces both journal files with the given intents, written to a temporary file first so a crash here
+        leaves either the old journal or the new one.
+        """
+        self.close()
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            for intent in intents:
+                data = intent.to_journal()
+                if data is not None:
+                    file.write(self.encode(intent, data))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        self.discard_flushing()
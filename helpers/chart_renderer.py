@@ -0,0 +1,104 @@
+import asyncio
+import io
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Hashable, Optional
+
+
+def render_bar_chart(title: str, labels: list[str], values: list[float], unit: str) -> bytes:
+    import plotly.graph_objects as go
+    figure = go.Figure(go.Bar(
+        # Plotted bottom up, reversed so the first entry is the top bar
+        x=values[::-1],
+        y=labels[::-1],
+        orientation='h',
+        marker_color='#5865f2',
+        text=[f'{value:,}' for value in values[::-1]],
+        textposition='auto',
+    ))
+    figure.update_layout(
+        title=title,
+        template='plotly_dark',
+        xaxis_title=unit,
+        width=900,
+        height=120 + 28 * len(labels),
+        margin=dict(l=10, r=30, t=60, b=50),
+    )
+    figure.update_yaxes(automargin=True)
+    return figure.to_image(format='png')
+
+
+def warm_up():
+    import plotly.graph_objects  # noqa: F401
+
+
+class ChartEntry:
+    def __init__(self, data: Any, image: bytes):
+        self.data = data
+        self.image = image
+
+
+class ChartRenderer:
+    """
+    Renders stats as PNG bar charts with plotly in a worker process, so building the figure and the kaleido export
+    never run on the event loop. A chart is cached per query key together with the result it was drawn from and is
+    reused as long as the query cache hands back that same result object, i.e. until a write or its ttl replaces it.
+    """
+    max_bars = 25
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self.executor: Optional[Executor] = None
+        self.entries: OrderedDict[Hashable, ChartEntry] = OrderedDict()
+        self.hits = 0
+        self.renders = 0
+
+    def start(self):
+        if self.executor is not None:
+            return
+        try:
+            # Spawned rather than forked, a fork would copy the database threads and their open connections. The
+            # worker imports main.py without running the bot, which only starts under its __main__ guard
+            self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+            self.executor.submit(warm_up)
+        except (OSError, NotImplementedError):
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chart-renderer')
+
+    async def render(self, key: Hashable, data: Any, title: str, labels: list[str], values: list[float],
+                     unit: str) -> io.BytesIO:
+        entry = self.entries.get(key)
+        if entry is not None and entry.data is data:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return io.BytesIO(entry.image)
+        self.start()
+        self.renders += 1
+        try:
+            image = await asyncio.get_running_loop().run_in_executor(
+                self.executor, render_bar_chart, title, labels[:self.max_bars], values[:self.max_bars], unit
+            )
+        except BrokenProcessPool:
+            # The worker died, the next chart starts a new one
+            self.executor = None
+            raise
+        self.entries[key] = ChartEntry(data, image)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return io.BytesIO(image)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def get_summary_lines(self) -> list[str]:
+        charts = self.hits + self.renders
+        if charts == 0:
+            return []
+        return [f'Charts: {self.hits:,}/{charts:,} cached, {len(self.entries)} entries']
+
+
+chart_renderer = ChartRenderer()
@@ -0,0 +1,66 @@
+from typing import Callable, Awaitable, Iterable, Union
+
+import discord
+
+from helpers.message_context import MessageContext
+
+MessageHandler = Callable[[discord.Message, MessageContext], Awaitable[None]]
+
+
+class CommandRouter:
+    """
+    Routes a message straight to the plugins that own its command instead of offering it to every plugin.
+    Commands are keyed on the lowercased first token of the message, prefixes are matched against the start of
+    the lowercased content and observers receive every message.
+    Handlers run concurrently unless registered with a later stage, stages run one after the other.
+    """
+
+    def __init__(self):
+        self.commands: dict[str, list[MessageHandler]] = {}
+        self.prefixes: dict[str, list[MessageHandler]] = {}
+        self.prefix_lengths: list[int] = []
+        self.observers: list[MessageHandler] = []
+        self.stages: dict[MessageHandler, int] = {}
+
+    def register_command(self, commands: Union[str, Iterable[str]], handler: MessageHandler, stage=0):
+        self.stages[handler] = stage
+        for command in [commands] if isinstance(commands, str) else commands:
+            handlers = self.commands.setdefault(command.lower(), [])
+            if handler not in handlers:
+                handlers.append(handler)
+
+    def register_prefix(self, prefixes: Union[str, Iterable[str]], handler: MessageHandler, stage=0):
+        self.stages[handler] = stage
+        for prefix in [prefixes] if isinstance(prefixes, str) else prefixes:
+            prefix = prefix.lower()
+            handlers = self.prefixes.setdefault(prefix, [])
+            if handler not in handlers:
+                handlers.append(handler)
+            if len(prefix) not in self.prefix_lengths:
+                self.prefix_lengths.append(len(prefix))
+                self.prefix_lengths.sort()
+
+    def observe_all(self, handler: MessageHandler, stage=0):
+        self.stages[handler] = stage
+        if handler not in self.observers:
+            self.observers.append(handler)
+
+    def get_handlers(self, context: MessageContext) -> list[MessageHandler]:
+        content_lower = context.content_lower
+        handlers = list(self.commands.get(context.first_token, ()))
+        for prefix_length in self.prefix_lengths:
+            if prefix_length > len(content_lower):
+                break
+            for handler in self.prefixes.get(content_lower[:prefix_length], ()):
+                if handler not in handlers:
+                    handlers.append(handler)
+        for handler in self.observers:
+            if handler not in handlers:
+                handlers.append(handler)
+        return handlers
+
+    def get_handler_stages(self, context: MessageContext) -> list[list[MessageHandler]]:
+        stages: dict[int, list[MessageHandler]] = {}
+        for handler in self.get_handlers(context):
+            stages.setdefault(self.stages.get(handler, 0), []).append(handler)
+        return [stages[stage] for stage in sorted(stages)]
@@ -0,0 +1,10 @@
+_gen_ai_client = None
+
+
+def get_gen_ai_client(config: dict):
+    """Returns the gemini client shared by all plugins, the google sdk is only imported on first use."""
+    global _gen_ai_client
+    if _gen_ai_client is None:
+        from google import genai
+        _gen_ai_client = genai.Client(api_key=config.get('GEMINI_KEY'))
+    return _gen_ai_client
@@ -0,0 +1,90 @@
+import asyncio
+import signal
+import time
+
+import discord
+
+from database.helper import database_helpers
+from database.write_behind import write_behind
+from helpers.chart_renderer import chart_renderer
+from helpers.plugin_dispatcher import PluginDispatcher
+from logger import logger
+from plugins.base import BasePlugin
+
+
+class PluginLifecycle:
+    """
+    Starts the plugins once the client is first ready and shuts everything down in order on SIGINT/SIGTERM: stop
+    dispatching events, let running handlers finish, stop the plugins, flush the write-behind queue, disconnect and
+    close the databases. Draining and stopping share `shutdown_timeout`, the final flush always runs.
+    """
+
+    def __init__(self, client: discord.Client, plugins: list[BasePlugin], dispatcher: PluginDispatcher,
+                 shutdown_timeout: float = 20):
+        self.client = client
+        self.plugins = plugins
+        self.dispatcher = dispatcher
+        self.shutdown_timeout = shutdown_timeout
+        self.started = False
+        self.stopped = False
+        self.shutdown_lock = asyncio.Lock()
+        self.shutdown_task = None
+
+    async def start(self):
+        if self.started:
+            return
+        self.started = True
+        write_behind.start()
+        chart_renderer.start()
+        for plugin in self.plugins:
+            try:
+                await plugin.on_start()
+            except Exception as e:
+                logger.error(f'{plugin.__class__.__name__} failed to start, ' + str(e))
+
+    def install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, self.request_shutdown)
+            except NotImplementedError:
+                # Windows, Ctrl+C still ends the client and the shutdown runs after it
+                pass
+
+    def request_shutdown(self):
+        if self.shutdown_task is None:
+            logger.info('Shutdown requested')
+            self.shutdown_task = asyncio.get_running_loop().create_task(self.shutdown())
+
+    @staticmethod
+    def get_remaining(deadline: float) -> float:
+        return max(deadline - time.monotonic(), 0)
+
+    async def shutdown(self):
+        async with self.shutdown_lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            start = time.monotonic()
+            deadline = start + self.shutdown_timeout
+            if not await self.dispatcher.drain(self.get_remaining(deadline)):
+                logger.warning(f'{self.dispatcher.in_flight} event handlers were still running at shutdown')
+            await self.stop_plugins(deadline)
+            await write_behind.close()
+            chart_renderer.close()
+            if not self.client.is_closed():
+                await self.client.close()
+            for helper in database_helpers:
+                await asyncio.to_thread(helper.close)
+            logger.info(f'Shut down in {(time.monotonic() - start) * 1000:.0f}ms')
+
+    async def stop_plugins(self, deadline: float):
+        results = await asyncio.gather(
+            *(asyncio.wait_for(plugin.on_stop(), timeout=self.get_remaining(deadline)) for plugin in self.plugins),
+            return_exceptions=True
+        )
+        for plugin, result in zip(self.plugins, results):
+            if isinstance(result, asyncio.TimeoutError):
+                logger.warning(f'{plugin.__class__.__name__} did not stop before the shutdown deadline')
+            elif isinstance(result, Exception):
+                logger.error(f'{plugin.__class__.__name__} failed to stop, ' + str(result))
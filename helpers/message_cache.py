@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from typing import Optional
+
+import discord
+
+
+class CachedMessage:
+    __slots__ = ('author_id', 'channel_id', 'attachment_types', 'reactions')
+
+    def __init__(self, author_id: int, channel_id: int, attachment_types: tuple[str, ...],
+                 reactions: Optional[dict[str, int]]):
+        self.author_id = author_id
+        self.channel_id = channel_id
+        self.attachment_types = attachment_types
+        # Reaction counts by emoji, None when the message was first seen through a reaction and they aren't known
+        self.reactions = reactions
+
+
+class MessageCache:
+    """
+    Metadata of recently seen messages, fed from every incoming message, the message it replies to and reaction
+    events, so plugins asking who wrote a message or what it has attached don't need a REST call for messages the bot
+    saw recently. Only the `max_entries` most recently touched messages are kept.
+    """
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[int, CachedMessage] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, config: dict):
+        self.max_entries = int(config.get('MESSAGE_CACHE_SIZE') or self.max_entries)
+
+    def put(self, message_id: int, entry: CachedMessage):
+        self.entries[message_id] = entry
+        self.entries.move_to_end(message_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def add_message(self, message: discord.Message):
+        self.put(message.id, CachedMessage(
+            message.author.id,
+            message.channel.id,
+            tuple(attachment.content_type or '' for attachment in message.attachments),
+            {str(reaction.emoji): reaction.count for reaction in message.reactions},
+        ))
+        if message.reference is not None and isinstance(message.reference.resolved, discord.Message):
+            if message.reference.resolved.id not in self.entries:
+                self.add_message(message.reference.resolved)
+
+    def add_reaction(self, payload: discord.RawReactionActionEvent):
+        entry = self.entries.get(payload.message_id)
+        if entry is None:
+            if payload.message_author_id is None:
+                return
+            entry = CachedMessage(payload.message_author_id, payload.channel_id, (), None)
+        elif entry.reactions is not None:
+            emoji = str(payload.emoji)
+            entry.reactions[emoji] = entry.reactions.get(emoji, 0) + 1
+        self.put(payload.message_id, entry)
+
+    def remove_reaction(self, payload: discord.RawReactionActionEvent):
+        entry = self.entries.get(payload.message_id)
+        if entry is None or entry.reactions is None:
+            return
+        emoji = str(payload.emoji)
+        count = entry.reactions.get(emoji, 0) - 1
+        if count > 0:
+            entry.reactions[emoji] = count
+        else:
+            entry.reactions.pop(emoji, None)
+
+    def get(self, message_id: int) -> Optional[CachedMessage]:
+        entry = self.entries.get(message_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(message_id)
+        self.hits += 1
+        return entry
+
+    async def get_author_id(self, client: discord.Client, channel_id: int, message_id: int) -> int:
+        entry = self.get(message_id)
+        if entry is not None:
+            return entry.author_id
+        channel = client.get_channel(channel_id) or await client.fetch_channel(channel_id)
+        message = await channel.fetch_message(message_id)
+        self.add_message(message)
+        return message.author.id
+
+    async def get_referenced_message(self, channel: discord.abc.Messageable,
+                                     reference: discord.MessageReference) -> discord.Message:
+        """
+        The replied to message as sent along with the reply, fetched only when Discord didn't include it.
+        """
+        if isinstance(reference.resolved, discord.Message):
+            self.hits += 1
+            return reference.resolved
+        self.misses += 1
+        message = await channel.fetch_message(reference.message_id)
+        self.add_message(message)
+        return message
+
+    def get_summary_lines(self) -> list[str]:
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return []
+        return [
+            f'Message cache: {self.hits:,}/{lookups:,} hits ({self.hits / lookups:.0%}), {len(self.entries)} messages'
+        ]
+
+
+message_cache = MessageCache()
@@ -0,0 +1,66 @@
+import re
+from functools import cached_property
+
+import discord
+
+from helpers.message_utils import get_image_attachment_count, get_video_attachment_count
+
+link_regex = r'https?://[^\s]{1,2048}'
+basic_url_regex_pattern = re.compile(link_regex, re.DOTALL)
+
+
+class MessageContext:
+    """
+    Built once per message event and handed to every plugin, each property is only computed the first time a plugin
+    asks for it and is shared from then on.
+    """
+
+    def __init__(self, message: discord.Message):
+        self.message = message
+
+    @cached_property
+    def content_lower(self) -> str:
+        return self.message.content.lower()
+
+    @cached_property
+    def _content_lower_parts(self) -> list[str]:
+        return self.content_lower.split(maxsplit=1)
+
+    @cached_property
+    def first_token(self) -> str:
+        return self._content_lower_parts[0] if self._content_lower_parts else ''
+
+    @cached_property
+    def args(self) -> str:
+        parts = self.message.content.split(maxsplit=1)
+        return parts[1].strip() if len(parts) > 1 else ''
+
+    @cached_property
+    def urls(self) -> list[str]:
+        if 'http' not in self.message.content:
+            return []
+        return [match.group(0) for match in basic_url_regex_pattern.finditer(self.message.content)]
+
+    @cached_property
+    def mention_ids(self) -> list[int]:
+        return [user.id for user in self.message.mentions]
+
+    @cached_property
+    def image_count(self) -> int:
+        return get_image_attachment_count(self.message) if self.message.attachments else 0
+
+    @cached_property
+    def video_count(self) -> int:
+        return get_video_attachment_count(self.message) if self.message.attachments else 0
+
+    @cached_property
+    def is_private(self) -> bool:
+        return self.message.channel.type == discord.ChannelType.private
+
+    @cached_property
+    def is_thread(self) -> bool:
+        return isinstance(self.message.channel, discord.Thread)
+
+    @cached_property
+    def channel_key(self) -> tuple[int, bool]:
+        return self.message.channel.id, self.is_thread
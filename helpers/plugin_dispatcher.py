@@ -0,0 +1,85 @@
+import asyncio
+import time
+from typing import Callable, Any, Optional
+
+from helpers.plugin_metrics import plugin_metrics
+from logger import logger
+
+
+def get_plugin_name(handler: Callable) -> str:
+    return handler.__qualname__.split('.')[0]
+
+
+class PluginDispatcher:
+    """
+    Runs plugin handlers concurrently, each one under its own timeout, so a slow or failing plugin can neither hold
+    up nor abort the handlers running next to it.
+    """
+
+    def __init__(self, default_timeout: float = 30, timeouts: Optional[dict[str, float]] = None):
+        self.default_timeout = default_timeout
+        self.timeouts = timeouts or {}
+        self.accepting = True
+        self.in_flight = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    @staticmethod
+    def from_config(config: dict):
+        default_timeout = float(config.get('PLUGIN_HANDLER_TIMEOUT') or 30)
+        timeouts = {}
+        if config.get('PLUGIN_HANDLER_TIMEOUTS'):
+            for plugin_timeout in config['PLUGIN_HANDLER_TIMEOUTS'].split(','):
+                plugin_name, timeout = plugin_timeout.split(':')
+                timeouts[plugin_name.strip()] = float(timeout)
+        return PluginDispatcher(default_timeout, timeouts)
+
+    def get_timeout(self, handler: Callable) -> float:
+        plugin_name = get_plugin_name(handler)
+        if plugin_name in self.timeouts:
+            return self.timeouts[plugin_name]
+        plugin_timeout = getattr(getattr(handler, '__self__', None), 'handler_timeout', None)
+        return plugin_timeout if plugin_timeout is not None else self.default_timeout
+
+    async def run_handler(self, handler: Callable, *args: Any):
+        timeout = self.get_timeout(handler)
+        failed = True
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(handler(*args), timeout=timeout)
+            failed = False
+        except asyncio.TimeoutError:
+            logger.error(f'{handler.__qualname__} timed out after {timeout} seconds')
+        except Exception as e:
+            logger.error(f'{handler.__qualname__} failed, ' + str(e))
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            plugin_metrics.record(get_plugin_name(handler), handler.__name__, elapsed_ms, failed)
+
+    async def dispatch(self, handler_stages: list[list[Callable]], *args: Any):
+        if not self.accepting:
+            return
+        self.in_flight += 1
+        self.idle.clear()
+        try:
+            for handlers in handler_stages:
+                if len(handlers) == 1:
+                    await self.run_handler(handlers[0], *args)
+                    continue
+                await asyncio.gather(*(self.run_handler(handler, *args) for handler in handlers))
+        finally:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self.idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Stops dispatching new events and waits for the running ones, returns False if some were still running when
+        the timeout ran out.
+        """
+        self.accepting = False
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
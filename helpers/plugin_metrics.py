@@ -0,0 +1,88 @@
+import bisect
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the latency buckets in milliseconds, doubling from 0.25ms up to a little over two minutes
+LATENCY_BUCKETS_MS = [0.25 * 2 ** i for i in range(20)]
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        self.total += 1
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def percentile(self, percentile: float) -> float:
+        if self.total == 0:
+            return 0.0
+        threshold = self.total * percentile / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                if index < len(LATENCY_BUCKETS_MS):
+                    return min(LATENCY_BUCKETS_MS[index], self.max_ms)
+                return self.max_ms
+        return self.max_ms
+
+
+class EntryPointMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.histogram = LatencyHistogram()
+
+    def record(self, elapsed_ms: float, failed: bool):
+        self.calls += 1
+        if failed:
+            self.errors += 1
+        self.total_ms += elapsed_ms
+        self.histogram.record(elapsed_ms)
+
+
+class PluginMetrics:
+    def __init__(self):
+        self.entry_points: dict[tuple[str, str], EntryPointMetrics] = {}
+        self.started_at = time.time()
+
+    def record(self, plugin_name: str, entry_point: str, elapsed_ms: float, failed: bool = False):
+        key = (plugin_name, entry_point)
+        metrics = self.entry_points.get(key)
+        if metrics is None:
+            metrics = self.entry_points[key] = EntryPointMetrics()
+        metrics.record(elapsed_ms, failed)
+
+    @contextmanager
+    def measure(self, plugin_name: str, entry_point: str):
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.record(plugin_name, entry_point, (time.perf_counter() - start) * 1000, failed)
+
+    def get_summary_lines(self) -> list[str]:
+        uptime_minutes = max((time.time() - self.started_at) / 60, 1)
+        lines = []
+        by_total_time = sorted(self.entry_points.items(), key=lambda item: item[1].total_ms, reverse=True)
+        for (plugin_name, entry_point), metrics in by_total_time:
+            histogram = metrics.histogram
+            lines.append(
+                f'{plugin_name}.{entry_point}: {metrics.calls:,} calls ({metrics.calls / uptime_minutes:.1f}/min), '
+                f'{metrics.errors:,} errors, p50 {histogram.percentile(50):.2f}ms, '
+                f'p95 {histogram.percentile(95):.2f}ms, p99 {histogram.percentile(99):.2f}ms, '
+                f'total {metrics.total_ms / 1000:.1f}s'
+            )
+        return lines
+
+
+plugin_metrics = PluginMetrics()
@@ -22,6 +22,13 @@ class QueueBasedWorker:
             except asyncio.QueueEmpty:
                 pass
 
+    async def stop(self):
+        if self._worker_task is None:
+            return
+        self._worker_task.cancel()
+        await asyncio.gather(self._worker_task, return_exceptions=True)
+        self._worker_task = None
+
     def submit(self, func: Callable, *args: Any, **kwargs: Any):
         self.queue.put_nowait((func, args, kwargs))
 
@@ -0,0 +1,108 @@
+import asyncio
+import datetime
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import pytz
+
+
+class TimeParser:
+    """
+    Turns time expressions into timezone aware datetimes. The common shapes, "5pm", "5:30 pm", "17:30", "tomorrow 9am"
+    and ISO dates with an optional time, are matched with regexes, anything else goes to dateparser on a worker thread
+    limited to the configured languages. Results, including failures, are cached on (text, timezone, minute) since
+    relative expressions depend on the current time.
+    """
+    day_words = {'today': 0, 'tomorrow': 1}
+    clock_pattern = (
+        r'(?:(?P<hour12>\d{1,2})(?::(?P<minute12>\d{2}))? ?(?P<meridiem>[ap])\.?m\.?'
+        r'|(?P<hour24>\d{1,2}):(?P<minute24>\d{2}))'
+    )
+    time_pattern = re.compile(
+        rf'^(?:(?P<day_before>today|tomorrow) (?:at )?)?{clock_pattern}'
+        r'(?: (?P<day_after>today|tomorrow))?$'
+    )
+    iso_pattern = re.compile(r'^(\d{4})-(\d{2})-(\d{2})(?:[ t](\d{1,2}):(\d{2})(?::(\d{2}))?)?$')
+    whitespace_pattern = re.compile(r'\s+')
+
+    def __init__(self, languages: Optional[list[str]] = None, max_entries: int = 512):
+        self.languages = languages if languages is not None else ['en']
+        self.max_entries = max_entries
+        self.entries: OrderedDict[tuple, Optional[datetime.datetime]] = OrderedDict()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='time-parser')
+        self.hits = 0
+        self.fast = 0
+        self.fallbacks = 0
+
+    def configure(self, config: dict):
+        languages = config.get('TIME_PARSER_LANGUAGES', 'en')
+        # Empty lets dateparser detect the language, which is several times slower
+        self.languages = [language.strip() for language in languages.split(',') if language.strip()] or None
+
+    async def parse(self, text: str, timezone: str) -> Optional[datetime.datetime]:
+        text = self.whitespace_pattern.sub(' ', text.strip().lower())
+        key = (text, timezone, int(time.time() // 60))
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        dt = self.parse_fast(text, pytz.timezone(timezone))
+        if dt is not None:
+            self.fast += 1
+        else:
+            self.fallbacks += 1
+            dt = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.parse_with_dateparser, text, timezone
+            )
+        self.entries[key] = dt
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return dt
+
+    @classmethod
+    def parse_fast(cls, text: str, tz: pytz.BaseTzInfo) -> Optional[datetime.datetime]:
+        m = cls.time_pattern.match(text)
+        if m is not None:
+            if m.group('day_before') is not None and m.group('day_after') is not None:
+                return None
+            if m.group('meridiem') is not None:
+                hour = int(m.group('hour12'))
+                minute = int(m.group('minute12') or 0)
+                if not 1 <= hour <= 12:
+                    return None
+                hour = hour % 12 + (12 if m.group('meridiem') == 'p' else 0)
+            else:
+                hour = int(m.group('hour24'))
+                minute = int(m.group('minute24'))
+            if hour > 23 or minute > 59:
+                return None
+            day_word = m.group('day_before') or m.group('day_after')
+            date = datetime.datetime.now(tz).date() + datetime.timedelta(days=cls.day_words.get(day_word, 0))
+            return tz.localize(datetime.datetime.combine(date, datetime.time(hour, minute)))
+        m = cls.iso_pattern.match(text)
+        if m is not None:
+            try:
+                dt = datetime.datetime(*(int(part) for part in m.groups() if part is not None))
+            except ValueError:
+                return None
+            return tz.localize(dt)
+        return None
+
+    def parse_with_dateparser(self, text: str, timezone: str) -> Optional[datetime.datetime]:
+        import dateparser
+        parser_settings = {'TIMEZONE': timezone, 'RETURN_AS_TIMEZONE_AWARE': True}
+        return dateparser.parse(text, languages=self.languages, settings=parser_settings)
+
+    def get_summary_lines(self) -> list[str]:
+        lookups = self.hits + self.fast + self.fallbacks
+        if lookups == 0:
+            return []
+        return [
+            f'Time parser: {self.hits:,}/{lookups:,} cached, {self.fast:,} regex, {self.fallbacks:,} dateparser'
+        ]
+
+
+time_parser = TimeParser()
@@ -7,6 +7,12 @@ from peewee import fn, JOIN
 
 from database.helper import gfd_database_helper
 from database.models import Activity, ActivityGame, ActivityGamePlatform
+from database.query_cache import query_cache
+from database.write_behind import write_behind
+from database.write_intents import RecordActivity
+from helpers.chart_renderer import chart_renderer
+from helpers.command_router import CommandRouter
+from helpers.message_context import MessageContext
 from logger import logger
 from plugins.base import BasePlugin
 
@@ -19,13 +25,22 @@ class ActivityTracker(BasePlugin):
         if self.is_ready():
             return
 
-    async def on_message(self, message: discord.Message):
-        if message.content.lower() == '.games':
+    def register_commands(self, router: CommandRouter):
+        router.register_command(['.games', '.games-daily', '.game', '.games-replay'], self.on_message)
+
+    async def on_message(self, message: discord.Message, context: MessageContext):
+        if context.content_lower == '.games':
             await self.post_weekly_stats(message)
             return
-        if message.content.lower() == '.games-daily':
+        if context.content_lower == '.games chart':
+            await self.post_weekly_stats(message, chart=True)
+            return
+        if context.content_lower == '.games-daily':
             await self.post_daily_stats(message)
             return
+        if context.content_lower == '.games-daily chart':
+            await self.post_daily_stats(message, chart=True)
+            return
         if message.content.startswith('.game '):
             await self.post_per_user_stats_for_game(message)
             return
@@ -38,75 +53,48 @@ class ActivityTracker(BasePlugin):
         new_game_activities = self.get_activities_filtered(after.activities)
         if not prior_game_activities and not new_game_activities:
             return
+        # Writes are applied later by the write-behind queue, the time of the change is captured now
+        timestamp = datetime.datetime.now().timestamp()
         if prior_game_activities and not new_game_activities:
             prior_game_activity = prior_game_activities[0]
-            self.close_latest_activity(before, prior_game_activity)
+            self.close_latest_activity(before, prior_game_activity, timestamp)
             return
         if prior_game_activities and new_game_activities:
             prior_game_activity = prior_game_activities[0]
             new_game_activity = new_game_activities[0]
             if prior_game_activity.name == new_game_activity.name:
                 return
-            self.close_latest_activity(before, prior_game_activity)
-            self.create_new_activity(before, new_game_activity)
+            self.close_latest_activity(before, prior_game_activity, timestamp)
+            self.create_new_activity(before, new_game_activity, timestamp)
             return
         if not prior_game_activities and new_game_activities:
             new_game_activity = new_game_activities[0]
-            self.create_new_activity(before, new_game_activity)
+            self.create_new_activity(before, new_game_activity, timestamp)
 
     @staticmethod
-    def create_new_activity(member, new_game_activity):
+    def create_new_activity(member: discord.Member, new_game_activity, timestamp: float):
         logger.info(f'Starting new activity for {member.display_name} {new_game_activity.name}')
-        gfd_database_helper.replenish_db()
-        activity_game, created = ActivityGame.get_or_create(name=new_game_activity.name)
-        activity_game_platform = None
-        if new_game_activity.platform is not None:
-            activity_game_platform, created = ActivityGamePlatform.get_or_create(name=new_game_activity.platform)
-        start_time = (
-            new_game_activity.start.timestamp()
-            if new_game_activity.start
-            else datetime.datetime.now().timestamp()
-        )
-        activity = Activity.create(
-            user_id=member.id,
-            activity_game_id=activity_game.id,
-            activity_game_platform_id=None if activity_game_platform is None else activity_game_platform.id,
-            start_time=start_time,
-        )
-        gfd_database_helper.release_db()
-        return activity
+        start_time = new_game_activity.start.timestamp() if new_game_activity.start else timestamp
+        write_behind.enqueue(RecordActivity(member.id, new_game_activity.name, new_game_activity.platform, start_time))
 
     @staticmethod
-    def close_latest_activity(member, game_activity):
+    def close_latest_activity(member: discord.Member, game_activity, timestamp: float):
         logger.info(f'Closing activity for {member.display_name} {game_activity.name}')
-        gfd_database_helper.replenish_db()
-        latest_activity: Activity = Activity.get_latest_by_user_id(member.id)
-        if (
-                latest_activity is None
-                or latest_activity.activity_game.name != game_activity.name
-                or latest_activity.end_time is not None
-        ):
-            logger.info(f'Creating shadow activity for {member.display_name} {game_activity.name}')
-            activity: Activity = ActivityTracker.create_new_activity(member, game_activity)
-            activity.end_time = datetime.datetime.now().timestamp()
-            activity.save()
-            return
-        if (
-                latest_activity is not None
-                and latest_activity.end_time is None
-                and latest_activity.activity_game.name == game_activity.name
-        ):
-            latest_activity.end_time = datetime.datetime.now().timestamp()
-            latest_activity.save()
-        gfd_database_helper.release_db()
+        # Only used if the start was missed, for a shadow activity
+        start_time = game_activity.start.timestamp() if game_activity.start else timestamp
+        write_behind.enqueue(RecordActivity(
+            member.id, game_activity.name, game_activity.platform, start_time, timestamp
+        ))
 
     @staticmethod
-    async def post_weekly_stats(message: discord.Message):
+    async def post_weekly_stats(message: discord.Message, chart=False):
         last_week = datetime.datetime.now() - timedelta(days=7)
         query = ActivityTracker.get_activities_selection_query(last_week)
-        gfd_database_helper.replenish_db()
-        results = query.dicts()
-        gfd_database_helper.release_db()
+        # Short ttl as the window moves with the clock
+        results = await query_cache.run(gfd_database_helper, ('games-week',), list, query.dicts(), ttl=60)
+        if chart:
+            await ActivityTracker.post_games_chart(message, ('games-week',), results, 'Games played this week')
+            return
         header = 'Y\'all played a lot of games this week!\n\n'
         pages = ActivityTracker.create_games_stats_text(results)
         if not pages:
@@ -118,12 +106,13 @@ class ActivityTracker(BasePlugin):
             await message.channel.send(f"Page {i}/{num_pages}\n\n{page}")
 
     @staticmethod
-    async def post_daily_stats(message: discord.Message):
+    async def post_daily_stats(message: discord.Message, chart=False):
         today = datetime.datetime.now() - timedelta(days=1)
         query = ActivityTracker.get_activities_selection_query(today)
-        gfd_database_helper.replenish_db()
-        results = query.dicts()
-        gfd_database_helper.release_db()
+        results = await query_cache.run(gfd_database_helper, ('games-day',), list, query.dicts(), ttl=60)
+        if chart:
+            await ActivityTracker.post_games_chart(message, ('games-day',), results, 'Games played today')
+            return
         header = 'Y\'all played a lot of games today!\n\n'
         pages = ActivityTracker.create_games_stats_text(results)
         if not pages:
@@ -134,6 +123,21 @@ class ActivityTracker(BasePlugin):
         for i, page in enumerate(pages[1:], start=2):
             await message.channel.send(f"Page {i}/{num_pages}\n\n{page}")
 
+    @staticmethod
+    async def post_games_chart(message: discord.Message, key: tuple, results: list[dict], title: str):
+        hours_by_game = {}
+        for result in results:
+            # Replays are split by platform, a chart shows one bar per game
+            hours_by_game[result['name']] = hours_by_game.get(result['name'], 0) + result['total_time'] / 3600
+        if not hours_by_game:
+            await message.reply('No stats to chart yet')
+            return
+        ranked = sorted(hours_by_game.items(), key=lambda item: item[1], reverse=True)
+        image_bytes = await chart_renderer.render(
+            key, results, title, [name for name, _ in ranked], [round(hours, 1) for _, hours in ranked], 'hours'
+        )
+        await message.reply(file=discord.File(image_bytes, 'games.png'))
+
     @staticmethod
     def get_activities_selection_query(last_week):
         query = (
@@ -221,9 +225,7 @@ class ActivityTracker(BasePlugin):
             .group_by(Activity.user_id, Activity.activity_game_id)
             .order_by(Activity.activity_game_id, fn.SUM(Activity.end_time - Activity.start_time).desc())
         )
-        gfd_database_helper.replenish_db()
-        results = query.dicts()
-        gfd_database_helper.release_db()
+        results = await query_cache.run(gfd_database_helper, ('game', game_name.lower()), list, query.dicts())
         if len(results) == 0:
             await message.reply(f'I did not find anything for **{game_name}**!')
             return
@@ -280,9 +282,15 @@ class ActivityTracker(BasePlugin):
                       fn.SUM(Activity.end_time - Activity.start_time).desc())
         )
 
-        gfd_database_helper.replenish_db()
-        results = query.dicts()
-        gfd_database_helper.release_db()
+        results = await query_cache.run(
+            gfd_database_helper, ('games-replay', target_user.id, year_to_check), list, query.dicts()
+        )
+        if message.content.lower().endswith(' chart'):
+            await ActivityTracker.post_games_chart(
+                message, ('games-replay', target_user.id, year_to_check), results,
+                f'{target_user.display_name}\'s games in {year_to_check}'
+            )
+            return
 
         header = f'🎮Here is the gaming replay for <@{target_user.id}> for {year_to_check}:\n\n'
         pages = ActivityTracker.create_games_stats_text(results)
@@ -1,3 +1,5 @@
+from helpers.command_router import CommandRouter
+from helpers.message_context import MessageContext
 from plugins.base import BasePlugin
 
 
@@ -11,12 +13,15 @@ class AnonMessenger(BasePlugin):
             self.anon_msg_channel_id = None
         self.anon_msg_channel = None
 
-    async def on_message(self, message):
+    def register_private_commands(self, router: CommandRouter):
+        router.register_command('.say', self.on_message)
+
+    async def on_message(self, message, context: MessageContext):
         if not self.anon_msg_channel_id:
             return
         if not self.anon_msg_channel:
             self.anon_msg_channel = self.client.get_channel(self.anon_msg_channel_id)
-        if not message.content.lower().startswith('.say '):
+        if not context.content_lower.startswith('.say '):
             return
         message_content = 'Somebody says:\n>>> ' + message.content[5:]
         await self.anon_msg_channel.send(message_content)
@@ -11,11 +11,16 @@ import peewee
 
 from database.helper import gfd_database_helper
 from database.models import BannedBannerMessage
+from helpers.command_router import CommandRouter
+from helpers.message_context import MessageContext
+from helpers.plugin_metrics import plugin_metrics
 from logger import logger
 from plugins.base import BasePlugin
 
 
 class BannerRandomizer(BasePlugin):
+    banner_commands = ('.banner', '.unbanner', '.shuffle')
+
     def __init__(self, client, config):
         super().__init__(client, config)
         self.banner_source_channel: Optional[discord.TextChannel] = None
@@ -50,18 +55,19 @@ class BannerRandomizer(BasePlugin):
             )
         self.start_runner()
 
-    async def on_message(self, message: discord.Message):
-        message_content_lower = message.content.lower()
+    def register_commands(self, router: CommandRouter):
+        router.register_command(self.banner_commands, self.on_message)
+        router.observe_all(self.observe_message)
+
+    async def on_message(self, message: discord.Message, context: MessageContext):
+        message_content_lower = context.content_lower
         if message_content_lower == '.banner':
             if self.last_banner_message is None:
                 return
-            gfd_database_helper.replenish_db()
             try:
-                BannedBannerMessage.create(message_id=self.last_banner_message.id)
+                await gfd_database_helper.run(BannedBannerMessage.create, message_id=self.last_banner_message.id)
             except peewee.PeeweeException:
                 return
-            finally:
-                gfd_database_helper.release_db()
             self.last_banned_message = self.last_banner_message
             self.last_ban_time = time.time()
             logger.info("Banned banner message " + str(self.last_banner_message.id))
@@ -75,16 +81,12 @@ class BannerRandomizer(BasePlugin):
             if self.last_banned_message is None or time.time() - self.last_ban_time > 120:
                 await message.reply('I barely knew her!')
                 return
-            gfd_database_helper.replenish_db()
-            try:
-                BannedBannerMessage.delete() \
-                    .where(BannedBannerMessage.message_id == self.last_banned_message.id) \
-                    .execute()
-                await message.reply(f"{self.last_banned_message.jump_url} has been unbanned")
-                self.last_ban_time = None
-                self.last_banned_message = None
-            finally:
-                gfd_database_helper.release_db()
+            query = BannedBannerMessage.delete() \
+                .where(BannedBannerMessage.message_id == self.last_banned_message.id)
+            await gfd_database_helper.run(query.execute)
+            await message.reply(f"{self.last_banned_message.jump_url} has been unbanned")
+            self.last_ban_time = None
+            self.last_banned_message = None
         elif message_content_lower == '.shuffle':
             current_timestamp = int(time.time())
             author_id = message.author.id
@@ -95,7 +97,12 @@ class BannerRandomizer(BasePlugin):
             self.user_last_shuffle_time[author_id] = current_timestamp
             self.restart_runner()
             await message.reply('I\'ve jazzed it up 🎲')
-        elif 'banner?' in message_content_lower:
+
+    async def observe_message(self, message: discord.Message, context: MessageContext):
+        message_content_lower = context.content_lower
+        if message_content_lower in self.banner_commands:
+            return
+        if 'banner?' in message_content_lower:
             await message.reply(f'The banner is {self.last_banner_message.jump_url}')
         elif 'banners?' in message_content_lower:
             message_parts = ['These are the last 5 banners:']
@@ -105,45 +112,47 @@ class BannerRandomizer(BasePlugin):
     async def run(self):
         epoch_from = self.banner_from_epoch
         while True:
-            search_date = datetime.datetime.fromtimestamp(randrange(epoch_from, int(time.time())))
-            banner_set = False
-            async for message in self.banner_source_channel.history(around=search_date):
-                if len(message.attachments) < 1:
-                    continue
-                if message.author.id in self.banned_message_author_ids:
-                    continue
-                filtered_attachments = list(
-                    filter(lambda x: x.content_type.startswith('image'), message.attachments)
-                )
-                gfd_database_helper.replenish_db()
-                banned_message = BannedBannerMessage.get_by_message_id(message.id)
-                gfd_database_helper.release_db()
-                if banned_message is not None:
-                    continue
-                while True:
-                    if len(filtered_attachments) < 1:
-                        break
-                    if len(filtered_attachments) > 1:
-                        attachment_index = random.randrange(0, len(filtered_attachments) - 1)
-                    else:
-                        attachment_index = 0
-                    attachment: discord.Attachment = filtered_attachments.pop(attachment_index)
-                    logger.debug("Setting banner to " + attachment.url)
-                    try:
-                        await self.client.guilds[0].edit(banner=await attachment.read())
-                        banner_set = True
-                        self.last_banner_message = message
-                        self.banner_history.insert(0, attachment.url)
-                        self.banner_history = self.banner_history[0:5]
-                        break
-                    except Exception as e:
-                        logger.error('Failed to set banner, ' + str(e))
-                if banner_set:
-                    break
+            with plugin_metrics.measure(self.__class__.__name__, 'run'):
+                await self.set_random_banner(epoch_from)
             await asyncio.sleep(self.banner_update_frequency)
 
+    async def set_random_banner(self, epoch_from):
+        search_date = datetime.datetime.fromtimestamp(randrange(epoch_from, int(time.time())))
+        banner_set = False
+        async for message in self.banner_source_channel.history(around=search_date):
+            if len(message.attachments) < 1:
+                continue
+            if message.author.id in self.banned_message_author_ids:
+                continue
+            filtered_attachments = list(
+                filter(lambda x: x.content_type.startswith('image'), message.attachments)
+            )
+            banned_message = await gfd_database_helper.run(BannedBannerMessage.get_by_message_id, message.id)
+            if banned_message is not None:
+                continue
+            while True:
+                if len(filtered_attachments) < 1:
+                    break
+                if len(filtered_attachments) > 1:
+                    attachment_index = random.randrange(0, len(filtered_attachments) - 1)
+                else:
+                    attachment_index = 0
+                attachment: discord.Attachment = filtered_attachments.pop(attachment_index)
+                logger.debug("Setting banner to " + attachment.url)
+                try:
+                    await self.client.guilds[0].edit(banner=await attachment.read())
+                    banner_set = True
+                    self.last_banner_message = message
+                    self.banner_history.insert(0, attachment.url)
+                    self.banner_history = self.banner_history[0:5]
+                    break
+                except Exception as e:
+                    logger.error('Failed to set banner, ' + str(e))
+            if banner_set:
+                break
+
     def start_runner(self):
-        self.run_task = asyncio.get_event_loop().create_task(self.run())
+        self.run_task = self.start_task(self.run())
 
     def restart_runner(self):
         self.run_task.cancel()
@@ -1,15 +1,58 @@
+import asyncio
+from typing import Coroutine, Optional
+
 import discord
 
+from helpers.command_router import CommandRouter
+
 
 class BasePlugin:
+    handler_timeout: Optional[float] = None
+    # Plugins whose on_ready was never wired up set this to False to keep it that way
+    calls_on_ready = True
 
     def __init__(self, client, config):
         self.started = False
         self.client: discord.Client = client
         self.config = config
+        self.tasks: set[asyncio.Task] = set()
 
     def is_ready(self):
         if self.started:
             return self.started
         self.started = True
         return False
+
+    def on_ready(self):
+        pass
+
+    async def on_start(self):
+        """
+        Runs once, after the client is ready for the first time.
+        """
+        pass
+
+    async def on_stop(self):
+        """
+        Runs once on shutdown after events have stopped being dispatched, anything the plugin buffers should be
+        flushed here. Cancels the tasks started with `start_task`.
+        """
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def start_task(self, coroutine: Coroutine) -> asyncio.Task:
+        """
+        Starts a background loop that is cancelled when the plugin stops.
+        """
+        task = asyncio.get_event_loop().create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def register_commands(self, router: CommandRouter):
+        pass
+
+    def register_private_commands(self, router: CommandRouter):
+        pass
@@ -1,3 +1,5 @@
+from helpers.command_router import CommandRouter
+from helpers.message_context import MessageContext
 from logger import logger
 from plugins.base import BasePlugin
 
@@ -13,7 +15,10 @@ class CommentHearter(BasePlugin):
         if 'HEART_CHANNELS' in self.config:
             self.auto_like_channels = self.config['HEART_CHANNELS'].split(',')
 
-    async def on_message(self, message):
+    def register_commands(self, router: CommandRouter):
+        router.observe_all(self.on_message)
+
+    async def on_message(self, message, context: MessageContext):
         if str(message.channel.id) in self.auto_like_channels:
             await self.like_message(message)
 
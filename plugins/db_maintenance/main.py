@@ -0,0 +1,61 @@
+import asyncio
+import datetime
+import time
+
+from database.helper import database_helpers
+from helpers.plugin_metrics import plugin_metrics
+from logger import logger
+from plugins.base import BasePlugin
+
+
+class DatabaseMaintenance(BasePlugin):
+    """
+    Runs PRAGMA optimize, ANALYZE and incremental vacuum on every database once a day between
+    DB_MAINTENANCE_HOURS_START and DB_MAINTENANCE_HOURS_END, a database is skipped if the window closes before its turn.
+    """
+
+    def __init__(self, client, config):
+        super().__init__(client, config)
+        self.maintenance_hours_start = int(self.config.get('DB_MAINTENANCE_HOURS_START') or 4)
+        self.maintenance_hours_end = int(self.config.get('DB_MAINTENANCE_HOURS_END') or 6)
+
+    async def on_start(self):
+        self.start_task(self.run())
+
+    async def run(self):
+        while True:
+            try:
+                sleep_seconds = self.get_seconds_until_hour(self.maintenance_hours_start)
+                logger.debug(f'Waiting {sleep_seconds} for database maintenance')
+                await asyncio.sleep(sleep_seconds)
+                with plugin_metrics.measure(self.__class__.__name__, 'run'):
+                    await self.run_maintenance()
+                await asyncio.sleep(60)
+            except Exception as e:
+                logger.error('Database maintenance failed, ' + str(e))
+
+    def is_in_quiet_hours(self) -> bool:
+        hour = datetime.datetime.now().hour
+        if self.maintenance_hours_start <= self.maintenance_hours_end:
+            return self.maintenance_hours_start <= hour < self.maintenance_hours_end
+        return hour >= self.maintenance_hours_start or hour < self.maintenance_hours_end
+
+    async def run_maintenance(self):
+        for helper in database_helpers:
+            database_file = helper.db_conn.database
+            if not self.is_in_quiet_hours():
+                logger.info(f'Skipping maintenance for {database_file}, outside of quiet hours')
+                continue
+            start = time.perf_counter()
+            timings = await helper.run_maintenance()
+            total_ms = (time.perf_counter() - start) * 1000
+            steps = ', '.join(f'{sql} {elapsed_ms:.0f}ms' for sql, elapsed_ms in timings)
+            logger.info(f'Maintenance for {database_file} took {total_ms:.0f}ms ({steps})')
+
+    @staticmethod
+    def get_seconds_until_hour(hour):
+        now = datetime.datetime.now()
+        day_delta = datetime.timedelta(hours=24)
+        target_hour = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+        target_delta = day_delta - (now - target_hour)
+        return int(target_delta.total_seconds() % (24 * 3600))
@@ -8,6 +8,11 @@ import discord
 
 from database.helper import gfd_database_helper
 from database.models import User, DuckAttemptLog
+from database.query_cache import query_cache
+from database.write_behind import write_behind
+from database.write_intents import IncrementUserCounter, InsertRow
+from helpers.command_router import CommandRouter
+from helpers.message_context import MessageContext
 from logger import logger
 from plugins.base import BasePlugin
 
@@ -65,10 +70,14 @@ class DuckHuntGame(BasePlugin):
         # if 'DUCK_CHANNELS' in self.config:
         #     asyncio.get_event_loop().create_task(self.duck_spawner())
 
-    async def on_message(self, message):
-        lower_case_message = message.content.lower()
+    def register_commands(self, router: CommandRouter):
+        router.register_command(self.all_duck_commands, self.on_message)
+        router.observe_all(self.count_message)
+
+    async def on_message(self, message, context: MessageContext):
+        lower_case_message = context.content_lower
         if lower_case_message in self.all_duck_commands:
-            user = self.get_duck_user_from_message_author(message.author)
+            user = await self.get_duck_user_from_message_author(message.author)
             if lower_case_message == '.fam':
                 await self.print_duck_family_or_pgtips_gif(message, user)
             elif lower_case_message == '.graves':
@@ -93,6 +102,9 @@ class DuckHuntGame(BasePlugin):
                 elif self.should_miss_attempt(user):
                     return await self.post_duck_miss_message(user, message, 'shoo')
                 await self.shoo_duck_for_user(user, message)
+
+    async def count_message(self, message, context: MessageContext):
+        if context.content_lower in self.all_duck_commands:
             return
         if str(message.channel.id) not in self.channels_to_release_in:
             return
@@ -124,9 +136,7 @@ class DuckHuntGame(BasePlugin):
     async def befriend_duck_for_user(self, user, message):
         self.current_duck_channel = None
         time_to_befriend = math.floor(time.time() - self.last_duck_spawn_time)
-        gfd_database_helper.replenish_db()
-        user.add_duck_friend()
-        gfd_database_helper.release_db()
+        self.increment_user_counter(user, User.ducks_befriended)
         message_parts = [
             '<@{}> You befriended a duck in {} seconds!'.format(message.author.id, time_to_befriend),
             'You now have {} lil duckie friends.'.format(user.ducks_befriended)
@@ -137,9 +147,7 @@ class DuckHuntGame(BasePlugin):
     async def kill_duck_for_user(self, user, message):
         self.current_duck_channel = None
         time_to_befriend = math.floor(time.time() - self.last_duck_spawn_time)
-        gfd_database_helper.replenish_db()
-        user.add_duck_kill()
-        gfd_database_helper.release_db()
+        self.increment_user_counter(user, User.ducks_killed)
         message_parts = [
             '<@{}> You shot a duck in {} seconds!'.format(message.author.id, time_to_befriend),
             'You have shot {} lil ducks.'.format(user.ducks_killed)
@@ -150,9 +158,7 @@ class DuckHuntGame(BasePlugin):
     async def shoo_duck_for_user(self, user, message):
         self.current_duck_channel = None
         time_to_shoo = math.floor(time.time() - self.last_duck_spawn_time)
-        gfd_database_helper.replenish_db()
-        user.add_duck_shoo()
-        gfd_database_helper.release_db()
+        self.increment_user_counter(user, User.ducks_shooed)
         message_parts = [
             '<@{}> You shooed a duck away in {} seconds!'.format(message.author.id, time_to_shoo),
             'Good luck, duck!'
@@ -161,17 +167,21 @@ class DuckHuntGame(BasePlugin):
         await message.channel.send(response_message)
 
     async def print_duck_statistics(self, channel):
-        gfd_database_helper.replenish_db()
         befriended_ducks_map = {}
         killed_ducks_map = {}
         shooed_ducks_map = {}
         shooed_ducks_count = 0
-        for user in User.select():
-            befriended_ducks_map[user.user_id] = user.ducks_befriended
-            killed_ducks_map[user.user_id] = user.ducks_killed
-            shooed_ducks_map[user.user_id] = user.ducks_shooed
-            shooed_ducks_count += user.ducks_shooed
-        gfd_database_helper.release_db()
+        query = User.select(User.user_id, User.ducks_befriended, User.ducks_killed, User.ducks_shooed).tuples()
+        # Cached rows are shared, queued increments are added on top of copies
+        for user_id, befriended, killed, shooed in await query_cache.run(
+                gfd_database_helper, ('duck-stats',), list, query
+        ):
+            befriended_ducks_map[user_id] = befriended + IncrementUserCounter.get_pending_count(
+                user_id, User.ducks_befriended
+            )
+            killed_ducks_map[user_id] = killed + IncrementUserCounter.get_pending_count(user_id, User.ducks_killed)
+            shooed_ducks_map[user_id] = shooed + IncrementUserCounter.get_pending_count(user_id, User.ducks_shooed)
+            shooed_ducks_count += shooed_ducks_map[user_id]
         ducks_users = []
         for member in channel.members:
             if self.client.user.id == member.id or member.bot:
@@ -200,20 +210,30 @@ class DuckHuntGame(BasePlugin):
         chance = self.calculate_hit_chance(user)
         randomval = system_random_generator.random()
         logger.debug(f'Random value: {randomval} chance: {chance}')
-        gfd_database_helper.replenish_db()
         if not randomval <= chance:
             self.current_miss_count[user.user_id] = current_miss_count_for_user + 1
-            DuckAttemptLog.create_attempt(user.user_id, chance, randomval, True)
-            gfd_database_helper.release_db()
+            self.log_attempt(user, chance, randomval, True)
             return True
-        DuckAttemptLog.create_attempt(user.user_id, chance, randomval, False)
-        gfd_database_helper.release_db()
+        self.log_attempt(user, chance, randomval, False)
         return False
 
-    def get_duck_user_from_message_author(self, author):
-        gfd_database_helper.replenish_db()
-        user = User.get_by_author(author)
-        gfd_database_helper.release_db()
+    @staticmethod
+    def log_attempt(user, chance, random_val, missed):
+        write_behind.enqueue(InsertRow(gfd_database_helper, DuckAttemptLog, {
+            'user_id': user.user_id,
+            'chance': chance,
+            'random_val': random_val,
+            'missed': missed,
+        }))
+
+    @staticmethod
+    def increment_user_counter(user, field):
+        setattr(user, field.name, getattr(user, field.name) + 1)
+        write_behind.enqueue(IncrementUserCounter(user.user_id, field))
+
+    async def get_duck_user_from_message_author(self, author):
+        user = await gfd_database_helper.run(User.get_by_author, author)
+        IncrementUserCounter.add_pending(user)
         return user
 
     def calculate_hit_chance(self, user):
@@ -6,11 +6,14 @@ import peewee
 
 from database.helper import gfd_database_helper
 from database.models import GiftySanta as GiftySantaDbModel, GiftySantaAssignment
+from helpers.command_router import CommandRouter
+from helpers.message_context import MessageContext
 from plugins.base import BasePlugin
 
 
 class GiftySanta(BasePlugin):
     no_gifty_message = 'There is no gifty santa in progress for that to work!'
+    handler_timeout = 300
 
     def __init__(self, client, config):
         super().__init__(client, config)
@@ -22,19 +25,24 @@ class GiftySanta(BasePlugin):
         self.gifty_channel: Optional[discord.TextChannel] = None
         self.current_gifty_santa: Optional[GiftySantaDbModel] = None
 
-    async def on_message(self, message: discord.Message):
+    def register_commands(self, router: CommandRouter):
+        router.register_command(['.start-santa', '.end-santa', '.assign-santas', '.reveal-gift'], self.on_message)
+
+    def register_private_commands(self, router: CommandRouter):
+        router.register_command('.set-gift', self.on_message)
+
+    async def on_message(self, message: discord.Message, context: MessageContext):
         if not self.gifty_channel:
             self.gifty_channel = self.client.get_channel(self.gifty_channel_id)
-        is_private = message.channel.type == discord.ChannelType.private
-        if is_private:
-            await self.on_message_private(message)
+        if context.is_private:
+            await self.on_message_private(message, context)
             return
         if message.channel.id != self.gifty_channel_id:
             return
-        await self.on_message_channel(message)
+        await self.on_message_channel(message, context)
 
-    async def on_message_private(self, message: discord.Message):
-        if message.content.lower().startswith('.set-gift'):
+    async def on_message_private(self, message: discord.Message, context: MessageContext):
+        if context.content_lower.startswith('.set-gift'):
             await self.set_gift(message)
 
     async def set_gift(self, message: discord.Message):
@@ -42,27 +50,25 @@ class GiftySanta(BasePlugin):
         if len(gift_name) < 1:
             await message.reply('Gift must be specified!')
             return
-        self.load_current_gifty_santa()
+        await self.load_current_gifty_santa()
         if self.current_gifty_santa is None:
             await message.reply(self.no_gifty_message)
             return
-        gfd_database_helper.replenish_db()
-        assignment: GiftySantaAssignment = GiftySantaAssignment.get_or_none(
+        assignment: GiftySantaAssignment = await gfd_database_helper.run(
+            GiftySantaAssignment.get_or_none,
             GiftySantaAssignment.gift_santa_id == self.current_gifty_santa.id,
             GiftySantaAssignment.santa_user_id == message.author.id,
         )
         if assignment is None:
-            gfd_database_helper.release_db()
             await message.reply('Santas have not been assigned yet!')
         else:
             is_setting = assignment.gift_name is None
             assignment.gift_name = gift_name
-            assignment.save()
-            gfd_database_helper.release_db()
+            await gfd_database_helper.run(assignment.save)
             await message.reply('Gift has been set!' if is_setting else 'Gift has been updated!')
 
-    async def on_message_channel(self, message: discord.Message):
-        message_lower = message.content.lower()
+    async def on_message_channel(self, message: discord.Message, context: MessageContext):
+        message_lower = context.content_lower
         if message_lower.startswith('.start-santa'):
             await self.start_gifty_santa(message)
         elif message_lower.startswith('.end-santa'):
@@ -77,30 +83,26 @@ class GiftySanta(BasePlugin):
         if len(name) < 1:
             await message.reply('A name must be provided!')
             return
-        self.load_current_gifty_santa()
+        await self.load_current_gifty_santa()
         if self.current_gifty_santa is not None:
             await message.reply(f'There is another gifty santa in progress! **{self.current_gifty_santa.name}**')
             return
-        gfd_database_helper.replenish_db()
-        self.current_gifty_santa = GiftySantaDbModel.create(name=name)
-        gfd_database_helper.release_db()
+        self.current_gifty_santa = await gfd_database_helper.run(GiftySantaDbModel.create, name=name)
         await message.reply(f"A new gifty santa has started 🎅\nUse `.assign-santas` when ready!")
 
     async def end_gifty_santa(self, message: discord.Message):
-        self.load_current_gifty_santa()
+        await self.load_current_gifty_santa()
         if self.current_gifty_santa is None:
             await message.reply('There is no gifty santa in progress!\nAnd I can\'t actually murder santas!')
             return
         old_name = self.current_gifty_santa.name
-        gfd_database_helper.replenish_db()
         self.current_gifty_santa.is_complete = True
-        self.current_gifty_santa.save()
-        gfd_database_helper.release_db()
+        await gfd_database_helper.run(self.current_gifty_santa.save)
         self.current_gifty_santa = None
         await message.reply(f'Gifty santa **{old_name}** has concluded 🎅\nThanks everyone for participating!')
 
     async def assign_santas(self, message: discord.Message):
-        self.load_current_gifty_santa()
+        await self.load_current_gifty_santa()
         if self.current_gifty_santa is None:
             await message.reply(self.no_gifty_message)
             return
@@ -111,8 +113,7 @@ class GiftySanta(BasePlugin):
             members = self.gifty_channel.members
         channel_members_without_me = list(filter(lambda x: x.id != self.client.user.id, members))
         picked = set()
-        gfd_database_helper.replenish_db()
-        is_reassigned = False
+        giftees = {}
         for member in channel_members_without_me:
             while True:
                 giftee = random.choice(channel_members_without_me)
@@ -120,46 +121,50 @@ class GiftySanta(BasePlugin):
                     continue
                 picked.add(giftee.id)
                 break
+            giftees[member] = giftee
+        is_reassigned = await gfd_database_helper.atomic(self.save_assignments, giftees)
+        for member, giftee in giftees.items():
+            channel = await member.create_dm()
+            await channel.send(f'Your giftee for **{self.current_gifty_santa.name}** is **{giftee.display_name}**!')
+        await message.reply('Santas have been re-assigned!' if is_reassigned else 'Santas have been assigned!')
+
+    def save_assignments(self, giftees: dict[discord.Member, discord.Member]) -> bool:
+        is_reassigned = False
+        for member, giftee in giftees.items():
             assignment: GiftySantaAssignment
             created: bool
             assignment, created = GiftySantaAssignment.get_or_create(
                 gift_santa_id=self.current_gifty_santa.id,
                 santa_user_id=member.id,
-                giftee_user_id=giftee.id
+                defaults={'giftee_user_id': giftee.id}
             )
             if not created:
                 is_reassigned = True
                 assignment.giftee_user_id = giftee.id
                 assignment.save()
-
-            channel = await member.create_dm()
-            await channel.send(f'Your giftee for **{self.current_gifty_santa.name}** is **{giftee.display_name}**!')
-        gfd_database_helper.release_db()
-        await message.reply('Santas have been re-assigned!' if is_reassigned else 'Santas have been assigned!')
+        return is_reassigned
 
     async def reveal_gift(self, message):
-        self.load_current_gifty_santa()
+        await self.load_current_gifty_santa()
         if self.current_gifty_santa is None:
             await message.reply(self.no_gifty_message)
             return
-        gfd_database_helper.replenish_db()
         query = GiftySantaAssignment.select() \
             .where(GiftySantaAssignment.is_revealed == False, GiftySantaAssignment.gift_name != None) \
             .order_by(peewee.fn.Random()) \
             .limit(1)
-        assignment: GiftySantaAssignment = query.get_or_none()
+        assignment: GiftySantaAssignment = await gfd_database_helper.run(query.get_or_none)
         if assignment is None:
-            gfd_database_helper.release_db()
             await message.reply('No pending reveals!')
         else:
             await message.reply(f'The gift for <@{assignment.giftee_user_id}> is **{assignment.gift_name}**')
             assignment.is_revealed = True
-            assignment.save()
-            gfd_database_helper.release_db()
+            await gfd_database_helper.run(assignment.save)
 
-    def load_current_gifty_santa(self):
+    async def load_current_gifty_santa(self):
         if self.current_gifty_santa is not None:
             return
-        gfd_database_helper.replenish_db()
-        self.current_gifty_santa = GiftySantaDbModel.get_or_none(GiftySantaDbModel.is_complete == False)
-        gfd_database_helper.release_db()
+        self.current_gifty_santa = await gfd_database_helper.run(
+            GiftySantaDbModel.get_or_none,
+            GiftySantaDbModel.is_complete == False
+        )
@@ -5,12 +5,13 @@ import random
 import re
 
 import discord
-from google import genai
-from google.genai import types as gtypes
-from google.genai.errors import APIError
 
 import database.helper
 from database.models import GeneratedImageLog
+from helpers.command_router import CommandRouter
+from helpers.gen_ai import get_gen_ai_client
+from helpers.message_cache import message_cache
+from helpers.message_context import MessageContext
 from helpers.message_utils import mention_no_one, escape_discord_identifiers, get_image_attachment_count
 from logger import logger
 from plugins.base import BasePlugin
@@ -37,10 +38,10 @@ class RateLimit:
 
 class Hallucinater(BasePlugin):
     ask_later = 'Ask me again later!'
+    handler_timeout = 180
 
     def __init__(self, client, config):
         super().__init__(client, config)
-        self.gen_ai_client = genai.Client(api_key=config.get('GEMINI_KEY'))
         self.rate_limiter: dict[int, RateLimit] = {}
         self.img_gen_count_max_per_month = int(self.config.get('IMG_GEN_COUNT_MAX_PER_MONTH', 100))
         self.bot_nick_name = self.config.get('BOT_NICK_NAME')
@@ -48,10 +49,19 @@ class Hallucinater(BasePlugin):
         self.ai_random_available_from = None
         self.ai_random_available_to = None
 
-    async def on_message(self, message: discord.Message):
+    @property
+    def gen_ai_client(self):
+        return get_gen_ai_client(self.config)
+
+    def register_commands(self, router: CommandRouter):
+        router.register_command('.genimg', self.on_message)
+        if self.bot_nick_name:
+            router.register_prefix(f'{self.bot_nick_name}, ', self.on_message)
+
+    async def on_message(self, message: discord.Message, context: MessageContext):
         user_id = message.author.id
         self.rate_limiter.setdefault(user_id, RateLimit())
-        if message.content.lower().startswith('.genimg '):
+        if context.content_lower.startswith('.genimg '):
             if self.ai_random_available and not self.is_ai_available():
                 await self.respond_ai_not_available(message)
                 return
@@ -60,7 +70,7 @@ class Hallucinater(BasePlugin):
                 return
             await self.respond_to_gen_img_prompt(message, message.content[8:])
             return
-        if not message.content.lower().startswith(f'{self.bot_nick_name}, '):
+        if not context.content_lower.startswith(f'{self.bot_nick_name}, '):
             return
         if self.ai_random_available and not self.is_ai_available():
             await self.respond_ai_not_available(message)
@@ -72,7 +82,7 @@ class Hallucinater(BasePlugin):
         limit = 30
         replied_to_message = None
         if message.reference is not None and isinstance(message.reference, discord.MessageReference):
-            replied_to_message = await message.channel.fetch_message(message.reference.message_id)
+            replied_to_message = await message_cache.get_referenced_message(message.channel, message.reference)
             if get_image_attachment_count(replied_to_message) > 0:
                 limit = 5
             else:
@@ -84,6 +94,7 @@ class Hallucinater(BasePlugin):
         await self.respond_to_prompt(message, replied_to_message, user_prompt)
 
     async def respond_to_prompt(self, message: discord.Message, replied_to_message: discord.Message, user_prompt):
+        from google.genai import types as gtypes
         contents = []
         if replied_to_message is not None and len(replied_to_message.attachments) > 0:
             for attachment in replied_to_message.attachments:
@@ -99,9 +110,7 @@ class Hallucinater(BasePlugin):
                 contents.append(gtypes.Part.from_bytes(data=img_bytes, mime_type=attachment.content_type))
         contents.append(user_prompt)
         response_modalities = ['TEXT']
-        database.helper.gfd_database_helper.replenish_db()
-        total_generated_images = GeneratedImageLog.get_count()
-        database.helper.gfd_database_helper.release_db()
+        total_generated_images = await database.helper.gfd_database_helper.run(GeneratedImageLog.get_count)
         if total_generated_images < self.img_gen_count_max_per_month:
             response_modalities.append('IMAGE')
         try:
@@ -124,9 +133,7 @@ class Hallucinater(BasePlugin):
                         img_bytes.seek(0)
                         files.append(discord.File(img_bytes, 'generated_image.png'))
             if files:
-                database.helper.gfd_database_helper.replenish_db()
-                GeneratedImageLog.increment_count(len(files))
-                database.helper.gfd_database_helper.release_db()
+                await database.helper.gfd_database_helper.run(GeneratedImageLog.increment_count, len(files))
                 texts.append(
                     f'Monthly image gen usage: {total_generated_images + len(files)}/{self.img_gen_count_max_per_month}'
                 )
@@ -142,12 +149,12 @@ class Hallucinater(BasePlugin):
             return
 
     async def respond_to_gen_img_prompt(self, message, user_prompt):
+        from google.genai import types as gtypes
+        from google.genai.errors import APIError
         if user_prompt == '':
             await message.reply('I need something to work with!')
             return
-        database.helper.gfd_database_helper.replenish_db()
-        total_generated_images = GeneratedImageLog.get_count()
-        database.helper.gfd_database_helper.release_db()
+        total_generated_images = await database.helper.gfd_database_helper.run(GeneratedImageLog.get_count)
         if not total_generated_images < self.img_gen_count_max_per_month:
             await message.reply('Image generation limit reached for this month! Try again later.')
             return
@@ -172,9 +179,7 @@ class Hallucinater(BasePlugin):
                     content=f'Here you go! Monthly usage: {total_generated_images + 1}/{self.img_gen_count_max_per_month}',
                     file=discord.File(img_bytes, 'image.png')
                 )
-            database.helper.gfd_database_helper.replenish_db()
-            GeneratedImageLog.increment_count()
-            database.helper.gfd_database_helper.release_db()
+            await database.helper.gfd_database_helper.run(GeneratedImageLog.increment_count)
             self.rate_limiter[message.author.id].increment()
         except APIError as e:
             logger.error(str(e))
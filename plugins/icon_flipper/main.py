@@ -3,8 +3,8 @@ import datetime
 import io
 
 import discord
-from PIL import Image
 
+from helpers.plugin_metrics import plugin_metrics
 from logger import logger
 from plugins.base import BasePlugin
 
@@ -24,7 +24,7 @@ class IconFlipper(BasePlugin):
             self.icon_flipper_hours_end = int(self.config['ICON_FLIPPER_HOURS_END'])
         else:
             return
-        asyncio.get_event_loop().create_task(self.run())
+        self.start_task(self.run())
 
     async def run(self):
         while True:
@@ -35,16 +35,19 @@ class IconFlipper(BasePlugin):
                     logger.debug(f'Waiting {sleep_seconds} to flip the image')
                     await asyncio.sleep(sleep_seconds)
                     logger.debug('Flipping the channel icon')
-                    await self.flip_channel_icon()
+                    with plugin_metrics.measure(self.__class__.__name__, 'run'):
+                        await self.flip_channel_icon()
                 logger.debug(f'Waiting {flip_back_sleep_seconds} to flip the image back')
                 await asyncio.sleep(flip_back_sleep_seconds)
                 logger.debug('Flipping the channel icon back')
-                await self.flip_channel_icon()
+                with plugin_metrics.measure(self.__class__.__name__, 'run'):
+                    await self.flip_channel_icon()
             except Exception as e:
                 logger.error('Exception while sleeping for flipper, ' + str(e))
                 pass
 
     async def flip_channel_icon(self):
+        from PIL import Image
         icon_bytes = io.BytesIO()
         icon_bytes_flipped = io.BytesIO()
         guild: discord.Guild = self.client.guilds[0]
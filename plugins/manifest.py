@@ -0,0 +1,60 @@
+import importlib
+import time
+
+from logger import logger
+from plugins.base import BasePlugin
+
+# Plugins in the order they see messages, the key is what goes into ENABLED_PLUGINS
+PLUGIN_MANIFEST = {
+    'gifty_santa': 'plugins.gifty_santa.main.GiftySanta',
+    'smoothie_maker': 'plugins.smoothie_maker.main.SmoothieMaker',
+    'comment_hearter': 'plugins.comment_hearter.main.CommentHearter',
+    'duckhunt': 'plugins.duckhunt.main.DuckHuntGame',
+    'user_silencer': 'plugins.user_silencer.main.UserSilencer',
+    'time_assistant': 'plugins.time_assistant.main.TimeAssistant',
+    'repost_watcher': 'plugins.repost_watcher.main.RepostWatcher',
+    'user_message_responder': 'plugins.user_message_responder.main.UserMessageResponder',
+    'banner_randomizer': 'plugins.banner_randomizer.main.BannerRandomizer',
+    'reaction_tracker': 'plugins.reaction_tracker.main.ReactionTracker',
+    'activity_tracker': 'plugins.activity_tracker.main.ActivityTracker',
+    'hallucinater': 'plugins.hallucinater.main.Hallucinater',
+    'text_to_reaction': 'plugins.text_to_reaction.main.TextToReaction',
+    'message_statistics_tracker': 'plugins.message_statistics_tracker.main.MessageStatisticsTracker',
+    'anon_messenger': 'plugins.anon_messenger.main.AnonMessenger',
+    'whos_that_monster': 'plugins.whos_that_monster.main.WhosThatMonster',
+    'youtube_announcer': 'plugins.youtube_announcer.main.YoutubeAnnouncer',
+    'twitch_announcer': 'plugins.twitch_announcer.main.TwitchAnnouncer',
+    'voice_announcer': 'plugins.voice_announcer.main.VoiceAnnouncer',
+    'icon_flipper': 'plugins.icon_flipper.main.IconFlipper',
+    'plugin_stats': 'plugins.plugin_stats.main.PluginStats',
+    'db_maintenance': 'plugins.db_maintenance.main.DatabaseMaintenance',
+}
+
+
+def get_enabled_plugin_names(config: dict) -> list[str]:
+    if not config.get('ENABLED_PLUGINS'):
+        return list(PLUGIN_MANIFEST)
+    enabled = set(map(lambda x: x.strip(), config['ENABLED_PLUGINS'].split(',')))
+    unknown = enabled - PLUGIN_MANIFEST.keys()
+    if unknown:
+        raise Exception('Unknown plugins in ENABLED_PLUGINS: ' + ', '.join(sorted(unknown)))
+    return [name for name in PLUGIN_MANIFEST if name in enabled]
+
+
+def load_plugins(client, config: dict) -> list[BasePlugin]:
+    plugins = []
+    report = []
+    startup_start = time.perf_counter()
+    for name in get_enabled_plugin_names(config):
+        module_name, class_name = PLUGIN_MANIFEST[name].rsplit('.', 1)
+        import_start = time.perf_counter()
+        plugin_class = getattr(importlib.import_module(module_name), class_name)
+        construct_start = time.perf_counter()
+        plugins.append(plugin_class(client, config))
+        construct_end = time.perf_counter()
+        report.append((name, (construct_start - import_start) * 1000, (construct_end - construct_start) * 1000))
+    total_ms = (time.perf_counter() - startup_start) * 1000
+    logger.info(f'Loaded {len(plugins)}/{len(PLUGIN_MANIFEST)} plugins in {total_ms:.0f}ms')
+    for name, import_ms, construct_ms in sorted(report, key=lambda x: x[1] + x[2], reverse=True):
+        logger.info(f'  {name}: import {import_ms:.0f}ms, construct {construct_ms:.0f}ms')
+    return plugins
@@ -1,28 +1,55 @@
 import asyncio
+import io
 import re
 from datetime import datetime, timezone, timedelta
+from typing import Optional
 
-import dateparser
 import discord
-from peewee import fn
 
 from database.helper import gfd_message_stats_database_helper
-from database.models import DailyMessageCount
-from logger import logger
+from database.message_stats import get_message_totals
+from database.models import (
+    ChannelMessageCountRollup,
+    ChannelMessageHeatmap,
+    MessageHeatmap,
+    UserChannelMessageCountRollup,
+    UserMessageCountRollup,
+    UserMessageHeatmap,
+)
+from database.query_cache import query_cache
+from database.write_behind import write_behind
+from database.write_intents import IncrementDailyMessageCount, IncrementMessageHeatmap
+from helpers.chart_renderer import chart_renderer
+from helpers.command_router import CommandRouter
+from helpers.message_context import MessageContext
+from helpers.time_parser import time_parser
 from plugins.base import BasePlugin
 
 
 class MessageStatisticsDateFilter:
-    def __init__(self, date_filter, title):
-        self.date_filter = date_filter
+    def __init__(self, start_date, end_date, title, metric='message_count', unit='messages'):
+        self.start_date = start_date
+        self.end_date = end_date
         self.title = title
+        self.metric = metric
+        self.unit = unit
 
 
 class MessageStatisticsTracker(BasePlugin):
-    stats_collected: dict
     invalid_date_filter_command_reply = ('Command must be .messages-today, .messages-yesterday, .messages-week, '
-                                         '.messages-month, .messages-year or .messages-date <date> or .messages-range <date> <date>')
+                                         '.messages-month, .messages-year or .messages-date <date> or .messages-range <date> <date>'
+                                         ', optionally followed by characters, images, videos, links, replies or '
+                                         'mentions and/or chart, or .messages-heatmap [@user]')
     command_range_pattern = re.compile(r'^\.messages-(today|yesterday|week|month|year|date|range)')
+    metric_pattern = re.compile(r' (characters|images|videos|links|replies|mentions)\b')
+    metric_keywords = {
+        'characters': ('char_count', 'characters'),
+        'images': ('image_count', 'images'),
+        'videos': ('video_count', 'videos'),
+        'links': ('link_count', 'links'),
+        'replies': ('reply_count', 'replies'),
+        'mentions': ('mention_count', 'mentions'),
+    }
 
     class DateFilterError(Exception):
         def __init__(self, message=None):
@@ -32,205 +59,258 @@ class MessageStatisticsTracker(BasePlugin):
         def __init__(self, date_filter_str):
             super().__init__(f'Unparseable date: {date_filter_str}')
 
-    def __init__(self, client: discord.Client, config: dict):
-        super().__init__(client, config)
-        self.stats_collected = {}
+    def register_commands(self, router: CommandRouter):
+        router.observe_all(self.on_message)
 
-    def on_ready(self):
-        if self.is_ready():
-            return
-        asyncio.get_event_loop().create_task(self.run())
-
-    async def run(self):
-        while True:
-            try:
-                await asyncio.sleep(30)
-                copy = self.stats_collected.copy()
-                self.stats_collected = {}
-                if len(copy) > 0:
-                    await self.process_stats_collected(copy)
-            except Exception as e:
-                logger.error(str(e))
+    def register_private_commands(self, router: CommandRouter):
+        router.register_prefix('.messages-', self.on_message_private)
 
-    async def on_message_private(self, message: discord.Message):
-        if message.content.lower() == '.messages-stats':
+    async def on_message_private(self, message: discord.Message, context: MessageContext):
+        if context.content_lower == '.messages-stats':
             await self.post_overall_stats(message)
             return
-        if message.content.lower().startswith('.messages-'):
-            await self.post_range_statistics(message)
+        if context.content_lower.startswith('.messages-heatmap'):
+            await self.post_heatmap(message)
             return
-
-    async def on_message(self, message: discord.Message):
-        if message.content.lower() == '.messages-stats':
+        if context.content_lower.startswith('.messages-'):
+            await self.post_range_statistics(message, context)
             return
-        if message.content.lower().startswith('.messages-'):
+
+    async def on_message(self, message: discord.Message, context: MessageContext):
+        if context.content_lower.startswith('.messages-'):
             return
-        self.track_message(message)
+        self.track_message(message, context)
 
-    def track_message(self, message: discord.Message):
-        msg_date = message.created_at.strftime('%Y-%m-%d')
-        channel_key = (
-            f"t{message.channel.id}" if isinstance(message.channel, discord.Thread) else str(message.channel.id)
-        )
-        if channel_key not in self.stats_collected:
-            self.stats_collected[channel_key] = {}
-        if msg_date not in self.stats_collected[channel_key]:
-            self.stats_collected[channel_key][msg_date] = {}
-        if message.author.id not in self.stats_collected[channel_key][msg_date]:
-            self.stats_collected[channel_key][msg_date][message.author.id] = 0
-        self.stats_collected[channel_key][msg_date][message.author.id] += 1
+    @staticmethod
+    def track_message(message: discord.Message, context: MessageContext):
+        # In the order of message_metric_fields
+        metrics = [
+            1,
+            len(message.content),
+            context.image_count,
+            context.video_count,
+            len(context.urls),
+            1 if message.type == discord.MessageType.reply else 0,
+            len(context.mention_ids),
+        ]
+        write_behind.enqueue(IncrementDailyMessageCount(
+            message.created_at.toordinal(), message.channel.id, context.is_thread, message.author.id, metrics
+        ))
+        write_behind.enqueue(IncrementMessageHeatmap(
+            message.channel.id, message.author.id, MessageHeatmap.get_slot(message.created_at)
+        ))
 
-    async def post_range_statistics(self, message: discord.Message):
-        if message.content.lower().endswith(' channels'):
-            await self.post_range_statistics_for_channels(message)
+    async def post_range_statistics(self, message: discord.Message, context: MessageContext):
+        if context.content_lower.removesuffix(' chart').endswith(' channels'):
+            await self.post_range_statistics_for_channels(message, context)
             return
-        if message.mentions:
-            await MessageStatisticsTracker.post_range_statistics_for_users(message)
+        if context.mention_ids:
+            await MessageStatisticsTracker.post_range_statistics_for_users(message, context)
             return
         try:
-            date_filter = MessageStatisticsTracker.get_message_range_filter(message)
+            date_filter = await MessageStatisticsTracker.get_message_range_filter(context)
         except MessageStatisticsTracker.DateFilterError as e:
             await message.reply(str(e))
             return
-        data = (
-            DailyMessageCount
-            .select(DailyMessageCount.user_id, fn.SUM(DailyMessageCount.message_count).alias('total_messages'))
-            .where(
-                date_filter.date_filter
-                & (DailyMessageCount.user_id != self.client.user.id)
-            )
-            .group_by(DailyMessageCount.user_id)
-            .order_by(fn.SUM(DailyMessageCount.message_count).desc())
-        )
-        if not data.exists():
+        cached_totals = await MessageStatisticsTracker.get_totals(UserMessageCountRollup, date_filter)
+        totals = {key: total for key, total in cached_totals.items() if key != (self.client.user.id,)}
+        if not totals:
             await message.reply(f'No data to show :(')
             return
+        if context.content_lower.endswith(' chart'):
+            await self.post_totals_chart(message, UserMessageCountRollup, date_filter, cached_totals, totals)
+            return
         stats_message = f"**Stats for {date_filter.title}:**\n"
-        for record in data:
-            user_mention = f"<@{record.user_id}>"
-            stats_message += f"{user_mention}: {record.total_messages:,} messages\n"
+        for (user_id,), total in sorted(totals.items(), key=lambda item: item[1], reverse=True):
+            user_mention = f"<@{user_id}>"
+            stats_message += f"{user_mention}: {total:,} {date_filter.unit}\n"
         await message.reply(stats_message, allowed_mentions=discord.AllowedMentions(users=False))
 
     @staticmethod
-    async def post_range_statistics_for_users(message: discord.Message):
-        mentioned_users = [user.id for user in message.mentions]
+    async def post_range_statistics_for_users(message: discord.Message, context: MessageContext):
+        mentioned_users = context.mention_ids
         try:
-            date_filter = MessageStatisticsTracker.get_message_range_filter(message)
+            date_filter = await MessageStatisticsTracker.get_message_range_filter(context)
         except MessageStatisticsTracker.DateFilterError as e:
             await message.reply(str(e))
             return
         stats_message = f"**Stats for {date_filter.title}:**\n"
-        data = (
-            DailyMessageCount
-            .select(
-                DailyMessageCount.user_id,
-                DailyMessageCount.channel_id,
-                DailyMessageCount.thread_id,
-                fn.SUM(DailyMessageCount.message_count).alias('total_messages')
-            )
-            .where(
-                (DailyMessageCount.user_id.in_(mentioned_users)) &
-                date_filter.date_filter
-            )
-            .group_by(DailyMessageCount.user_id, DailyMessageCount.channel_id, DailyMessageCount.thread_id)
-            .order_by(DailyMessageCount.user_id, fn.SUM(DailyMessageCount.message_count).desc())
+        totals = await MessageStatisticsTracker.get_totals(
+            UserChannelMessageCountRollup, date_filter, sorted(set(mentioned_users))
         )
-
-        if not data.exists():
+        if not totals:
             await message.reply("No data to show for the mentioned users :(",
                                 allowed_mentions=discord.AllowedMentions(users=False))
             return
 
         current_user = None
-        for record in data:
-            if record.user_id != current_user:
-                current_user = record.user_id
+        for (user_id, channel_id), total in sorted(totals.items(), key=lambda item: (item[0][0], -item[1])):
+            if user_id != current_user:
+                current_user = user_id
                 if current_user is not None:
                     stats_message += "\n"
                 stats_message += f"Stats for <@{current_user}>:\n"
-            channel_mention = f"<#{record.thread_id or record.channel_id}>"
-            stats_message += f"{channel_mention}: {record.total_messages:,} messages\n"
+            channel_mention = f"<#{channel_id}>"
+            stats_message += f"{channel_mention}: {total:,} {date_filter.unit}\n"
 
         await message.reply(stats_message, allowed_mentions=discord.AllowedMentions(users=False))
 
-    async def post_range_statistics_for_channels(self, message: discord.Message):
+    async def post_range_statistics_for_channels(self, message: discord.Message, context: MessageContext):
         try:
-            date_filter = MessageStatisticsTracker.get_message_range_filter(message)
+            date_filter = await MessageStatisticsTracker.get_message_range_filter(context)
         except MessageStatisticsTracker.DateFilterError as e:
             await message.reply(str(e))
             return
         stats_message = f"**Stats for {date_filter.title}:**\n"
-        data = (
-            DailyMessageCount
-            .select(
-                DailyMessageCount.channel_id,
-                DailyMessageCount.thread_id,
-                fn.SUM(DailyMessageCount.message_count).alias('total_messages')
-            )
-            .where(
-                date_filter.date_filter
-                & (DailyMessageCount.user_id != self.client.user.id)
-            )
-            .group_by(DailyMessageCount.channel_id, DailyMessageCount.thread_id)
-            .order_by(fn.SUM(DailyMessageCount.message_count).desc())
-        )
-
-        if not data.exists():
+        # The bot's own messages are never tracked, so unlike the user leaderboard there is nothing to exclude
+        totals = await MessageStatisticsTracker.get_totals(ChannelMessageCountRollup, date_filter)
+        if not totals:
             await message.reply("No data to show :(",
                                 allowed_mentions=discord.AllowedMentions(users=False))
             return
+        if context.content_lower.endswith(' chart'):
+            await self.post_totals_chart(message, ChannelMessageCountRollup, date_filter, totals, totals)
+            return
 
-        for record in data:
-            channel_mention = f"<#{record.thread_id or record.channel_id}>"
-            stats_message += f"{channel_mention}: {record.total_messages:,} messages\n"
+        for (channel_id,), total in sorted(totals.items(), key=lambda item: item[1], reverse=True):
+            channel_mention = f"<#{channel_id}>"
+            stats_message += f"{channel_mention}: {total:,} {date_filter.unit}\n"
 
         await message.reply(stats_message, allowed_mentions=discord.AllowedMentions(users=False))
 
     async def post_overall_stats(self, message):
-        data = (
-            DailyMessageCount
-            .select(DailyMessageCount.user_id, fn.SUM(DailyMessageCount.message_count).alias('total_messages'))
-            .group_by(DailyMessageCount.user_id)
-            .order_by(fn.SUM(DailyMessageCount.message_count).desc())
+        totals = await MessageStatisticsTracker.get_totals(
+            UserMessageCountRollup, MessageStatisticsDateFilter(None, None, 'all time')
         )
-
-        if not data.exists():
+        if not totals:
             await message.reply('No data to show :(')
             return
 
         stats_message = "**Total message counts:**\n"
         total_messages = 0
-        for record in data:
-            user = self.client.guilds[0].get_member(record.user_id)
+        for (user_id,), user_total_messages in sorted(totals.items(), key=lambda item: item[1], reverse=True):
+            user = self.client.guilds[0].get_member(user_id)
             if user is None:
                 continue
-            user_mention = f"<@{record.user_id}>"
-            stats_message += f"{user_mention}: {record.total_messages:,} messages\n"
-            total_messages += record.total_messages
+            user_mention = f"<@{user_id}>"
+            stats_message += f"{user_mention}: {user_total_messages:,} messages\n"
+            total_messages += user_total_messages
 
         stats_message += f"\n**Total messages across all users:** {total_messages:,} messages"
         await message.reply(stats_message, allowed_mentions=discord.AllowedMentions(users=False))
 
+    async def post_totals_chart(self, message: discord.Message, rollup_model, date_filter: MessageStatisticsDateFilter,
+                                cached_totals: dict, totals: dict):
+        labels = []
+        values = []
+        for (key,), total in sorted(totals.items(), key=lambda item: item[1], reverse=True):
+            if rollup_model is ChannelMessageCountRollup:
+                channel = self.client.get_channel(key)
+                labels.append(f'#{channel.name}' if channel is not None else str(key))
+            else:
+                member = self.client.guilds[0].get_member(key)
+                labels.append(member.display_name if member is not None else str(key))
+            values.append(total)
+        chart_key = (
+            'messages-chart', rollup_model.__name__, date_filter.start_date, date_filter.end_date, date_filter.metric
+        )
+        image_bytes = await chart_renderer.render(
+            chart_key, cached_totals, f'Stats for {date_filter.title}', labels, values, date_filter.unit
+        )
+        await message.reply(file=discord.File(image_bytes, 'messages.png'))
+
+    @staticmethod
+    async def post_heatmap(message: discord.Message):
+        if message.mentions:
+            user = message.mentions[0]
+            heatmap = await query_cache.run(
+                gfd_message_stats_database_helper, ('messages-heatmap', user.id), UserMessageHeatmap.get_heatmap,
+                user.id
+            )
+            title = f'Messages by {user.display_name}'
+        else:
+            heatmap = await query_cache.run(
+                gfd_message_stats_database_helper, ('messages-heatmap', None), ChannelMessageHeatmap.get_heatmap
+            )
+            title = 'Messages'
+        if not any(heatmap):
+            await message.reply('No data to show :(')
+            return
+        image_bytes = await asyncio.to_thread(MessageStatisticsTracker.render_heatmap, heatmap, title)
+        await message.reply(file=discord.File(image_bytes, 'heatmap.png'))
+
+    @staticmethod
+    def render_heatmap(heatmap: list[int], title: str) -> io.BytesIO:
+        """
+        Draws the 7x24 grid with a row per weekday and a column per hour, darker cells had fewer messages.
+        """
+        from PIL import Image, ImageDraw, ImageFont
+        cell = 24
+        left = 40
+        top = 44
+        empty = (43, 45, 49)
+        full = (88, 101, 242)
+        image = Image.new('RGB', (left + 24 * cell + 8, top + 7 * cell + 8), (30, 31, 34))
+        draw = ImageDraw.Draw(image)
+        font = ImageFont.load_default()
+        draw.text((left, 6), f'{title} per hour of the week (UTC)', fill=(242, 243, 245), font=font)
+        for hour in range(0, 24, 3):
+            draw.text((left + hour * cell + 2, top - 16), f'{hour:02}', fill=(181, 186, 193), font=font)
+        busiest = max(heatmap)
+        for day, day_name in enumerate(('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')):
+            y = top + day * cell
+            draw.text((6, y + 6), day_name, fill=(181, 186, 193), font=font)
+            for hour in range(24):
+                # Square root so a few very busy hours don't wash out the rest of the week
+                intensity = (heatmap[day * 24 + hour] / busiest) ** 0.5
+                color = tuple(round(e + (f - e) * intensity) for e, f in zip(empty, full))
+                x = left + hour * cell
+                draw.rectangle((x + 1, y + 1, x + cell - 1, y + cell - 1), fill=color)
+        image_bytes = io.BytesIO()
+        image.save(image_bytes, format='PNG')
+        image_bytes.seek(0)
+        return image_bytes
+
     @staticmethod
-    def get_message_range_filter(message: discord.Message):
-        msg_lower = re.sub(r"<@!?(\d+)>|channels$", "", message.content.lower()).strip()
+    async def get_totals(rollup_model, date_filter: MessageStatisticsDateFilter, user_ids: Optional[list[int]] = None):
+        key = (
+            'messages', rollup_model.__name__, date_filter.start_date, date_filter.end_date, date_filter.metric,
+            tuple(user_ids) if user_ids is not None else None,
+        )
+        return await query_cache.run(
+            gfd_message_stats_database_helper, key, get_message_totals, rollup_model, date_filter.start_date,
+            date_filter.end_date, user_ids, date_filter.metric
+        )
+
+    @staticmethod
+    async def get_message_range_filter(context: MessageContext):
+        msg_lower = re.sub(r"<@!?(\d+)>|channels$", "", context.content_lower.removesuffix(' chart')).strip()
+        metric_match = MessageStatisticsTracker.metric_pattern.search(msg_lower)
+        if metric_match is None:
+            return await MessageStatisticsTracker.get_message_date_filter(msg_lower)
+        msg_lower = (msg_lower[:metric_match.start()] + msg_lower[metric_match.end():]).strip()
+        date_filter = await MessageStatisticsTracker.get_message_date_filter(msg_lower)
+        date_filter.metric, date_filter.unit = MessageStatisticsTracker.metric_keywords[metric_match.group(1)]
+        return date_filter
+
+    @staticmethod
+    async def get_message_date_filter(msg_lower: str):
         message_range = MessageStatisticsTracker.command_range_pattern.match(msg_lower)
         if message_range is None:
             raise MessageStatisticsTracker.DateFilterError()
         message_range_type = message_range.group(1)
         if message_range_type == "today":
-            return MessageStatisticsDateFilter(DailyMessageCount.date == datetime.now(timezone.utc).date(), "today")
+            today = datetime.now(timezone.utc).date()
+            return MessageStatisticsDateFilter(today, today, "today")
         if message_range_type == "yesterday":
-            return MessageStatisticsDateFilter(
-                DailyMessageCount.date == (datetime.now(timezone.utc) - timedelta(days=1)).date(),
-                "yesterday"
-            )
+            yesterday = (datetime.now(timezone.utc) - timedelta(days=1)).date()
+            return MessageStatisticsDateFilter(yesterday, yesterday, "yesterday")
         if message_range_type == "week":
             start_of_week = datetime.now(timezone.utc).date() - timedelta(days=datetime.now(timezone.utc).weekday())
-            return MessageStatisticsDateFilter(DailyMessageCount.date >= start_of_week, "this week")
+            return MessageStatisticsDateFilter(start_of_week, None, "this week")
         if message_range_type == "month":
             start_of_month = datetime.now(timezone.utc).replace(day=1).date()
-            return MessageStatisticsDateFilter(DailyMessageCount.date >= start_of_month, "this month")
+            return MessageStatisticsDateFilter(start_of_month, None, "this month")
         if message_range_type == "year":
             year_requested = re.search(r" ([1-9]\d\d\d)$", msg_lower)
             if year_requested:
@@ -238,25 +318,20 @@ class MessageStatisticsTracker(BasePlugin):
                     year = int(year_requested.group(1))
                     start_of_year = datetime(year, 1, 1, tzinfo=timezone.utc)
                     end_of_year = datetime(year, 12, 31, tzinfo=timezone.utc)
-                    return MessageStatisticsDateFilter(
-                        (DailyMessageCount.date >= start_of_year.date()) &
-                        (DailyMessageCount.date <= end_of_year.date()),
-                        f"the year {year}"
-                    )
+                    return MessageStatisticsDateFilter(start_of_year.date(), end_of_year.date(), f"the year {year}")
                 except ValueError:
                     raise MessageStatisticsTracker.UnparseableDateFilterError(year_requested)
             start_of_year = datetime.now(timezone.utc).replace(month=1, day=1).date()
-            return MessageStatisticsDateFilter(DailyMessageCount.date >= start_of_year, "this year")
+            return MessageStatisticsDateFilter(start_of_year, None, "this year")
         if message_range_type == "date":
             date_filter_str = msg_lower[message_range.span()[1]:].strip()
             if not date_filter_str:
                 raise MessageStatisticsTracker.DateFilterError(
                     'A date filter is required after the .messages-date command')
-            parser_settings = {'TIMEZONE': 'UTC', 'RETURN_AS_TIMEZONE_AWARE': True}
-            dt: datetime = dateparser.parse(date_filter_str, settings=parser_settings)
+            dt = await time_parser.parse(date_filter_str, 'UTC')
             if dt is None:
                 raise MessageStatisticsTracker.UnparseableDateFilterError(date_filter_str)
-            return MessageStatisticsDateFilter(DailyMessageCount.date == dt.date(), dt.strftime('%Y-%m-%d'))
+            return MessageStatisticsDateFilter(dt.date(), dt.date(), dt.strftime('%Y-%m-%d'))
         if message_range_type == "range":
             date_filter_str = msg_lower[message_range.span()[1]:].strip()
             date_parts = date_filter_str.split(sep=' ')
@@ -273,32 +348,5 @@ class MessageStatisticsTracker(BasePlugin):
                 )
             if from_date > to_date:
                 raise MessageStatisticsTracker.DateFilterError('The from_date cannot be after the to_date.')
-            return MessageStatisticsDateFilter(
-                (DailyMessageCount.date >= from_date) & (DailyMessageCount.date <= to_date),
-                f"range -> from {from_date} to {to_date}"
-            )
+            return MessageStatisticsDateFilter(from_date, to_date, f"range -> from {from_date} to {to_date}")
         raise MessageStatisticsTracker.DateFilterError()
-
-    @staticmethod
-    async def process_stats_collected(stats_collected: dict):
-        gfd_message_stats_database_helper.replenish_db()
-        logger.info('Saving tracked message stats')
-        for origin_id in stats_collected:
-            if origin_id.startswith('t'):
-                thread_id = origin_id[1:]
-                channel_id = None
-            else:
-                channel_id = origin_id
-                thread_id = None
-            stats = stats_collected[origin_id]
-            for day in stats:
-                daily_stats = stats[day]
-                for user_id in daily_stats:
-                    DailyMessageCount.increment_message_count(
-                        user_id=user_id,
-                        channel_id=channel_id,
-                        thread_id=thread_id,
-                        date=datetime.strptime(day, '%Y-%m-%d'),
-                        increment_count=daily_stats[user_id]
-                    )
-        gfd_message_stats_database_helper.release_db()
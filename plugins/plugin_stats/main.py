@@ -0,0 +1,65 @@
+import asyncio
+
+import discord
+
+from database.loop_check import LoopCheckedSqliteDatabase
+from database.query_cache import query_cache
+from database.write_behind import write_behind
+from helpers.chart_renderer import chart_renderer
+from helpers.command_router import CommandRouter
+from helpers.lists import chunks
+from helpers.message_cache import message_cache
+from helpers.message_context import MessageContext
+from helpers.plugin_metrics import plugin_metrics
+from helpers.time_parser import time_parser
+from logger import logger
+from plugins.base import BasePlugin
+
+
+class PluginStats(BasePlugin):
+
+    def __init__(self, client, config):
+        super().__init__(client, config)
+        if 'PLUGIN_STATS_ADMIN_USERS' in config:
+            self.admin_user_ids = set(map(lambda x: int(x), config['PLUGIN_STATS_ADMIN_USERS'].split(',')))
+        else:
+            self.admin_user_ids = set()
+        self.log_interval_minutes = int(self.config.get('PLUGIN_STATS_LOG_INTERVAL_MINUTES') or 15)
+
+    async def on_start(self):
+        if self.log_interval_minutes > 0:
+            self.start_task(self.run())
+
+    async def on_stop(self):
+        await super().on_stop()
+        for line in self.get_stats_lines():
+            logger.info('Plugin stats at shutdown: ' + line)
+
+    def register_private_commands(self, router: CommandRouter):
+        router.register_command('.plugin-stats', self.on_message)
+
+    async def on_message(self, message: discord.Message, context: MessageContext):
+        if message.author.id not in self.admin_user_ids:
+            return
+        lines = self.get_stats_lines()
+        if len(lines) == 0:
+            await message.reply('Nothing has been measured yet')
+            return
+        for chunk in chunks(lines, 15):
+            await message.reply('\n'.join(chunk))
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.log_interval_minutes * 60)
+            for line in self.get_stats_lines():
+                logger.info('Plugin stats: ' + line)
+
+    @staticmethod
+    def get_stats_lines() -> list[str]:
+        lines = (
+            plugin_metrics.get_summary_lines() + write_behind.get_summary_lines() + query_cache.get_summary_lines()
+            + time_parser.get_summary_lines() + chart_renderer.get_summary_lines() + message_cache.get_summary_lines()
+        )
+        for call_site, count in LoopCheckedSqliteDatabase.loop_call_sites.items():
+            lines.append(f'Sync DB call on the event loop: {call_site} x{count}')
+        return lines
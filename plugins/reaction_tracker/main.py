@@ -1,52 +1,172 @@
-import asyncio
-import sqlite3
+
+import heapq
+import re
+from datetime import datetime, timezone, timedelta
+from typing import Optional
 
 import discord
 
 from database.helper import gfd_emojis_database_helper
-from database.models import UserReaction, db_emojis
+from database.models import MessageReactionCount, db_emojis
+from database.query_cache import query_cache
+from database.write_behind import write_behind
+from database.write_intents import RecordReaction
+from helpers.chart_renderer import chart_renderer
+from helpers.command_router import CommandRouter
 from helpers.lists import chunks
+from helpers.message_cache import message_cache
+from helpers.message_context import MessageContext
 from logger import logger
 from plugins.base import BasePlugin
 
 
-class ReactionTracker(BasePlugin):
-    payloads = []
+class TopPosts:
+    """
+    The most reacted messages posted since `start_day`. The `capacity` best known ones are kept, a message that isn't
+    kept can only overtake them by getting reactions, which passes it through `update`. A kept message that loses
+    reactions can drop below one that isn't kept, that is corrected when the window moves and it is rebuilt.
+    """
+
+    def __init__(self, capacity: int = 50):
+        self.capacity = capacity
+        self.start_day: Optional[int] = None
+        # message id -> (message id, channel id, author id, posted day, count)
+        self.posts: dict[int, tuple] = {}
+
+    def rebuild(self, start_day: int, rows: list[tuple]):
+        self.start_day = start_day
+        self.posts = {row[0]: row for row in rows}
 
-    def on_ready(self):
-        if self.is_ready():
+    def update(self, row: tuple):
+        if self.start_day is None or row[3] < self.start_day:
             return
-        asyncio.get_event_loop().create_task(self.run())
+        if row[0] in self.posts or len(self.posts) < self.capacity:
+            self.posts[row[0]] = row
+        else:
+            lowest = min(self.posts.values(), key=lambda post: post[4])
+            if row[4] <= lowest[4]:
+                return
+            del self.posts[lowest[0]]
+            self.posts[row[0]] = row
+        if row[4] <= 0:
+            del self.posts[row[0]]
+
+    def get_top(self, limit: int) -> list[tuple]:
+        # Reactions replayed from a journal written before channels were recorded can't be linked
+        linkable = (post for post in self.posts.values() if post[1] is not None)
+        return heapq.nlargest(limit, linkable, key=lambda post: post[4])
+
+
+class ReactionTracker(BasePlugin):
+    top_emojis_pattern = re.compile(r'^\.emojis(?:-(today|week|month|year))?( chart)?$')
+    window_titles = {'today': 'today', 'week': 'this week', 'month': 'this month', 'year': 'this year'}
+    top_posts_pattern = re.compile(r'^\.top-posts(?: (week|month))?$')
+
+    def __init__(self, client, config):
+        super().__init__(client, config)
+        self.top_posts = {'week': TopPosts(), 'month': TopPosts()}
+
+    async def on_start(self):
+        RecordReaction.applied_listeners.append(self.on_reactions_applied)
+        for window in self.top_posts:
+            await self.rebuild_top_posts(window)
+
+    async def rebuild_top_posts(self, window: str):
+        top_posts = self.top_posts[window]
+        start_day, _ = self.get_window_days(window)
+        rows = await gfd_emojis_database_helper.run(MessageReactionCount.get_top, start_day, top_posts.capacity)
+        top_posts.rebuild(start_day, rows)
+
+    def on_reactions_applied(self, rows: list[tuple]):
+        for top_posts in self.top_posts.values():
+            for row in rows:
+                top_posts.update(row)
+
+    def register_commands(self, router: CommandRouter):
+        router.register_prefix('.emojis', self.on_message)
+        router.register_command('.top-posts', self.on_top_posts_message)
 
-    async def on_message(self, message: discord.Message):
-        if message.content.lower() == '.emojis':
-            await self.post_emoji_stats(message)
-        if message.content.lower() == '.emojis-users':
+    def register_private_commands(self, router: CommandRouter):
+        router.register_prefix('.emojis', self.on_message)
+
+    async def on_message(self, message: discord.Message, context: MessageContext):
+        top_emojis_match = self.top_emojis_pattern.match(context.content_lower)
+        if top_emojis_match is not None:
+            if top_emojis_match.group(2):
+                await self.post_emoji_chart(message, top_emojis_match.group(1))
+            else:
+                await self.post_emoji_stats(message, top_emojis_match.group(1))
+            return
+        if context.content_lower == '.emojis-users':
             await self.post_emoji_users(message)
-        elif message.content.lower().startswith('.emojis') and len(message.mentions) > 0:
+        elif context.content_lower.startswith('.emojis') and len(context.mention_ids) > 0:
             await self.post_emoji_stats_for_users(message)
 
-    async def run(self):
-        while True:
-            try:
-                await asyncio.sleep(30)
-                copy = self.payloads.copy()
-                self.payloads = []
-                if len(copy) > 0:
-                    await self.process_payloads(copy)
-            except Exception as e:
-                logger.error(str(e))
+    async def on_top_posts_message(self, message: discord.Message, context: MessageContext):
+        top_posts_match = self.top_posts_pattern.match(context.content_lower)
+        if top_posts_match is None:
+            await message.reply('Command must be .top-posts, .top-posts week or .top-posts month')
+            return
+        await self.post_top_posts(message, top_posts_match.group(1) or 'week')
+
+    async def post_top_posts(self, message: discord.Message, window: str):
+        top_posts = self.top_posts[window]
+        if top_posts.start_day != self.get_window_days(window)[0]:
+            await self.rebuild_top_posts(window)
+        guild_id = self.client.guilds[0].id
+        message_parts = [f'**Most reacted posts {self.window_titles[window]}:**']
+        for index, (message_id, channel_id, author_id, _, count) in enumerate(top_posts.get_top(10), 1):
+            link = f'https://discord.com/channels/{guild_id}/{channel_id}/{message_id}'
+            message_parts.append(f'{index}. {link} by <@{author_id}>: {count} reactions')
+        if len(message_parts) == 1:
+            await message.reply(f'No reacted posts {self.window_titles[window]} yet')
+            return
+        await message.reply('\n'.join(message_parts), allowed_mentions=discord.AllowedMentions(users=False))
+
+    @staticmethod
+    def fetch_all(sql: str, params: tuple = ()) -> list[tuple]:
+        return db_emojis.execute_sql(sql, params).fetchall()
+
+    @staticmethod
+    def get_window_days(window: str) -> tuple[int, int]:
+        today = datetime.now(timezone.utc).date()
+        if window == 'week':
+            start = today - timedelta(days=today.weekday())
+        elif window == 'month':
+            start = today.replace(day=1)
+        elif window == 'year':
+            start = today.replace(month=1, day=1)
+        else:
+            start = today
+        return start.toordinal(), today.toordinal()
 
     @staticmethod
-    async def post_emoji_stats(message: discord.Message):
-        gfd_emojis_database_helper.replenish_db()
-        res: sqlite3.Cursor = db_emojis.execute_sql(
-            'SELECT emoji_id,emoji_str,SUM(CASE WHEN is_add THEN 1 ELSE -1 END) AS count FROM userreaction\n'
-            'GROUP BY COALESCE(emoji_id, emoji_str)\n'
+    async def get_top_emojis(window: Optional[str] = None) -> list[tuple]:
+        if window is None:
+            return await query_cache.run(
+                gfd_emojis_database_helper,
+                ('emojis',),
+                ReactionTracker.fetch_all,
+                'SELECT emoji_id,emoji_str,count FROM emojireactioncount\n'
+                'ORDER BY count DESC\n'
+                'LIMIT 10'
+            )
+        start_day, end_day = ReactionTracker.get_window_days(window)
+        return await query_cache.run(
+            gfd_emojis_database_helper,
+            ('emojis', start_day, end_day),
+            ReactionTracker.fetch_all,
+            'SELECT emoji_id,emoji_str,SUM(count) AS count FROM dailyemojireactioncount\n'
+            'WHERE day BETWEEN ? AND ?\n'
+            'GROUP BY emoji_key\n'
             'ORDER BY count DESC\n'
-            'LIMIT 10'
+            'LIMIT 10',
+            (start_day, end_day)
         )
-        rows = res.fetchall()
+
+    @staticmethod
+    async def post_emoji_stats(message: discord.Message, window: Optional[str] = None):
+        rows = await ReactionTracker.get_top_emojis(window)
         message_parts = []
         for row in rows:
             if row[2] < 1:
@@ -57,35 +177,62 @@ class ReactionTracker(BasePlugin):
                 emoji_str = row[1]
             message_parts.append(f'{emoji_str}: {row[2]}')
         if len(message_parts) == 0:
-            await message.reply('I haven\'t tracked anything yet')
+            if window is None:
+                await message.reply('I haven\'t tracked anything yet')
+            else:
+                await message.reply(f'No reactions {ReactionTracker.window_titles[window]} yet')
         else:
+            if window is not None:
+                message_parts.insert(0, f'**Top emojis {ReactionTracker.window_titles[window]}:**')
             chunk: list
             for chunk in chunks(message_parts, 30):
                 await message.reply("\n".join(chunk))
-        gfd_emojis_database_helper.release_db()
+
+    async def post_emoji_chart(self, message: discord.Message, window: Optional[str] = None):
+        rows = await ReactionTracker.get_top_emojis(window)
+        labels = []
+        values = []
+        for emoji_id, emoji_str, count in rows:
+            if count < 1:
+                continue
+            if emoji_id:
+                # Custom emojis can't be drawn, they are labelled by name
+                emoji = self.client.get_emoji(emoji_id)
+                emoji_str = f':{emoji.name}:' if emoji is not None else str(emoji_id)
+            labels.append(emoji_str)
+            values.append(count)
+        if len(labels) == 0:
+            await message.reply('I haven\'t tracked anything yet')
+            return
+        title = f'Top emojis {self.window_titles[window]}' if window is not None else 'Top emojis'
+        image_bytes = await chart_renderer.render(('emojis-chart', window), rows, title, labels, values, 'reactions')
+        await message.reply(file=discord.File(image_bytes, 'emojis.png'))
 
     @staticmethod
     async def post_emoji_users(message: discord.Message):
-        gfd_emojis_database_helper.replenish_db()
         message_parts = []
-        res: sqlite3.Cursor = db_emojis.execute_sql(
-            'SELECT target_user_id, SUM(CASE WHEN is_add THEN 1 ELSE -1 END) AS count FROM userreaction\n'
+        rows = await query_cache.run(
+            gfd_emojis_database_helper,
+            ('emojis-receivers',),
+            ReactionTracker.fetch_all,
+            'SELECT target_user_id, SUM(count) AS count FROM sourcetargetreactioncount\n'
             'GROUP BY target_user_id\n'
             'HAVING count > 0\n'
             'ORDER BY count DESC\n'
         )
-        rows = res.fetchall()
         if len(rows):
             message_parts.append(f'**Receivers:**')
             for row in rows:
                 message_parts.append(f'<@{row[0]}>: {row[1]}')
-        res: sqlite3.Cursor = db_emojis.execute_sql(
-            'SELECT source_user_id, SUM(CASE WHEN is_add THEN 1 ELSE -1 END) AS count FROM userreaction\n'
+        rows = await query_cache.run(
+            gfd_emojis_database_helper,
+            ('emojis-givers',),
+            ReactionTracker.fetch_all,
+            'SELECT source_user_id, SUM(count) AS count FROM sourcetargetreactioncount\n'
             'GROUP BY source_user_id\n'
             'HAVING count > 0\n'
             'ORDER BY count DESC\n'
         )
-        rows = res.fetchall()
         if len(rows):
             message_parts.append(f'**Givers:**')
             for row in rows:
@@ -94,7 +241,6 @@ class ReactionTracker(BasePlugin):
             await message.reply('I haven\'t tracked anything yet')
         else:
             await message.reply("\n".join(message_parts), allowed_mentions=discord.AllowedMentions(users=False))
-        gfd_emojis_database_helper.release_db()
 
     @staticmethod
     def _add_to_user_specific_message_parts(emojis, user_specific_message_parts, header) -> int:
@@ -114,27 +260,33 @@ class ReactionTracker(BasePlugin):
             user_specific_message_parts += message_parts
         return total
 
+    @staticmethod
+    async def get_emojis_by_user(table: str, user_column: str, user_ids: tuple[int, ...]) -> dict[int, list[tuple]]:
+        rows = await query_cache.run(
+            gfd_emojis_database_helper,
+            (table, user_ids),
+            ReactionTracker.fetch_all,
+            f'SELECT {user_column},emoji_id,emoji_str,count FROM {table}\n'
+            f'WHERE {user_column} IN ({",".join("?" * len(user_ids))})\n'
+            'ORDER BY count desc',
+            user_ids
+        )
+        emojis_by_user = {}
+        for row in rows:
+            emojis_by_user.setdefault(row[0], []).append(row[1:])
+        return emojis_by_user
+
     @staticmethod
     async def post_emoji_stats_for_users(message: discord.Message):
-        gfd_emojis_database_helper.replenish_db()
         message_parts = []
+        user_ids = tuple(sorted({user.id for user in message.mentions}))
+        received_by_user = await ReactionTracker.get_emojis_by_user(
+            'targetemojireactioncount', 'target_user_id', user_ids
+        )
+        given_by_user = await ReactionTracker.get_emojis_by_user('sourceemojireactioncount', 'source_user_id', user_ids)
         for user in message.mentions:
-            res: sqlite3.Cursor = db_emojis.execute_sql(
-                'SELECT emoji_id,emoji_str,SUM(CASE WHEN is_add THEN 1 ELSE -1 END) AS count FROM userreaction\n'
-                'WHERE target_user_id = ?\n'
-                'GROUP BY COALESCE(emoji_id, emoji_str)\n'
-                'ORDER BY count desc',
-                (user.id,)
-            )
-            emojis_received = res.fetchall()
-            res: sqlite3.Cursor = db_emojis.execute_sql(
-                'SELECT emoji_id,emoji_str,SUM(CASE WHEN is_add THEN 1 ELSE -1 END) AS count FROM userreaction\n'
-                'WHERE source_user_id = ?\n'
-                'GROUP BY COALESCE(emoji_id, emoji_str)\n'
-                'ORDER BY count desc',
-                (user.id,)
-            )
-            emojis_given = res.fetchall()
+            emojis_received = received_by_user.get(user.id, [])
+            emojis_given = given_by_user.get(user.id, [])
             user_specific_message_parts = []
             received_total = 0
             given_total = 0
@@ -159,41 +311,29 @@ class ReactionTracker(BasePlugin):
             await message.reply('I don\'t have any data')
         else:
             await message.reply("\n".join(message_parts))
-        gfd_emojis_database_helper.release_db()
 
     async def track_reaction(self, payload: discord.RawReactionActionEvent):
         if payload.user_id == self.client.user.id:
             return
-        self.payloads.append(payload)
+        if payload.event_type == 'REACTION_ADD':
+            count = 1
+            target_user_id = payload.message_author_id
+        elif payload.event_type == 'REACTION_REMOVE':
+            count = -1
+            target_user_id = await message_cache.get_author_id(self.client, payload.channel_id, payload.message_id)
+        else:
+            return
+        # Discord leaves the author out for some messages, a row without a target would fail the whole flush
+        if target_user_id is None or payload.user_id == target_user_id:
+            return
+        if payload.emoji.is_custom_emoji():
+            emoji_id = payload.emoji.id
+            emoji_str = None
+        else:
+            emoji_id = None
+            emoji_str = str(payload.emoji)
+        write_behind.enqueue(RecordReaction(
+            payload.message_id, payload.user_id, target_user_id, emoji_id, emoji_str, count,
+            channel_id=payload.channel_id
+        ))
         logger.info('Tracked reaction')
-
-    async def process_payloads(self, payloads: list[discord.RawReactionActionEvent]):
-        gfd_emojis_database_helper.replenish_db()
-        logger.info('Saving tracked reactions')
-        for payload in payloads:
-            is_add = True
-            if payload.event_type == 'REACTION_ADD':
-                target_user_id = payload.message_author_id
-            elif payload.event_type == 'REACTION_REMOVE':
-                is_add = False
-                channel = await self.client.guilds[0].fetch_channel(payload.channel_id)
-                message = await channel.fetch_message(payload.message_id)
-                target_user_id = message.author.id
-            else:
-                continue
-            if payload.user_id == target_user_id:
-                continue
-            if payload.emoji.is_custom_emoji():
-                emoji_id = payload.emoji.id
-                emoji_str = None
-            else:
-                emoji_id = None
-                emoji_str = str(payload.emoji)
-            UserReaction.create(
-                source_user_id=payload.user_id,
-                target_user_id=target_user_id,
-                emoji_id=emoji_id,
-                emoji_str=emoji_str,
-                is_add=is_add
-            )
-        gfd_emojis_database_helper.release_db()
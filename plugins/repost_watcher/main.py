@@ -4,15 +4,22 @@ import discord
 
 from database.helper import gfd_links_database_helper
 from database.models import PostedLinkV2
+from database.query_cache import query_cache
+from database.write_behind import write_behind
+from database.write_intents import IncrementLinkHits
+from helpers.command_router import CommandRouter
+from helpers.message_context import MessageContext, link_regex
 from plugins.base import BasePlugin
 
 
 class RepostWatcher(BasePlugin):
-    link_regex = r'https?://[^\s]{1,2048}'
-    basic_url_regex_pattern = re.compile(link_regex, re.DOTALL)
     link_count_msg_pattern = re.compile(r'\.linkcount <?(' + link_regex + ')', re.DOTALL)
 
-    async def on_message(self, message):
+    def register_commands(self, router: CommandRouter):
+        router.register_command(['.toplinks', '.linkcount'], self.on_message)
+        router.observe_all(self.track_links)
+
+    async def on_message(self, message, context: MessageContext):
         if message.author.bot:
             return
         if message.content == '.toplinks':
@@ -21,33 +28,38 @@ class RepostWatcher(BasePlugin):
         if message.content.startswith('.linkcount '):
             await self.post_link_count(message)
             return
-        reacted = False
-        for link in re.finditer(self.basic_url_regex_pattern, message.content):
-            actual_link = link.group(0)
-            actual_link = self.clean_link(actual_link)
-            hits = PostedLinkV2.get_hits_by_link(actual_link)
-            posted_link = await self.process_link(actual_link)
-            if reacted is False and hits > 0:
-                reacted = True
-                await message.add_reaction('♻')
+
+    async def track_links(self, message, context: MessageContext):
+        if not context.urls or message.author.bot:
+            return
+        if message.content == '.toplinks' or message.content.startswith('.linkcount '):
+            return
+        links = [self.clean_link(link) for link in context.urls]
+        # A link posted twice in the same message is a repost as well, other query parameters included
+        links_minus_qp = [PostedLinkV2.parse_link(link)[0] for link in links]
+        seen_before = len(set(links_minus_qp)) < len(links_minus_qp)
+        if not seen_before:
+            seen_before = any(IncrementLinkHits.get_pending_hits(link) > 0 for link in links)
+        if not seen_before:
+            seen_before = await gfd_links_database_helper.run(self.is_any_link_seen_before, links)
+        for link in links:
+            write_behind.enqueue(IncrementLinkHits(link))
+        if seen_before:
+            await message.add_reaction('♻')
 
     @staticmethod
-    async def process_link(link) -> PostedLinkV2:
-        link_minus_qp, qp = PostedLinkV2.parse_link(link)
-        gfd_links_database_helper.replenish_db()
-        posted_link: PostedLinkV2
-        posted_link, create = PostedLinkV2.get_or_create(link_minus_qp=link_minus_qp, qp=qp)
-        posted_link.increment_hits()
-        posted_link.save()
-        gfd_links_database_helper.release_db()
-        return posted_link
+    def is_any_link_seen_before(links: list[str]) -> bool:
+        return any(PostedLinkV2.get_hits_by_link(link) > 0 for link in links)
 
     @staticmethod
     async def post_top_links(message):
-        gfd_links_database_helper.replenish_db()
         num_links = 10
-        posted_links: list[PostedLinkV2] = PostedLinkV2.get_top_links(num_links)
-        gfd_links_database_helper.release_db()
+        posted_links: list[PostedLinkV2] = await query_cache.run(
+            gfd_links_database_helper,
+            ('top-links', num_links),
+            list,
+            PostedLinkV2.get_top_links(num_links)
+        )
         if len(posted_links) < 1:
             await message.reply('No links recorded yet')
             return
@@ -63,9 +75,9 @@ class RepostWatcher(BasePlugin):
         if m is None:
             await message.reply('I need a link to work with 🏺🪙')
             return
-        gfd_links_database_helper.replenish_db()
-        hits = PostedLinkV2.get_hits_by_link(self.clean_link(m.group(1)))
-        gfd_links_database_helper.release_db()
+        link = self.clean_link(m.group(1))
+        hits = await gfd_links_database_helper.run(PostedLinkV2.get_hits_by_link, link)
+        hits += IncrementLinkHits.get_pending_hits(link)
         if hits < 1:
             embed_url = 'https://media.tenor.com/v6FjukZCkggAAAAd/i-dont-know-what-that-is-data.gif'
             embed = discord.Embed()
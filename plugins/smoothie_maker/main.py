@@ -1,5 +1,7 @@
 import random
 
+from helpers.command_router import CommandRouter
+from helpers.message_context import MessageContext
 from plugins.base import BasePlugin
 
 
@@ -41,9 +43,12 @@ class SmoothieMaker(BasePlugin):
         'I cant handle another smoothie right now {_from}',
     ]
 
-    async def on_message(self, message):
-        asked_for_personal_smoothie = message.content.lower() in ['.smoothie', '.smoothies']
-        asked_for_smoothie_dedication = message.content.lower().startswith('.smoothie ')
+    def register_commands(self, router: CommandRouter):
+        router.register_command(['.smoothie', '.smoothies'], self.on_message)
+
+    async def on_message(self, message, context: MessageContext):
+        asked_for_personal_smoothie = context.content_lower in ['.smoothie', '.smoothies']
+        asked_for_smoothie_dedication = context.content_lower.startswith('.smoothie ')
         if asked_for_personal_smoothie or asked_for_smoothie_dedication:
             smoothie_name_parts = []
             smoothie_name_parts_options = self.smoothie_components.copy()
@@ -2,6 +2,9 @@ from typing import Optional, List
 
 import discord
 
+from helpers.command_router import CommandRouter
+from helpers.message_cache import message_cache
+from helpers.message_context import MessageContext
 from plugins.base import BasePlugin
 
 
@@ -78,15 +81,18 @@ class TextToReaction(BasePlugin):
     def __init__(self, client: discord.Client, config: dict):
         super().__init__(client, config)
 
+    def register_commands(self, router: CommandRouter):
+        router.register_command('.react-text', self.on_message)
+
     @staticmethod
-    async def on_message(message: discord.Message):
-        msg_lower = message.content.lower()
+    async def on_message(message: discord.Message, context: MessageContext):
+        msg_lower = context.content_lower
         if not msg_lower.startswith('.react-text '):
             return
         if message.reference is None or not isinstance(message.reference, discord.MessageReference):
             await message.add_reaction('🚫')
             return
-        replied_to_message = await message.channel.fetch_message(message.reference.message_id)
+        replied_to_message = await message_cache.get_referenced_message(message.channel, message.reference)
         text_to_react = msg_lower[12:]
         if len(text_to_react) < 1:
             await message.add_reaction('🚫')
@@ -95,7 +101,12 @@ class TextToReaction(BasePlugin):
         if emojis_to_react is None:
             await message.add_reaction('🚫')
             return
-        existing_reactions = [reaction.emoji for reaction in replied_to_message.reactions]
+        cached = message_cache.get(replied_to_message.id)
+        if cached is not None and cached.reactions is not None:
+            # Kept up to date from reaction events, the replied to message is a snapshot from when the reply was sent
+            existing_reactions = list(cached.reactions)
+        else:
+            existing_reactions = [reaction.emoji for reaction in replied_to_message.reactions]
         if any(emoji in existing_reactions for emoji in emojis_to_react):
             await message.add_reaction('🚫')
             return
@@ -1,13 +1,15 @@
 import datetime
 import re
-import sqlite3
 
-import dateparser
 import discord
 import pytz
 
 from database.helper import gfd_database_helper
 from database.models import User, db
+from database.query_cache import query_cache
+from helpers.command_router import CommandRouter
+from helpers.message_context import MessageContext
+from helpers.time_parser import time_parser
 from plugins.base import BasePlugin
 
 
@@ -34,29 +36,47 @@ class TimeAssistant(BasePlugin):
         if 'TIME_ASSIST_CHANNELS' in self.config:
             self.time_assist_channels = self.config['TIME_ASSIST_CHANNELS'].split(',')
 
-    async def on_message(self, message):
-        if len(self.time_assist_channels) == 0 or str(message.channel.id) in self.time_assist_channels:
-            await self.process_message(message)
+    def register_commands(self, router: CommandRouter):
+        router.register_command(['.tz', '.clock'], self.on_message)
+        router.observe_all(self.observe_message)
 
-    async def process_message(self, message: discord.Message):
+    async def on_message(self, message, context: MessageContext):
+        if self.is_time_assist_channel(message) and self.is_command(message):
+            await self.process_command(message)
+
+    async def observe_message(self, message, context: MessageContext):
+        if ' time' not in context.content_lower:
+            return
+        if self.is_time_assist_channel(message) and not self.is_command(message):
+            await self.process_time_phrases(message)
+
+    def is_time_assist_channel(self, message: discord.Message):
+        return len(self.time_assist_channels) == 0 or str(message.channel.id) in self.time_assist_channels
+
+    @staticmethod
+    def is_command(message: discord.Message):
+        return message.content in ('.tz', '.clock') or message.content.startswith('.tz ')
+
+    async def process_command(self, message: discord.Message):
         if message.content == '.tz':
             await self.show_timezone_for_user(message.author, message)
         elif message.content.startswith('.tz '):
             await self.config_timezone_for_user(message.author, message)
         elif message.content == '.clock':
             await self.print_users_clocks(message)
-        else:
-            m = self.pattern.search(message.content)
-            if m is not None:
-                await self.respond_with_utc_time(message, m.group(2))
-                return
-            m = self.pattern_with_mention.search(message.content)
-            if m is not None:
-                await self.respond_with_utc_time_for_other_user(message, m.group(2))
-                return
-            m = self.pattern_with_tz.search(message.content)
-            if m is not None:
-                await self.respond_with_utc_time_for_tz(message, m.group(2), m.group(3))
+
+    async def process_time_phrases(self, message: discord.Message):
+        m = self.pattern.search(message.content)
+        if m is not None:
+            await self.respond_with_utc_time(message, m.group(2))
+            return
+        m = self.pattern_with_mention.search(message.content)
+        if m is not None:
+            await self.respond_with_utc_time_for_other_user(message, m.group(2))
+            return
+        m = self.pattern_with_tz.search(message.content)
+        if m is not None:
+            await self.respond_with_utc_time_for_tz(message, m.group(2), m.group(3))
 
     async def config_timezone_for_user(self, author: discord.User, message: discord.Message):
         timezone_string = message.content[4:]
@@ -76,9 +96,7 @@ class TimeAssistant(BasePlugin):
 
     @classmethod
     async def show_timezone_for_user(cls, author: discord.User, message: discord.Message):
-        gfd_database_helper.replenish_db()
-        user = User.get_by_author(author)
-        gfd_database_helper.release_db()
+        user = await gfd_database_helper.run(User.get_by_author, author)
         if user.timezone is None:
             await cls.respond_to_message_with_tz_unknown_tip(message)
             return
@@ -105,9 +123,7 @@ class TimeAssistant(BasePlugin):
 
     @classmethod
     async def respond_with_utc_time(cls, message: discord.Message, time_string):
-        gfd_database_helper.replenish_db()
-        user = User.get_by_author(message.author)
-        gfd_database_helper.release_db()
+        user = await gfd_database_helper.run(User.get_by_author, message.author)
         if user.timezone is None:
             await cls.respond_to_message_with_tz_unknown_tip(message)
             return
@@ -118,8 +134,7 @@ class TimeAssistant(BasePlugin):
 
     @classmethod
     async def parse_time_and_reply_to_message(cls, message, resolved_timezone, time_string):
-        parser_settings = {'TIMEZONE': resolved_timezone, 'RETURN_AS_TIMEZONE_AWARE': True}
-        dt: datetime.datetime = dateparser.parse(time_string, settings=parser_settings)
+        dt = await time_parser.parse(time_string, resolved_timezone)
         if dt is not None:
             await message.reply(f'That\'s <t:{int(dt.timestamp())}:F>', mention_author=False)
 
@@ -132,9 +147,7 @@ class TimeAssistant(BasePlugin):
                 time_string,
             )
             return
-        gfd_database_helper.replenish_db()
-        user = User.get_by_author(message.mentions[0])
-        gfd_database_helper.release_db()
+        user = await gfd_database_helper.run(User.get_by_author, message.mentions[0])
         if user.timezone is None:
             await self.respond_to_message_with_tz_unknown_other_user_tip(message)
             return
@@ -166,22 +179,20 @@ class TimeAssistant(BasePlugin):
 
     @staticmethod
     async def set_timezone_for_user(source_message: discord.Message, author: discord.User, timezone_string: str):
-        gfd_database_helper.replenish_db()
-        user = User.get_by_author(author)
-        user.set_timezone(timezone_string)
-        user.save()
-        gfd_database_helper.release_db()
+        user = await gfd_database_helper.run(User.get_by_author, author)
+        await gfd_database_helper.run(user.set_timezone, timezone_string)
         await source_message.reply(f'Your timezone has been set to {timezone_string} 🕗')
 
     @classmethod
     async def print_users_clocks(cls, message: discord.Message):
-        gfd_database_helper.replenish_db()
-        res: sqlite3.Cursor = db.execute_sql(
-            'SELECT user_id,timezone FROM user\n'
-            'WHERE timezone IS NOT NULL'
+        rows = await query_cache.run(
+            gfd_database_helper,
+            ('clocks',),
+            lambda: db.execute_sql(
+                'SELECT user_id,timezone FROM user\n'
+                'WHERE timezone IS NOT NULL'
+            ).fetchall()
         )
-        rows = res.fetchall()
-        gfd_database_helper.release_db()
         if len(rows) == 0:
             await message.reply(f'Nobody has configured timezones yet 🕗')
             return
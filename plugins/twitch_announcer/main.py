@@ -2,8 +2,8 @@ import asyncio
 import time
 
 import discord
-import requests
 
+from helpers.plugin_metrics import plugin_metrics
 from logger import logger
 from plugins.base import BasePlugin
 
@@ -33,10 +33,11 @@ class TwitchAnnouncer(BasePlugin):
         if 'TWITCH_CLIENT_ID' not in self.config or 'TWITCH_CLIENT_SECRET' not in self.config:
             return
 
-        asyncio.get_event_loop().create_task(self.poll_twitch())
+        self.start_task(self.poll_twitch())
 
     def refresh_twitch_key(self):
         if self.access_key is None or self.access_key_expire_time <= time.time():
+            import requests
             logger.debug(f'Fetching twitch key')
             r = requests.post(url='https://id.twitch.tv/oauth2/token', data={
                 'client_id': self.config['TWITCH_CLIENT_ID'],
@@ -49,6 +50,7 @@ class TwitchAnnouncer(BasePlugin):
             self.access_key_expire_time = time.time() + jsondata['expires_in'] - 120
 
     async def get_channel_statuses(self):
+        import requests
         r = requests.get('https://api.twitch.tv/helix/streams', params={
             'user_login': self.channels_to_track,
         }, headers={
@@ -85,8 +87,9 @@ class TwitchAnnouncer(BasePlugin):
     async def poll_twitch(self):
         while True:
             try:
-                self.refresh_twitch_key()
-                await self.get_channel_statuses()
+                with plugin_metrics.measure(self.__class__.__name__, 'run'):
+                    self.refresh_twitch_key()
+                    await self.get_channel_statuses()
                 await asyncio.sleep(60)
             except Exception:
                 pass
@@ -4,8 +4,9 @@ from enum import Enum
 from typing import Optional
 
 import discord
-import jsonschema
 
+from helpers.command_router import CommandRouter
+from helpers.message_context import MessageContext
 from plugins.base import BasePlugin
 
 
@@ -52,6 +53,7 @@ class UserMessageResponder(BasePlugin):
     def on_ready(self):
         if self.is_ready():
             return
+        import jsonschema
         dir_path = os.path.realpath(os.path.dirname(__file__))
         with open(os.path.join(dir_path, 'responses.json'), 'r') as f:
             response_json = json.load(f)
@@ -74,14 +76,17 @@ class UserMessageResponder(BasePlugin):
             r = Response(user_ids, conditions, response['message'], message_processor)
             self.responses.append(r)
 
-    async def on_message(self, message: discord.Message):
+    def register_commands(self, router: CommandRouter):
+        router.observe_all(self.on_message)
+
+    async def on_message(self, message: discord.Message, context: MessageContext):
         if len(self.responses) < 1:
             return
         for _ in self.responses:
             if len(_.user_ids) > 0:
                 if message.author.id not in _.user_ids:
                     continue
-            if not self.response_applicable(_, message):
+            if not self.response_applicable(_, message, context):
                 continue
             resp_message = _.message
             if _.message_processor is not None:
@@ -89,17 +94,17 @@ class UserMessageResponder(BasePlugin):
             await message.reply(resp_message, mention_author=False)
 
     @staticmethod
-    def response_applicable(response: Response, message: discord.Message) -> bool:
+    def response_applicable(response: Response, message: discord.Message, context: MessageContext) -> bool:
         if len(response.conditions) > 0:
             for condition in response.conditions:
                 if condition.condition_type == ResponseConditionType.HAS_GIF:
                     if 'https://tenor.com' not in message.content:
                         return False
                 elif condition.condition_type == ResponseConditionType.HAS_TEXT:
-                    if condition.value.lower() not in message.content.lower():
+                    if condition.value.lower() not in context.content_lower:
                         return False
                 elif condition.condition_type == ResponseConditionType.EXACT_TEXT:
-                    if condition.value.lower() != message.content.lower():
+                    if condition.value.lower() != context.content_lower:
                         return False
                 elif condition.condition_type == ResponseConditionType.NOT_IN_CHANNEL:
                     channels = condition.value.split(',')
@@ -2,6 +2,8 @@ import datetime
 import random
 import time
 
+from helpers.command_router import CommandRouter
+from helpers.message_context import MessageContext
 from logger import logger
 from plugins.base import BasePlugin
 
@@ -16,7 +18,10 @@ class UserSilencer(BasePlugin):
         if 'USERS_TO_SILENCE' in self.config:
             self.users_to_silence += self.config['USERS_TO_SILENCE'].split(",")
 
-    async def on_message(self, message):
+    def register_commands(self, router: CommandRouter):
+        router.observe_all(self.on_message)
+
+    async def on_message(self, message, context: MessageContext):
         if str(message.author.id) in self.users_to_silence:
             await self.timeout_user(message)
 
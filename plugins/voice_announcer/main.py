@@ -8,8 +8,6 @@ from io import BytesIO
 from typing import Union
 
 import discord
-import jsonschema
-from PIL import Image
 
 from logger import logger
 from plugins.base import BasePlugin
@@ -132,6 +130,7 @@ class VoiceAnnouncer(BasePlugin):
         images_path = os.path.join(resources_dir, 'vc_announce_images', 'images.json')
         if not os.path.exists(images_path):
             return
+        import jsonschema
         with open(os.path.join(resources_dir, 'schemas', 'vc_announce_images.schema.json'), 'r') as f:
             schema = json.load(f)
         with open(images_path, 'r') as f:
@@ -148,6 +147,7 @@ class VoiceAnnouncer(BasePlugin):
     async def get_announce_image(self, member: discord.Member) -> tuple[BytesIO, str | None] | None:
         if len(self.announce_images) == 0:
             return None
+        from PIL import Image
         try:
             announce_image = random.choice(self.announce_images)
             avatar_image_bytes = io.BytesIO()
@@ -7,13 +7,17 @@ import time
 from typing import Optional
 
 import discord
-import numpy as np
-from PIL import Image
-from google import genai
 
 from database.helper import gfd_database_helper
 from database.models import User
+from database.query_cache import query_cache
+from database.write_behind import write_behind
+from database.write_intents import IncrementUserCounter
+from helpers.command_router import CommandRouter
+from helpers.gen_ai import get_gen_ai_client
+from helpers.message_context import MessageContext
 from helpers.message_utils import mention_no_one
+from helpers.plugin_metrics import plugin_metrics
 from helpers.single_worker_pool import QueueBasedWorker
 from logger import logger
 from plugins.base import BasePlugin
@@ -21,6 +25,8 @@ from plugins.base import BasePlugin
 
 class WhosThatMonster(BasePlugin):
     filename = 'monster.png'
+    # The timed release loop has never been started by the bot, turning it on is a separate decision
+    calls_on_ready = False
 
     def __init__(self, client, config):
         super().__init__(client, config)
@@ -38,7 +44,10 @@ class WhosThatMonster(BasePlugin):
             )
         else:
             self.on_demand_release_users = []
-        self.gen_ai_client = genai.Client(api_key=config['GEMINI_KEY'])
+
+    @property
+    def gen_ai_client(self):
+        return get_gen_ai_client(self.config)
 
     def on_ready(self):
         if self.is_ready():
@@ -51,23 +60,32 @@ class WhosThatMonster(BasePlugin):
         self.channel = self.client.get_channel(int(self.config['WHOS_THAT_MONSTER_CHANNEL']))
         self.start_main_loop()
 
+    def register_private_commands(self, router: CommandRouter):
+        router.observe_all(self.on_message)
+
+    async def on_stop(self):
+        await super().on_stop()
+        await self.queue_worker.stop()
+
     def start_main_loop(self):
-        self.main_loop = asyncio.get_event_loop().create_task(self.run())
+        self.main_loop = self.start_task(self.run())
 
     async def run(self):
         await self.queue_worker.start()
         await asyncio.sleep(self.delay * 60)
         while True:
             try:
-                await self.post_monster()
+                with plugin_metrics.measure(self.__class__.__name__, 'run'):
+                    await self.post_monster()
                 await asyncio.sleep(self.delay * 60)
-                await self.reveal_monster()
+                with plugin_metrics.measure(self.__class__.__name__, 'run'):
+                    await self.reveal_monster()
             except Exception as e:
                 logger.error(str(e))
 
-    async def on_message(self, message: discord.Message):
-        msg = message.content.lower()
-        if message.channel.type == discord.ChannelType.private and msg.startswith('.release-monster'):
+    async def on_message(self, message: discord.Message, context: MessageContext):
+        msg = context.content_lower
+        if context.is_private and msg.startswith('.release-monster'):
             if message.author.id in self.on_demand_release_users and not self.current_monster_message:
                 requested_monster = msg.split(' ')[1] if ' ' in msg else None
                 await self.post_monster(requested_monster)
@@ -77,15 +95,13 @@ class WhosThatMonster(BasePlugin):
         if msg == '.monsters':
             return await self.post_leaderboard()
         if msg == self.current_monster:
-            gfd_database_helper.replenish_db()
-            user = User.get_by_author(message.author)
-            user.monsters_guessed += 1
-            user.save()
-            gfd_database_helper.release_db()
-            await message.reply(content='Yes!', file=self.get_monster_file(self.current_monster_file))
+            monster_file = self.current_monster_file
             self.current_monster = None
             self.current_monster_message = None
             self.current_monster_file = None
+            await gfd_database_helper.run(User.get_by_author, message.author)
+            write_behind.enqueue(IncrementUserCounter(message.author.id, User.monsters_guessed))
+            await message.reply(content='Yes!', file=self.get_monster_file(monster_file))
             return
         if (message.reference is not None
                 and self.current_monster_message is not None
@@ -122,7 +138,7 @@ class WhosThatMonster(BasePlugin):
         await message.reply(f'This description is a **{response.text.strip()}**!', allowed_mentions=mention_no_one)
 
     @staticmethod
-    def get_image_bytes(image: Image) -> io.BytesIO:
+    def get_image_bytes(image) -> io.BytesIO:
         image_bytes = io.BytesIO()
         image.seek(0)
         image.save(image_bytes, format='PNG')
@@ -135,10 +151,13 @@ class WhosThatMonster(BasePlugin):
         return dir_path + '/../../resources/monsters/'
 
     def get_monster_file(self, monster_file) -> Optional[discord.File]:
+        from PIL import Image
         im = Image.open(os.path.join(self.get_monster_files_path(), monster_file))
         return discord.File(self.get_image_bytes(im), self.filename)
 
     def get_hidden_monster(self, requested_monster=None) -> discord.File:
+        import numpy as np
+        from PIL import Image
         monsters_dir = self.get_monster_files_path()
         if requested_monster is not None and os.path.exists(os.path.join(monsters_dir, requested_monster + '.png')):
             monster = requested_monster + '.png'
@@ -186,11 +205,17 @@ class WhosThatMonster(BasePlugin):
             'Who\'s caught them all??',
             '',
         ]
-        users = User.select().order_by(User.monsters_guessed.desc())
-        for user in users:
-            if user.user_id == self.client.user.id:
+        query = User.select(User.user_id, User.monsters_guessed).tuples()
+        rows = await query_cache.run(gfd_database_helper, ('monsters',), list, query)
+        scores = [
+            (user_id, monsters_guessed + IncrementUserCounter.get_pending_count(user_id, User.monsters_guessed))
+            for user_id, monsters_guessed in rows
+        ]
+        scores.sort(key=lambda x: x[1], reverse=True)
+        for user_id, monsters_guessed in scores:
+            if user_id == self.client.user.id:
                 continue
-            message_lines.append(f'<@{user.user_id}>: {user.monsters_guessed}')
+            message_lines.append(f'<@{user_id}>: {monsters_guessed}')
         await self.channel.send(content="\n".join(message_lines), allowed_mentions=discord.AllowedMentions(users=False))
 
     def get_clues(self):
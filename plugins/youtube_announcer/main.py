@@ -2,10 +2,9 @@ import asyncio
 import datetime
 import time
 
-from googleapiclient.discovery import build
-
 from database.helper import gfd_database_helper
 from database.models import AnnouncedYoutubeVideo
+from helpers.plugin_metrics import plugin_metrics
 from logger import logger
 from plugins.base import BasePlugin
 
@@ -32,18 +31,20 @@ class YoutubeAnnouncer(BasePlugin):
         if self.channel is None or 'GOOGLE_API_KEY' not in self.config:
             return
 
+        from googleapiclient.discovery import build
         api_service_name = 'youtube'
         api_version = 'v3'
         dev_key = self.config['GOOGLE_API_KEY']
         self.youtube = build(api_service_name, api_version, developerKey=dev_key)
-        asyncio.get_event_loop().create_task(self.check_playlists_for_new_videos())
+        self.start_task(self.check_playlists_for_new_videos())
 
     async def check_playlists_for_new_videos(self):
         while True:
             try:
                 self.videos_encountered = self.videos_encountered[-100:]
-                for playlist_id in self.playlists_to_track:
-                    await self.check_playlist_for_new_videos(playlist_id)
+                with plugin_metrics.measure(self.__class__.__name__, 'run'):
+                    for playlist_id in self.playlists_to_track:
+                        await self.check_playlist_for_new_videos(playlist_id)
             except Exception as e:
                 logger.error(f'Failed to fetch yt videos due to error: {str(e)}')
             await asyncio.sleep(180)
@@ -66,9 +67,7 @@ class YoutubeAnnouncer(BasePlugin):
                 await self.post_video_to_channel(video_id, video)
 
     async def post_video_to_channel(self, video_id, video):
-        gfd_database_helper.replenish_db()
-        should_announce = AnnouncedYoutubeVideo.should_announce(video_id)
-        gfd_database_helper.release_db()
+        should_announce = await gfd_database_helper.run(AnnouncedYoutubeVideo.should_announce, video_id)
         if should_announce:
             logger.debug(f'Posting video {video["snippet"]["title"]}')
             # thumb_quality = list(video['snippet']['thumbnails'].keys())[-1]